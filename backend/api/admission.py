@@ -0,0 +1,122 @@
+"""
+Admission control for new remix jobs.
+
+Each admitted job records its estimated compute cost (worker seconds
+predicted by the cost model from past runs, or seconds of audio times the
+per-mode cost factor without history) in a Redis hash until the worker
+reaches a terminal state. A new job is checked against the broker queue depth, the
+client's job count and the client and global outstanding-work budgets. If
+a full render doesn't fit the budgets, it can be downgraded to a preview.
+Otherwise the request is rejected with 429 and a Retry-After estimate.
+The checks and the reservation run in one Redis transaction (WATCH on
+the hash), so concurrent requests can't both take the last slot. Stale
+entries (older than the job TTL) are pruned on admission, so a crashed
+worker can't leak capacity.
+"""
+import json
+import math
+import time
+from redis.exceptions import WatchError
+from starlette.concurrency import run_in_threadpool
+from backend.config import settings
+from backend.worker import JOB_TTL, ADMISSION_KEY
+from backend.api.job_store import async_redis
+from backend.pipeline.cost_model import cost_model, job_variant
+
+CELERY_QUEUE = "celery"
+
+class OverCapacity(Exception):
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+async def estimate_cost(info: dict, quality: str, preview: bool, mode: str) -> dict:
+    """Cost model prediction (worker seconds, peak MB) for a job over the audio described by `info`"""
+    return await run_in_threadpool(
+        cost_model.predict,
+        mode,
+        job_variant(mode, quality, preview),
+        info["duration"],
+        info["sample_rate"],
+        preview
+    )
+
+def _split_stale(entries: dict) -> tuple[dict, list]:
+    """Admission entries by job_id, and the job_ids of entries older than the job TTL"""
+    now = time.time()
+    live, stale = {}, []
+    for job_id, raw in entries.items():
+        entry = json.loads(raw)
+        if now - entry["admitted_at"] > JOB_TTL:
+            stale.append(job_id)
+        else:
+            live[job_id] = entry
+    return live, stale
+
+async def _worker_count() -> int:
+    return max(len([key async for key in async_redis.scan_iter("worker:*:mode")]), 1)
+
+async def admit(job_id: str, client: str, info: dict, quality: str, preview: bool, mode: str,
+                allow_downgrade: bool = True) -> tuple[dict, bool]:
+    """
+    Reserve capacity for a job or raise OverCapacity.
+
+    Returns the job's cost estimate and whether it was downgraded to a
+    preview to fit.
+    """
+    workers = await _worker_count()
+    estimate = await estimate_cost(info, quality, preview, mode)
+    can_downgrade = allow_downgrade and settings.admission_downgrade_to_preview and not preview
+    preview_estimate = await estimate_cost(info, quality, True, mode) if can_downgrade else None
+
+    def retry_after(excess: float) -> int:
+        return int(min(max(math.ceil(excess / workers), 5), 600))
+
+    # Check and reserve in one transaction: if another admission changes the
+    # hash between WATCH and EXEC, the checks are redone against the new state
+    async with async_redis.pipeline(transaction=True) as pipe:
+        while True:
+            try:
+                await pipe.watch(ADMISSION_KEY)
+                queue_depth = await pipe.llen(CELERY_QUEUE)
+                outstanding, stale = _split_stale(await pipe.hgetall(ADMISSION_KEY))
+
+                global_load = sum(entry["cost"] for entry in outstanding.values())
+                client_jobs = [entry for entry in outstanding.values() if entry["client"] == client]
+                client_load = sum(entry["cost"] for entry in client_jobs)
+
+                if queue_depth >= settings.admission_max_queue_depth:
+                    raise OverCapacity("Remix queue is full", retry_after(global_load))
+
+                if len(client_jobs) >= settings.admission_client_max_jobs:
+                    raise OverCapacity("Too many remixes in progress for this client", retry_after(client_load))
+
+                def overage(cost: float) -> float:
+                    return max(
+                        global_load + cost - settings.admission_max_outstanding_seconds,
+                        client_load + cost - settings.admission_client_max_outstanding_seconds,
+                        0.0
+                    )
+
+                admitted, downgraded = estimate, False
+                if overage(estimate["seconds"]) > 0:
+                    if preview_estimate is None or overage(preview_estimate["seconds"]) > 0:
+                        raise OverCapacity("Server is at capacity", retry_after(overage(estimate["seconds"])))
+                    admitted, downgraded = preview_estimate, True
+
+                pipe.multi()
+                if stale:
+                    pipe.hdel(ADMISSION_KEY, *stale)
+                pipe.hset(ADMISSION_KEY, job_id, json.dumps({
+                    "client": client,
+                    "cost": admitted["seconds"],
+                    "admitted_at": time.time()
+                }))
+                await pipe.execute()
+                return admitted, downgraded
+            except WatchError:
+                continue
+
+async def release(job_id: str):
+    await async_redis.hdel(ADMISSION_KEY, job_id)
@@ -0,0 +1,59 @@
+"""
+Async job-state access for the API process.
+
+Uses a pooled redis.asyncio client so status polling never blocks the event
+loop. Job records are Redis hashes written by backend.worker.
+"""
+import json
+import redis.asyncio as aioredis
+from backend.config import settings
+from backend.api.models import JobStatus
+from backend.registry import best_mode
+from backend.worker import JOB_TTL, STRUCTURE_PENDING_TTL, job_key, cancel_key, structure_key, encode_job_fields, decode_job
+from backend.storage.janitor import STATS_KEY
+
+async_pool = aioredis.ConnectionPool(
+    host=settings.redis_host,
+    port=settings.redis_port,
+    decode_responses=True,
+    max_connections=settings.redis_max_connections
+)
+
+async_redis = aioredis.Redis(connection_pool=async_pool)
+
+async def get_job_status(job_id: str) -> JobStatus | None:
+    return decode_job(job_id, await async_redis.hgetall(job_key(job_id)))
+
+async def get_job_statuses(job_ids: list[str]) -> dict:
+    """Look up many jobs in one round trip"""
+    async with async_redis.pipeline(transaction=False) as pipe:
+        for job_id in job_ids:
+            pipe.hgetall(job_key(job_id))
+        results = await pipe.execute()
+    return {job_id: decode_job(job_id, data) for job_id, data in zip(job_ids, results)}
+
+async def set_job_status(job_id: str, status: str, progress: int = None, result: dict = None, error: str = None, stage: str = None,
+                         estimate: dict = None):
+    async with async_redis.pipeline(transaction=False) as pipe:
+        pipe.hset(job_key(job_id), mapping=encode_job_fields(status, progress, stage, result, error, estimate))
+        pipe.expire(job_key(job_id), JOB_TTL)
+        await pipe.execute()
+
+async def request_cancel(job_id: str):
+    """Set the flag the worker polls between pipeline stages"""
+    await async_redis.setex(cancel_key(job_id), JOB_TTL, 1)
+
+async def claim_structure_analysis(input_key: str) -> bool:
+    """Mark an upload's structure analysis as in flight; False if one already is (or recently failed)"""
+    return bool(await async_redis.set(structure_key(input_key), "pending", nx=True, ex=STRUCTURE_PENDING_TTL))
+
+async def get_structure_state(input_key: str) -> str | None:
+    return await async_redis.get(structure_key(input_key))
+
+async def get_worker_mode() -> str:
+    modes = [await async_redis.get(key) async for key in async_redis.scan_iter("worker:*:mode")]
+    return best_mode(modes)
+
+async def get_usage_stats() -> dict:
+    data = await async_redis.get(STATS_KEY)
+    return json.loads(data) if data else {}
@@ -6,17 +6,40 @@ class RemixRequest(BaseModel):
     style: str
     energy: float = Field(default=1.0, ge=0.5, le=2.0)
     brightness: float = Field(default=1.0, ge=0.5, le=2.0)
+    quality: Optional[str] = None
+    preview: bool = False
+    seed: Optional[int] = None
+    output_format: Optional[str] = None
+    # Indices into the file's structure map (GET /structure/{file_id}); remixes only those sections
+    sections: Optional[list[int]] = Field(default=None, min_length=1)
+
+class MixRequest(BaseModel):
+    file_id: str
+    energy: float = Field(default=1.0, ge=0.5, le=2.0)
+    brightness: float = Field(default=1.0, ge=0.5, le=2.0)
+
+class PromoteRequest(BaseModel):
+    quality: Optional[str] = None
 
 class JobStatus(BaseModel):
     job_id: str
     status: str
     progress: int = 0
+    stage: Optional[str] = None
     result: Optional[dict] = None
     error: Optional[str] = None
+    estimated_seconds: Optional[float] = None
+    estimated_peak_mb: Optional[float] = None
+    eta_seconds: Optional[float] = None
+
+class BulkStatusRequest(BaseModel):
+    job_ids: list[str] = Field(max_length=500)
 
 class UploadResponse(BaseModel):
     file_id: str
     filename: str
     duration: float
+    duplicate: bool = False
+    recognized: bool = False
     message: str
 
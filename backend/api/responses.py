@@ -0,0 +1,77 @@
+import os
+from pathlib import Path
+from typing import Optional
+from fastapi import HTTPException
+from fastapi.responses import FileResponse, StreamingResponse
+
+CHUNK_SIZE = 64 * 1024
+
+def parse_range(range_header: str, file_size: int):
+    """
+    Parse a single `bytes=` range into inclusive (start, end) offsets.
+
+    Only the first range of a multi-range request is honored. Returns None
+    for headers that should be ignored (serve the whole file).
+    """
+    unit, _, ranges = range_header.partition("=")
+    if unit.strip().lower() != "bytes" or not ranges:
+        return None
+
+    first = ranges.split(",")[0].strip()
+    start_str, _, end_str = first.partition("-")
+
+    try:
+        if not start_str:
+            suffix = int(end_str)
+            if suffix == 0:
+                raise ValueError
+            start = max(file_size - suffix, 0)
+            end = file_size - 1
+        else:
+            start = int(start_str)
+            end = int(end_str) if end_str else file_size - 1
+            end = min(end, file_size - 1)
+    except ValueError:
+        raise HTTPException(status_code=416, detail="Invalid range", headers={"Content-Range": f"bytes */{file_size}"})
+
+    if start > end or start >= file_size:
+        raise HTTPException(status_code=416, detail="Range not satisfiable", headers={"Content-Range": f"bytes */{file_size}"})
+
+    return start, end
+
+def iter_file_range(path: Path, start: int, end: int):
+    with path.open("rb") as f:
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = f.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+def ranged_file_response(path: Path, media_type: str, filename: str, range_header: Optional[str]):
+    """FileResponse with byte-range support, so players can seek and resume"""
+    file_size = os.path.getsize(path)
+    byte_range = parse_range(range_header, file_size) if range_header else None
+
+    if byte_range is None:
+        return FileResponse(
+            path=path,
+            media_type=media_type,
+            filename=filename,
+            headers={"Accept-Ranges": "bytes"}
+        )
+
+    start, end = byte_range
+    return StreamingResponse(
+        iter_file_range(path, start, end),
+        status_code=206,
+        media_type=media_type,
+        headers={
+            "Accept-Ranges": "bytes",
+            "Content-Range": f"bytes {start}-{end}/{file_size}",
+            "Content-Length": str(end - start + 1),
+            "Content-Disposition": f'attachment; filename="{filename}"'
+        }
+    )
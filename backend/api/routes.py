@@ -1,13 +1,31 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, UploadFile, File, HTTPException, Header, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from pathlib import Path
+import json
+import subprocess
 import uuid
-import shutil
-from backend.api.models import RemixRequest, JobStatus, UploadResponse
+from typing import Optional
+from backend.api.models import RemixRequest, JobStatus, UploadResponse, PromoteRequest, MixRequest, BulkStatusRequest
+from backend.api.responses import ranged_file_response
+from backend.api import admission
 from backend.config import settings
-from backend.utils.audio import get_audio_info
-from backend.tasks import process_remix_task
-from backend.worker import get_job_status
+from backend.utils.audio import AUDIO_LIBS_AVAILABLE, get_audio_info
+from backend.utils.encoding import OUTPUT_FORMATS, negotiate_format, encode_rendition
+from backend.celery_client import send_remix_task, send_structure_task, revoke_remix_task
+from backend.api.job_store import (
+    get_job_status, get_job_statuses, set_job_status, request_cancel, get_worker_mode, get_usage_stats,
+    claim_structure_analysis, get_structure_state
+)
+from backend.pipeline.preview_cache import preview_key, load_preview
+from backend.pipeline.artifact_cache import artifact_cache
+from backend.pipeline.stem_mix import stem_gains
+from backend.pipeline.mix_engine import MixEngine
+from backend.pipeline.fingerprint import fingerprint_upload
+from backend.pipeline.sections import select_sections, crossfade_seconds
+from backend.registry import STYLE_PRESETS, describe_system
+from backend.storage.uploads import store_upload, resolve_upload, release_upload, UploadTooLarge
+from backend.storage.janitor import track_artifact, touch_artifact
 
 router = APIRouter()
 
@@ -20,63 +38,381 @@ async def upload_audio(file: UploadFile = File(...)):
     if file_ext not in settings.allowed_formats:
         raise HTTPException(status_code=400, detail=f"Format not supported. Allowed: {settings.allowed_formats}")
     
-    file_id = str(uuid.uuid4())
-    file_path = settings.upload_dir / f"{file_id}{file_ext}"
-    
-    with file_path.open("wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+    try:
+        file_id, file_path, duplicate = await run_in_threadpool(store_upload, file.file, file_ext)
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
     
     try:
-        info = get_audio_info(file_path)
+        info = await run_in_threadpool(get_audio_info, file_path)
     except Exception as e:
-        file_path.unlink()
+        await run_in_threadpool(release_upload, file_id)
         raise HTTPException(status_code=400, detail=f"Invalid audio file: {str(e)}")
     
+    match = await fingerprint_new_upload(file_path, info["duration"], duplicate)
+    
+    if duplicate:
+        message = "Upload successful (matched an existing file)"
+    elif match:
+        message = "Upload successful (recognized a previously processed recording)"
+    else:
+        message = "Upload successful"
+    
     return UploadResponse(
         file_id=file_id,
         filename=file.filename,
         duration=info["duration"],
-        message="Upload successful"
+        duplicate=duplicate,
+        recognized=match is not None,
+        message=message
     )
 
+async def fingerprint_new_upload(file_path: Path, duration: float, duplicate: bool):
+    """Fingerprint match for a stored upload, or None"""
+    # Byte-identical uploads already share caches; other encodings of a known recording are found by fingerprint
+    if duplicate:
+        return None
+    try:
+        return await run_in_threadpool(fingerprint_upload, file_path, duration)
+    except Exception as e:
+        print(f"Fingerprinting failed for {file_path.name}: {e}")
+        return None
+
+STREAM_SUBTYPES = {"f32": ("float32", "FLOAT"), "s16": ("int16", "PCM_16")}
+
+@router.websocket("/stream")
+async def stream_upload(websocket: WebSocket):
+    """
+    Upload raw PCM over a WebSocket and get analysis while it arrives.
+    
+    Multipart uploads are spooled completely before a handler runs, so
+    analysis could only start after the last byte. Here the client sends a
+    JSON start message ({"type": "start", "sample_rate", "channels",
+    "format": "f32" | "s16", "filename"}), then interleaved PCM in binary
+    messages, then {"type": "end"}. Each block is written to a WAV file and
+    fed to an IncrementalAnalyzer; interim estimates are sent every
+    stream_emit_interval_seconds of audio. On end the WAV is stored like an
+    upload, the final analysis is cached for the remix pipeline, and the
+    reply carries the file_id.
+    """
+    await websocket.accept()
+    if not AUDIO_LIBS_AVAILABLE:
+        await websocket.send_json({"type": "error", "detail": "Streaming analysis needs the audio libraries"})
+        await websocket.close()
+        return
+    
+    import numpy as np
+    import soundfile as sf
+    from backend.pipeline.analysis import IncrementalAnalyzer
+    
+    tmp_path = settings.upload_dir / f".streaming-{uuid.uuid4().hex}.wav"
+    writer = None
+    try:
+        start = await websocket.receive_json()
+        if start.get("type") != "start" or start.get("format", "f32") not in STREAM_SUBTYPES:
+            raise ValueError(f"Expected a start message with format one of {list(STREAM_SUBTYPES)}")
+        sr = int(start["sample_rate"])
+        channels = int(start.get("channels", 1))
+        if not 8000 <= sr <= 192000 or channels not in (1, 2):
+            raise ValueError("Unsupported sample rate or channel count")
+        dtype, subtype = STREAM_SUBTYPES[start.get("format", "f32")]
+        frame_bytes = np.dtype(dtype).itemsize * channels
+        
+        analyzer = IncrementalAnalyzer(sr)
+        writer = sf.SoundFile(tmp_path, "w", samplerate=sr, channels=channels, subtype=subtype)
+        received = 0
+        pending = b""
+        next_emit = settings.stream_emit_interval_seconds
+        
+        def consume(data: bytes):
+            pcm = np.frombuffer(data, dtype=dtype).reshape(-1, channels)
+            writer.write(pcm)
+            audio = pcm.astype(np.float32) / 32768.0 if dtype == "int16" else pcm
+            analyzer.feed(audio.T)
+        
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(message.get("code", 1000))
+            if message.get("text") is not None:
+                if json.loads(message["text"]).get("type") == "end":
+                    break
+                continue
+            
+            received += len(message["bytes"])
+            if received > settings.max_file_size:
+                raise ValueError(f"Stream exceeds {settings.max_file_size} bytes")
+            
+            # Binary messages needn't end on a frame boundary
+            data = pending + message["bytes"]
+            usable = len(data) - len(data) % frame_bytes
+            pending = data[usable:]
+            await run_in_threadpool(consume, data[:usable])
+            
+            if analyzer.duration >= next_emit:
+                await websocket.send_json({"type": "analysis", **await run_in_threadpool(analyzer.snapshot)})
+                next_emit = analyzer.duration + settings.stream_emit_interval_seconds
+        
+        writer.close()
+        if analyzer.duration == 0:
+            raise ValueError("No audio received")
+        
+        with tmp_path.open("rb") as f:
+            file_id, file_path, duplicate = await run_in_threadpool(store_upload, f, ".wav")
+        analysis = await run_in_threadpool(analyzer.finalize, file_path.stem)
+        cached = await run_in_threadpool(artifact_cache.load_analysis, file_path.stem)
+        if cached is None or "sections" not in cached:
+            await run_in_threadpool(artifact_cache.save_analysis, file_path.stem, analysis)
+        match = await fingerprint_new_upload(file_path, analyzer.duration, duplicate)
+        
+        await websocket.send_json({
+            "type": "complete",
+            "file_id": file_id,
+            "filename": start.get("filename") or "stream.wav",
+            "duration": analyzer.duration,
+            "duplicate": duplicate,
+            "recognized": match is not None,
+            "analysis": analysis
+        })
+        await websocket.close()
+    except WebSocketDisconnect:
+        pass
+    except (ValueError, KeyError, TypeError, UploadTooLarge) as e:
+        await websocket.send_json({"type": "error", "detail": str(e)})
+        await websocket.close(code=1003)
+    finally:
+        if writer is not None and not writer.closed:
+            writer.close()
+        tmp_path.unlink(missing_ok=True)
+
+async def admit_job(job_id: str, client_request: Request, file_path: Path, quality: Optional[str], preview: bool,
+                    allow_downgrade: bool = True, duration: float = None) -> tuple[dict, bool]:
+    """
+    Reserve capacity for a new job and return (cost estimate, downgraded).
+
+    `duration` overrides the input's for jobs that process only part of it.
+    Raises 429 with Retry-After when over capacity.
+    """
+    # Not a client-supplied header, which could be rotated to get around the per-client limits
+    client = client_request.client.host
+    info = await run_in_threadpool(get_audio_info, file_path)
+    if duration is not None:
+        info = dict(info, duration=duration)
+    try:
+        return await admission.admit(job_id, client, info, quality, preview, await get_worker_mode(), allow_downgrade)
+    except admission.OverCapacity as e:
+        raise HTTPException(status_code=429, detail=e.reason, headers={"Retry-After": str(e.retry_after)})
+
 @router.post("/remix", response_model=JobStatus)
-async def create_remix(request: RemixRequest):
-    file_path = None
-    for ext in settings.allowed_formats:
-        candidate = settings.upload_dir / f"{request.file_id}{ext}"
-        if candidate.exists():
-            file_path = candidate
-            break
+async def create_remix(request: RemixRequest, client_request: Request):
+    file_path = await run_in_threadpool(resolve_upload, request.file_id)
     
     if not file_path:
         raise HTTPException(status_code=404, detail="File not found")
     
+    if request.quality and request.quality not in settings.musicgen_quality_tiers:
+        raise HTTPException(status_code=400, detail=f"Unknown quality tier. Available: {list(settings.musicgen_quality_tiers)}")
+    
+    if request.output_format and request.output_format not in OUTPUT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unknown output format. Available: {list(OUTPUT_FORMATS)}")
+    
+    spans = None
+    if request.sections:
+        if request.preview:
+            raise HTTPException(status_code=400, detail="Sections can't be combined with a preview")
+        analysis = await run_in_threadpool(artifact_cache.load_analysis, file_path.stem)
+        if analysis is None or "sections" not in analysis:
+            raise HTTPException(status_code=409, detail=f"No structure map for this file yet. Poll GET /structure/{request.file_id} until it returns the sections")
+        try:
+            spans = select_sections(analysis, request.sections, min_gap=crossfade_seconds(analysis))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    
     job_id = str(uuid.uuid4())
     
-    task = process_remix_task.delay(
+    key = None
+    if request.preview:
+        key = preview_key(file_path.stem, request.style, request.energy, request.brightness, request.quality, request.seed)
+        cached = load_preview(key)
+        if cached:
+            await set_job_status(job_id, "completed", 100, result=cached, stage="Preview ready")
+            return JobStatus(job_id=job_id, status="completed", progress=100, stage="Preview ready", result=cached)
+    
+    preview = request.preview
+    stage = "Waiting for a worker"
+    estimate, downgraded = await admit_job(
+        job_id, client_request, file_path, request.quality, preview,
+        allow_downgrade=spans is None,
+        duration=sum(end - start for start, end in spans) if spans else None
+    )
+    if downgraded:
+        preview = True
+        key = preview_key(file_path.stem, request.style, request.energy, request.brightness, request.quality, request.seed)
+        stage = "Server busy: rendering a preview instead (promote it once it's ready)"
+    
+    await set_job_status(job_id, "queued", 0, stage=stage, estimate=estimate)
+    
+    send_remix_task(
         job_id=job_id,
         audio_path=str(file_path),
         style=request.style,
         energy=request.energy,
-        brightness=request.brightness
+        brightness=request.brightness,
+        quality=request.quality,
+        preview=preview,
+        seed=request.seed,
+        preview_key=key,
+        output_format=request.output_format,
+        sections=spans
     )
     
-    return JobStatus(
-        job_id=job_id,
-        status="processing",
-        progress=0
+    return await get_job_status(job_id)
+
+@router.get("/structure/{file_id}")
+async def get_structure(file_id: str):
+    """
+    Sections of an uploaded track, for choosing which ones to remix.
+
+    The first request queues the analysis on a worker and returns 202 with
+    Retry-After until the structure map is cached; the analysis is reused by
+    the file's remixes.
+    """
+    file_path = await run_in_threadpool(resolve_upload, file_id)
+    if not file_path:
+        raise HTTPException(status_code=404, detail="File not found")
+    
+    analysis = await run_in_threadpool(artifact_cache.load_analysis, file_path.stem)
+    if analysis is None or "sections" not in analysis:
+        # One analysis per upload content, however many clients poll for it
+        if await claim_structure_analysis(file_path.stem):
+            await run_in_threadpool(send_structure_task, file_path.stem, str(file_path))
+        else:
+            state = await get_structure_state(file_path.stem)
+            if state and state.startswith("failed"):
+                raise HTTPException(status_code=422, detail=f"Structure analysis {state}")
+        return JSONResponse(
+            status_code=202,
+            content={"file_id": file_id, "status": "analyzing"},
+            headers={"Retry-After": str(settings.structure_poll_seconds)}
+        )
+    
+    return {
+        "file_id": file_id,
+        "duration": analysis["duration"],
+        "tempo": analysis["tempo"],
+        "sections": analysis["sections"]
+    }
+
+@router.delete("/remix/{job_id}", response_model=JobStatus)
+async def cancel_remix(job_id: str):
+    """
+    Cancel a queued or running remix.
+
+    Queued jobs are revoked before a worker picks them up; running jobs stop
+    at the pipeline's next cancellation check and report status "cancelled".
+    """
+    status = await get_job_status(job_id)
+    
+    if not status:
+        raise HTTPException(status_code=404, detail="Job not found")
+    
+    if status.status in ("completed", "failed", "cancelled"):
+        raise HTTPException(status_code=409, detail=f"Job already {status.status}")
+    
+    await request_cancel(job_id)
+    await run_in_threadpool(revoke_remix_task, job_id)
+    
+    if status.status == "queued":
+        await set_job_status(job_id, "cancelled", stage="Cancelled")
+        await admission.release(job_id)
+    else:
+        await set_job_status(job_id, status.status, stage="Cancelling")
+    
+    return await get_job_status(job_id)
+
+@router.post("/remix/{job_id}/promote", response_model=JobStatus)
+async def promote_preview(job_id: str, client_request: Request, request: Optional[PromoteRequest] = None):
+    status = await get_job_status(job_id)
+    
+    if not status:
+        raise HTTPException(status_code=404, detail="Job not found")
+    
+    if status.status != "completed" or not status.result or not status.result.get("preview"):
+        raise HTTPException(status_code=400, detail="Only completed previews can be promoted")
+    
+    quality = request.quality if request else None
+    if quality and quality not in settings.musicgen_quality_tiers:
+        raise HTTPException(status_code=400, detail=f"Unknown quality tier. Available: {list(settings.musicgen_quality_tiers)}")
+    
+    params = status.result["request"]
+    if not Path(params["audio_path"]).exists():
+        raise HTTPException(status_code=404, detail="File not found")
+    
+    full_job_id = str(uuid.uuid4())
+    
+    estimate, _ = await admit_job(full_job_id, client_request, Path(params["audio_path"]), quality, preview=False, allow_downgrade=False)
+    
+    await set_job_status(full_job_id, "queued", 0, stage="Waiting for a worker", estimate=estimate)
+    
+    send_remix_task(
+        job_id=full_job_id,
+        audio_path=params["audio_path"],
+        style=params["style"],
+        energy=params["energy"],
+        brightness=params["brightness"],
+        quality=quality,
+        seed=status.result.get("seed")
+    )
+    
+    return await get_job_status(full_job_id)
+
+@router.post("/mix")
+def remix_cached_stems(request: MixRequest):
+    """
+    Re-mix an existing full separation with new energy/brightness gains.
+
+    Runs in the API process from memory-mapped stems through the block-wise
+    mix engine and streams the WAV back directly, without going through the
+    task queue.
+    """
+    file_path = resolve_upload(request.file_id)
+    if not file_path:
+        raise HTTPException(status_code=404, detail="File not found")
+    
+    stems = artifact_cache.load_stems(artifact_cache.stems_key(file_path.stem))
+    if stems is None:
+        raise HTTPException(status_code=404, detail="No cached separation for this file. Run a remix first")
+    
+    return StreamingResponse(
+        # A sampled loudness estimate keeps this close to a single pass
+        MixEngine(44100).iter_wav(
+            stems, stem_gains(request.energy, request.brightness), sidechain="vocals",
+            measure_stride=settings.mix_instant_measure_stride
+        ),
+        media_type="audio/wav",
+        headers={"Content-Disposition": f'inline; filename="mix_{request.file_id}.wav"'}
     )
 
 @router.get("/status/{job_id}", response_model=JobStatus)
 async def check_status(job_id: str):
-    status = get_job_status(job_id)
+    status = await get_job_status(job_id)
     if not status:
         raise HTTPException(status_code=404, detail="Job not found")
     return status
 
+@router.post("/status/bulk")
+async def check_statuses(request: BulkStatusRequest):
+    """Status of several jobs in one Redis round trip; unknown jobs map to null"""
+    return {"jobs": await get_job_statuses(request.job_ids)}
+
 @router.get("/download/{job_id}")
-async def download_remix(job_id: str):
-    status = get_job_status(job_id)
+async def download_remix(
+    job_id: str,
+    format: Optional[str] = None,
+    accept: Optional[str] = Header(default=None),
+    range: Optional[str] = Header(default=None)
+):
+    status = await get_job_status(job_id)
     
     if not status:
         raise HTTPException(status_code=404, detail="Job not found")
@@ -92,76 +428,37 @@ async def download_remix(job_id: str):
     if not output_path.exists():
         raise HTTPException(status_code=404, detail="Output file missing")
     
-    return FileResponse(
-        path=output_path,
-        media_type="audio/wav",
-        filename=f"remix_{job_id}.wav"
+    requested_formats = list(status.result.get("renditions", {}))
+    fmt = negotiate_format(format, accept, default=requested_formats[0] if requested_formats else "wav",
+                           available=["wav", *requested_formats])
+    if fmt is None:
+        raise HTTPException(status_code=400, detail=f"Unknown output format. Available: {list(OUTPUT_FORMATS)}")
+    
+    if fmt != "wav":
+        try:
+            output_path = await run_in_threadpool(encode_rendition, output_path, fmt)
+        except (subprocess.CalledProcessError, OSError) as e:
+            print(f"Encoding {fmt} for job {job_id} failed: {e}")
+            raise HTTPException(status_code=503, detail=f"Couldn't encode {fmt} right now; download ?format=wav instead")
+        track_artifact(output_path, job_id)
+    
+    touch_artifact(output_path)
+    
+    return ranged_file_response(
+        output_path,
+        media_type=OUTPUT_FORMATS[fmt]["media_type"],
+        filename=f"remix_{job_id}{OUTPUT_FORMATS[fmt]['extension']}",
+        range_header=range
     )
 
+@router.get("/storage")
+async def get_storage_usage():
+    return {"usage": await get_usage_stats()}
+
 @router.get("/styles")
 async def get_styles():
-    try:
-        from backend.pipeline.processor import STYLE_PRESETS
-    except ImportError:
-        from backend.pipeline.mock_pipeline import STYLE_PRESETS
     return {"styles": list(STYLE_PRESETS.keys())}
 
 @router.get("/system")
 async def get_system_info():
-    try:
-        from backend.pipeline.processor_full import RemixProcessor
-        mode = "full"
-    except ImportError:
-        try:
-            from backend.pipeline.processor_hybrid import HybridRemixProcessor
-            mode = "hybrid"
-        except ImportError:
-            mode = "mock"
-    
-    demucs_status = "active" if mode in ["full", "hybrid"] else "mock"
-    librosa_status = "active" if mode in ["full", "hybrid"] else "mock"
-    musicgen_status = "active (via Transformers)" if mode == "full" else "unavailable" if mode == "hybrid" else "mock"
-    
-    return {
-        "platform": "Neural Remix Engine (NRX)",
-        "version": "1.0.0",
-        "mode": mode,
-        "description": "Multi-model AI platform for intelligent music transformation",
-        "ai_subsystems": {
-            "input_processing": {
-                "model": "Demucs v4 (htdemucs)",
-                "purpose": "Source separation - isolates vocals, drums, bass, other",
-                "status": demucs_status
-            },
-            "analysis_engine": {
-                "model": "Librosa v0.11",
-                "purpose": "Musical analysis - tempo, key, chords, spectral features",
-                "status": librosa_status
-            },
-            "generation_engine": {
-                "model": "MusicGen Melody (Meta AudioCraft)",
-                "purpose": "Audio-conditional generation - transforms style while preserving structure",
-                "status": musicgen_status
-            },
-            "post_processing": {
-                "model": "Custom mixing pipeline",
-                "purpose": "Stem blending, vocal preservation, normalization",
-                "status": "active"
-            },
-            "style_mapping": {
-                "model": "Rule-based presets (future: CLAP/MERT)",
-                "purpose": "Maps text descriptions to musical parameters",
-                "status": "active"
-            }
-        },
-        "capabilities": [
-            "Preserves original song identity",
-            "Transforms genre/style intelligently" if mode == "full" else "Adjusts stem levels intelligently",
-            "Maintains vocal characteristics",
-            "Adapts tempo and key awareness",
-            "Per-stem processing and mixing"
-        ],
-        "distinction": "NRX is a platform orchestrating multiple AI models, not a single model wrapper",
-        "note": "Running in FULL mode: All AI models active! MusicGen via Transformers (no xformers needed)" if mode == "full" else "Running in hybrid mode: Demucs + Librosa working. MusicGen unavailable" if mode == "hybrid" else None
-    }
-
+    return describe_system(await get_worker_mode())
@@ -0,0 +1,222 @@
+"""
+Remix a whole catalog locally, without the API, Redis or Celery.
+
+Inputs are a directory (searched recursively for allowed formats) or a
+manifest file with one path per line. Every input is remixed into every
+requested style on a local process pool. Each worker process loads the
+pipeline once and keeps its models warm. All styles of one file run in the
+same worker, so analysis and stems are computed once and then reused from
+the artifact cache.
+
+Outputs go to {output_dir}/{file}-{hash}/{style}.{ext}. A JSON and a CSV report
+with per-file timings are rewritten after every file. Re-running with the
+same output directory skips remixes that already completed.
+
+Usage:
+    python -m backend.batch ~/catalog --styles lofi_chill jazz --workers 2
+    python -m backend.batch manifest.txt --styles edm --quality fast --format mp3
+"""
+import argparse
+import csv
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from backend.config import settings
+from backend.registry import STYLE_PRESETS
+from backend.utils.encoding import OUTPUT_FORMATS, encode_rendition
+
+REPORT_FIELDS = ["input", "style", "status", "output_path", "seconds", "model_variant", "seed", "error"]
+
+_processor = None
+
+def collect_inputs(source: Path) -> list[Path]:
+    if source.is_dir():
+        return sorted(p for p in source.rglob("*") if p.suffix.lower() in settings.allowed_formats)
+
+    paths = []
+    for line in source.read_text().splitlines():
+        line = line.strip()
+        if line and not line.startswith("#"):
+            path = Path(line).expanduser()
+            paths.append(path if path.is_absolute() else source.parent / path)
+    return paths
+
+def content_link(path: Path) -> Path:
+    """
+    Content-addressed alias for an input file.
+
+    Caches are keyed by file stem, so catalog files are linked under their
+    sha256 like API uploads are; this also shares caches with the API.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(1024 * 1024):
+            digest.update(chunk)
+
+    link = settings.cache_dir / "batch" / f"{digest.hexdigest()}{path.suffix.lower()}"
+    link.parent.mkdir(parents=True, exist_ok=True)
+    if link.is_symlink():
+        os.utime(link, follow_symlinks=False)
+    else:
+        tmp_link = link.with_name(f"{link.name}.{os.getpid()}.tmp")
+        tmp_link.unlink(missing_ok=True)
+        tmp_link.symlink_to(path.resolve())
+        tmp_link.replace(link)
+    return link
+
+def _init_worker(threads: int):
+    """Load the pipeline once per worker process"""
+    global _processor
+    from backend.pipeline.loader import load_remix_processor
+
+    if threads and not settings.torch_num_threads:
+        settings.torch_num_threads = threads
+        try:
+            import torch
+            torch.set_num_threads(threads)
+        except ImportError:
+            pass
+
+    processor_class, mode = load_remix_processor()
+    print(f"[{os.getpid()}] Batch worker ready ({mode} pipeline)")
+    _processor = processor_class()
+
+def remix_file(input_path: str, styles: list[str], output_dir: str, options: dict) -> list[dict]:
+    """Remix one input into each style; runs inside a pool worker"""
+    source = Path(input_path)
+    audio_path = content_link(source)
+    rows = []
+
+    for style in styles:
+        output_path = Path(output_dir) / f"{source.stem}-{audio_path.stem[:8]}" / f"{style}.wav"
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        start = time.perf_counter()
+        row = {"input": input_path, "style": style}
+
+        try:
+            result = _processor.process(
+                audio_path=audio_path,
+                style=style,
+                energy=options["energy"],
+                brightness=options["brightness"],
+                quality=options["quality"],
+                seed=options["seed"],
+                output_path=output_path
+            )
+            if options["format"] != "wav":
+                rendition = encode_rendition(output_path, options["format"])
+                output_path.unlink()
+                result["output_path"] = str(rendition)
+
+            row.update(
+                status="completed",
+                output_path=result["output_path"],
+                model_variant=result.get("model_variant"),
+                seed=result.get("seed")
+            )
+        except Exception as e:
+            row.update(status="failed", error=str(e))
+
+        row["seconds"] = round(time.perf_counter() - start, 2)
+        print(f"[{os.getpid()}] {source.name} → {style}: {row['status']} in {row['seconds']}s")
+        rows.append(row)
+
+    return rows
+
+def load_report(report_path: Path) -> dict:
+    if not report_path.exists():
+        return {}
+    return {(row["input"], row["style"]): row for row in json.loads(report_path.read_text())["results"]}
+
+def write_report(report_path: Path, rows: dict, started_at: float):
+    results = sorted(rows.values(), key=lambda row: (row["input"], row["style"]))
+    completed = [row for row in results if row["status"] == "completed"]
+
+    report = {
+        "started_at": started_at,
+        "updated_at": time.time(),
+        "total": len(results),
+        "completed": len(completed),
+        "failed": len(results) - len(completed),
+        "processing_seconds": round(sum(row.get("seconds") or 0 for row in results), 2),
+        "results": results
+    }
+
+    tmp_path = report_path.with_suffix(".tmp")
+    tmp_path.write_text(json.dumps(report, indent=2))
+    tmp_path.replace(report_path)
+
+    with open(report_path.with_suffix(".csv"), "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=REPORT_FIELDS, extrasaction="ignore")
+        writer.writeheader()
+        writer.writerows(results)
+
+def main():
+    parser = argparse.ArgumentParser(description="Remix a catalog of audio files locally")
+    parser.add_argument("source", type=Path, help="Directory of audio files or manifest with one path per line")
+    parser.add_argument("--styles", nargs="+", required=True, choices=list(STYLE_PRESETS))
+    parser.add_argument("--output-dir", type=Path, default=settings.output_dir / "batch")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--energy", type=float, default=1.0)
+    parser.add_argument("--brightness", type=float, default=1.0)
+    parser.add_argument("--quality", choices=list(settings.musicgen_quality_tiers), default=None)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--format", choices=list(OUTPUT_FORMATS), default="wav")
+    parser.add_argument("--no-resume", action="store_true", help="Redo remixes that already completed")
+    args = parser.parse_args()
+
+    inputs = collect_inputs(args.source)
+    args.output_dir.mkdir(parents=True, exist_ok=True)
+    report_path = args.output_dir / "report.json"
+
+    rows = {} if args.no_resume else load_report(report_path)
+    done = {
+        key for key, row in rows.items()
+        if row["status"] == "completed" and Path(row["output_path"]).exists()
+    }
+
+    pending = {}
+    for path in inputs:
+        styles = [style for style in args.styles if (str(path), style) not in done]
+        if styles:
+            pending[str(path)] = styles
+
+    print(f"{len(inputs)} inputs × {len(args.styles)} styles; {sum(map(len, pending.values()))} remixes pending")
+    if not pending:
+        return
+
+    options = {
+        "energy": args.energy,
+        "brightness": args.brightness,
+        "quality": args.quality,
+        "seed": args.seed,
+        "format": args.format
+    }
+    threads = max(1, (os.cpu_count() or 1) // args.workers)
+    started_at = time.time()
+
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker, initargs=(threads,)) as pool:
+        futures = {
+            pool.submit(remix_file, path, styles, str(args.output_dir), options): path
+            for path, styles in pending.items()
+        }
+        for future in as_completed(futures):
+            try:
+                file_rows = future.result()
+            except Exception as e:
+                file_rows = [
+                    {"input": futures[future], "style": style, "status": "failed", "error": str(e)}
+                    for style in pending[futures[future]]
+                ]
+            for row in file_rows:
+                rows[(row["input"], row["style"])] = row
+            write_report(report_path, rows, started_at)
+
+    completed = sum(1 for row in rows.values() if row["status"] == "completed")
+    print(f"Done: {completed}/{len(rows)} remixes completed. Report: {report_path}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Compare whole-file decoding with the block-streaming decoder.
+
+A synthetic 48 kHz stereo FLAC is analyzed at 44.1 kHz and its loudness is
+measured, once with the signal decoded and resampled in full (the previous
+load_audio and librosa feature calls) and once from stream_audio blocks.
+For each path the script reports wall time and peak traced allocation.
+Separation decodes the same way but needs torch and Demucs, so it isn't
+included.
+
+Usage:
+    python -m backend.benchmarks.decoding --durations 60 300 600
+"""
+import argparse
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+import numpy as np
+import soundfile as sf
+import librosa
+from backend.pipeline.analysis import MusicAnalyzer
+from backend.pipeline.mix_engine import LoudnessMeter, measure_file
+from backend.utils.audio import stream_audio
+from backend.utils.resample import resample
+
+SOURCE_SR = 48000
+SR = 44100
+
+def make_track(path: Path, duration: float):
+    rng = np.random.default_rng(0)
+    n = int(duration * SOURCE_SR)
+    t = np.arange(n, dtype=np.float32) / SOURCE_SR
+    pulse = (np.sin(2 * np.pi * 2 * t) > 0.9).astype(np.float32)
+    tone = np.sin(2 * np.pi * 220 * t) * 0.2 + pulse * rng.standard_normal(n, dtype=np.float32) * 0.1
+    sf.write(path, np.stack([tone, tone * 0.8]).T, SOURCE_SR, subtype="PCM_16")
+
+def load_whole(path: Path, sr: int = None, mono: bool = False) -> np.ndarray:
+    audio, orig_sr = sf.read(str(path), dtype="float32", always_2d=True)
+    audio = audio.T.mean(axis=0) if mono else audio.T
+    return resample(audio, orig_sr, sr or orig_sr)
+
+def analyze_whole(path: Path):
+    y = load_whole(path, SR, mono=True)
+    librosa.beat.beat_track(y=y, sr=SR)
+    librosa.feature.chroma_cqt(y=y, sr=SR, hop_length=512)
+    librosa.feature.spectral_centroid(y=y, sr=SR)
+    librosa.feature.rms(y=y)
+
+def measure_whole(path: Path):
+    audio = load_whole(path)
+    meter = LoudnessMeter(SOURCE_SR, audio.shape[0])
+    meter.add(audio)
+    return meter.integrated()
+
+def timed(fn):
+    tracemalloc.start()
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak / 1024 ** 2
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--durations", type=float, nargs="+", default=[60.0, 300.0, 600.0])
+    args = parser.parse_args()
+
+    print(f"{'duration':>9}  {'path':<22}{'seconds':>9}{'peak MB':>10}")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "track.flac"
+        # Warm up numba and lazy imports so they don't count against the first run
+        make_track(path, 10.0)
+        analyze_whole(path)
+        MusicAnalyzer().analyze(path)
+
+        for duration in args.durations:
+            make_track(path, duration)
+            cases = {
+                "decode (whole)": lambda: load_whole(path, SR),
+                "decode (stream)": lambda: sum(block.shape[-1] for block in stream_audio(path, sr=SR)),
+                "analysis (whole)": lambda: analyze_whole(path),
+                "analysis (stream)": lambda: MusicAnalyzer().analyze(path),
+                "loudness (whole)": lambda: measure_whole(path),
+                "loudness (stream)": lambda: measure_file(path),
+            }
+            for label, run in cases.items():
+                elapsed, peak_mb = timed(run)
+                print(f"{duration:>8.0f}s  {label:<22}{elapsed:>9.2f}{peak_mb:>10.1f}")
+
+if __name__ == "__main__":
+    main()
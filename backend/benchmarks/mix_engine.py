@@ -0,0 +1,103 @@
+"""
+Compare the block-wise mix engine with the previous whole-array mixing.
+
+Synthetic stems are written to disk and memory-mapped, as the artifact
+cache serves them. Both paths mix and write a WAV file. The old path is
+mix_stems + normalize_audio + a whole-array write for the hybrid pipeline, and the
+former _blend_with_vocals for the full pipeline. The instant rows stream
+the /api/mix WAV with a full and a sampled loudness measurement
+(MIX_INSTANT_MEASURE_STRIDE). For each path the script
+reports wall time, peak traced allocation, output loudness and true-sample
+peak.
+
+Usage:
+    python -m backend.benchmarks.mix_engine --durations 30 180 600
+"""
+import argparse
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+import numpy as np
+import soundfile as sf
+from backend.config import settings
+from backend.pipeline.mix_engine import MixEngine, measure_file
+from backend.pipeline.stem_mix import STEM_NAMES, mix_stems, stem_gains
+from backend.utils.audio import normalize_audio
+
+SR = 44100
+
+def make_stems(root: Path, duration: float) -> dict:
+    rng = np.random.default_rng(0)
+    n = int(duration * SR)
+    t = np.arange(n, dtype=np.float32) / SR
+    stems = {}
+    for i, name in enumerate(STEM_NAMES):
+        tone = np.sin(2 * np.pi * 110 * (i + 1) * t) * 0.3
+        if name == "vocals":
+            tone *= np.sin(2 * np.pi * 0.2 * t) > 0
+        stem = np.stack([tone, tone]) + rng.standard_normal((2, n), dtype=np.float32) * 0.02
+        np.save(root / f"{name}.npy", stem.astype(np.float32))
+        stems[name] = np.load(root / f"{name}.npy", mmap_mode="r")
+    return stems
+
+def legacy_blend(remix: np.ndarray, vocals: np.ndarray, blend_ratio: float = 0.65) -> np.ndarray:
+    """The full pipeline's previous _blend_with_vocals"""
+    min_length = min(remix.shape[-1], vocals.shape[-1])
+    blended = np.zeros_like(remix)
+    blended[..., :min_length] = remix[..., :min_length] * blend_ratio + vocals[..., :min_length] * (1 - blend_ratio)
+    if min_length < remix.shape[-1]:
+        blended[..., min_length:] = remix[..., min_length:]
+    return blended
+
+def timed(fn):
+    tracemalloc.start()
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak / 1024 ** 2
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--durations", type=float, nargs="+", default=[30.0, 180.0, 600.0])
+    args = parser.parse_args()
+
+    gains = stem_gains(1.0, 1.0)
+    engine = MixEngine(SR)
+    # Warm up lazy imports so they don't count against the first run
+    engine.measure({"vocals": np.zeros((2, SR), dtype=np.float32)}, {})
+
+    print(f"{'duration':>9}  {'path':<22}{'seconds':>9}{'peak MB':>10}{'LUFS':>8}{'peak':>7}")
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)
+        for duration in args.durations:
+            stems = make_stems(root, duration)
+            instrumental = np.asarray(stems["other"])
+            vocals = np.asarray(stems["vocals"])
+
+            cases = {
+                "hybrid (old)": lambda out: sf.write(out, normalize_audio(mix_stems(stems)).T, SR),
+                "hybrid (engine)": lambda out: engine.render_to_file(out, stems, gains, sidechain="vocals"),
+                "instant (measured)": lambda out: out.write_bytes(
+                    b"".join(engine.iter_wav(stems, gains, sidechain="vocals"))
+                ),
+                "instant (sampled)": lambda out: out.write_bytes(b"".join(engine.iter_wav(
+                    stems, gains, sidechain="vocals", measure_stride=settings.mix_instant_measure_stride
+                ))),
+                "full (old)": lambda out: sf.write(out, normalize_audio(legacy_blend(instrumental, vocals)).T, SR),
+                "full (engine)": lambda out: engine.render_to_file(
+                    out, {"instrumental": instrumental, "vocals": vocals},
+                    {"instrumental": 0.65, "vocals": 0.35}, sidechain="vocals"
+                ),
+            }
+
+            for label, render in cases.items():
+                out = root / "out.wav"
+                elapsed, peak_mb = timed(lambda: render(out))
+                lufs, peak = measure_file(out)
+                print(f"{duration:>8.0f}s  {label:<22}{elapsed:>9.2f}{peak_mb:>10.1f}{lufs:>8.1f}{peak:>7.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+"""
+Measure cold-start import time and peak RSS of the API and worker processes.
+
+Each entry point is imported in a fresh interpreter so nothing is shared.
+
+Usage:
+    python -m backend.benchmarks.startup
+"""
+import subprocess
+import sys
+
+ENTRY_POINTS = {
+    "api": "backend.main",
+    "worker": "backend.tasks",
+}
+
+PROBE = """
+import resource, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+"""
+
+def measure(module: str, runs: int = 3):
+    timings = []
+    peak_kb = 0
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, "-c", PROBE.format(module=module)],
+            capture_output=True,
+            text=True,
+            check=True
+        ).stdout.split()
+        timings.append(float(output[0]))
+        peak_kb = max(peak_kb, int(output[1]))
+    return min(timings), peak_kb / 1024
+
+def main():
+    print(f"{'process':<10}{'module':<16}{'import s':>10}{'peak RSS MB':>14}")
+    for name, module in ENTRY_POINTS.items():
+        seconds, rss_mb = measure(module)
+        print(f"{name:<10}{module:<16}{seconds:>10.2f}{rss_mb:>14.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Compare pool memory with per-process model loading and a preloaded parent.
+
+The script forks a pool of processes twice, the way Celery's prefork pool
+does. First each process loads the remix processor itself (the default).
+Then the parent preloads it with shared_models.preload() before forking
+(WORKER_PRELOAD_MODELS). Each process reads every weight, as inference
+would, and all of them are measured while alive together, so shared pages
+split between them in PSS. Totals are parent plus pool PSS. Needs Linux
+(/proc/<pid>/smaps_rollup).
+
+Without torch the loader falls back to the mock processor, which has no
+weights, so a numpy array of --synthetic-mb stands in for them.
+
+Usage:
+    python -m backend.benchmarks.worker_memory --concurrency 4
+"""
+import argparse
+import gc
+import multiprocessing
+import numpy as np
+from backend.pipeline import shared_models
+from backend.pipeline.loader import load_remix_processor
+
+def load_models(processor_class, mode: str, synthetic_mb: int, preload: bool):
+    if mode == "mock":
+        return np.ones(synthetic_mb * 1024 ** 2 // 8)
+    if preload:
+        return shared_models.preload(processor_class, mode)
+    processor = processor_class()
+    if mode == "full":
+        from backend.pipeline.model_registry import model_registry
+        model_registry.get()
+    return processor
+
+def touch(models) -> float:
+    """Read every weight once"""
+    if isinstance(models, np.ndarray):
+        return float(models.sum())
+    import torch
+    modules = [obj for obj in gc.get_objects() if isinstance(obj, torch.nn.Module)]
+    with torch.no_grad():
+        return sum(float(p.sum()) for module in modules for p in module.parameters(recurse=False))
+
+def pool_process(models, loader_args, barrier, results):
+    if models is None:
+        models = load_models(*loader_args, preload=False)
+    else:
+        shared_models.after_fork()
+    touch(models)
+    barrier.wait()
+    results.put(shared_models.memory_usage())
+    barrier.wait()
+
+def run_pool(concurrency: int, loader_args, preload: bool):
+    ctx = multiprocessing.get_context("fork")
+    models = load_models(*loader_args, preload=True) if preload else None
+    barrier = ctx.Barrier(concurrency + 1)
+    results = ctx.Queue()
+    processes = [ctx.Process(target=pool_process, args=(models, loader_args, barrier, results)) for _ in range(concurrency)]
+    for process in processes:
+        process.start()
+
+    barrier.wait()
+    parent = shared_models.memory_usage()
+    children = [results.get() for _ in processes]
+    barrier.wait()
+    for process in processes:
+        process.join()
+    return parent, children
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--synthetic-mb", type=int, default=512)
+    args = parser.parse_args()
+
+    if shared_models.memory_usage() is None:
+        parser.error("needs /proc/<pid>/smaps_rollup (Linux)")
+
+    processor_class, mode = load_remix_processor()
+    loader_args = (processor_class, mode, args.synthetic_mb)
+    print(f"mode: {mode}, {args.concurrency} pool processes")
+    print(f"{'layout':<14}{'parent RSS':>12}{'child RSS':>11}{'child PSS':>11}{'child USS':>11}{'total PSS':>11}")
+    # Per-process first: once the parent has preloaded, its models can't be unloaded
+    for label, preload in (("per-process", False), ("preloaded", True)):
+        parent, children = run_pool(args.concurrency, loader_args, preload)
+        mean = {key: np.mean([child[key] for child in children]) for key in children[0]}
+        total = parent["pss_mb"] + sum(child["pss_mb"] for child in children)
+        print(f"{label:<14}{parent['rss_mb']:>12.0f}{mean['rss_mb']:>11.0f}{mean['pss_mb']:>11.0f}"
+              f"{mean['uss_mb']:>11.0f}{total:>11.0f}")
+
+if __name__ == "__main__":
+    main()
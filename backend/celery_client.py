@@ -0,0 +1,27 @@
+"""
+Thin Celery client for the API process.
+
+Tasks are sent by name so the API never imports backend.tasks (and with it
+the ML pipeline); only the worker registers the task implementations.
+"""
+from celery import Celery
+from backend.config import settings
+
+REMIX_TASK = "backend.tasks.process_remix_task"
+STRUCTURE_TASK = "backend.tasks.analyze_structure_task"
+
+celery_app = Celery(
+    "nrx",
+    broker=f"redis://{settings.redis_host}:{settings.redis_port}/0",
+    backend=f"redis://{settings.redis_host}:{settings.redis_port}/0"
+)
+
+def send_remix_task(job_id: str, **kwargs):
+    return celery_app.send_task(REMIX_TASK, kwargs={"job_id": job_id, **kwargs}, task_id=job_id)
+
+def send_structure_task(input_key: str, audio_path: str):
+    return celery_app.send_task(STRUCTURE_TASK, kwargs={"audio_path": audio_path}, task_id=f"structure-{input_key}")
+
+def revoke_remix_task(job_id: str):
+    """Drop a queued remix; running ones stop through the job's cancellation flag"""
+    celery_app.control.revoke(job_id)
@@ -9,12 +9,100 @@ class Settings(BaseSettings):
     
     redis_host: str = "localhost"
     redis_port: int = 6379
+    redis_max_connections: int = 50
     
     max_file_size: int = 100 * 1024 * 1024
     allowed_formats: list[str] = [".mp3", ".wav", ".flac", ".m4a"]
+    output_format: str = "wav"
     
     demucs_model: str = "htdemucs"
+    demucs_shifts: int = 1
+    demucs_overlap: float = 0.25
+    demucs_chunk_seconds: float = 60.0
+    demucs_chunk_overlap_seconds: float = 1.0
     musicgen_model: str = "facebook/musicgen-melody"
+    musicgen_variants: dict[str, str] = {
+        "small": "facebook/musicgen-small",
+        "medium": "facebook/musicgen-medium",
+        "melody": "facebook/musicgen-melody",
+    }
+    musicgen_quality_tiers: dict[str, str] = {
+        "fast": "small",
+        "balanced": "melody",
+        "quality": "medium",
+    }
+    musicgen_max_resident: int = 2
+    # Rough fp32 footprints used before a variant's measured size is recorded
+    musicgen_size_estimates_mb: dict[str, int] = {
+        "small": 2300,
+        "medium": 7800,
+        "melody": 6200,
+    }
+    musicgen_memory_budget_mb: int = 8192
+    musicgen_inference_mode: str = "eager"
+    musicgen_compile: bool = False
+    text_encoder_cache_entries: int = 512
+    text_encoder_cache_persist: bool = True
+    text_encoder_prewarm: bool = True
+    torch_num_threads: int = 0
+    worker_preload_models: bool = False
+    
+    preview_duration: float = 10.0
+    preview_quality: str = "fast"
+    preview_demucs_shifts: int = 0
+    preview_demucs_overlap: float = 0.1
+    
+    resample_quality: str = "default"
+    
+    fingerprint_enabled: bool = True
+    fingerprint_min_matches: int = 30
+    fingerprint_min_confidence: float = 0.05
+    
+    stream_emit_interval_seconds: float = 5.0
+    
+    structure_kernel_beats: int = 32
+    structure_min_section_beats: int = 8
+    section_crossfade_beats: float = 1.0
+    structure_poll_seconds: int = 5
+    section_max_generation_seconds: float = 30.0
+    
+    mix_target_lufs: float = -14.0
+    mix_ceiling_db: float = -1.0
+    mix_duck_db: float = 3.0
+    mix_lookahead_ms: float = 5.0
+    mix_instant_measure_stride: int = 8
+    
+    vocal_activity_threshold_db: float = -35.0
+    vocal_activity_floor_db: float = -55.0
+    vocal_activity_padding_seconds: float = 0.25
+    vocal_activity_min_gap_seconds: float = 0.5
+    
+    admission_max_queue_depth: int = 100
+    admission_max_outstanding_seconds: float = 4 * 3600.0
+    admission_client_max_jobs: int = 3
+    admission_client_max_outstanding_seconds: float = 1800.0
+    admission_downgrade_to_preview: bool = True
+    # Estimated worker seconds per second of input audio, by pipeline mode
+    admission_mode_cost: dict[str, float] = {"full": 4.0, "hybrid": 1.0, "mock": 0.1, "offline": 4.0}
+    
+    task_max_retries: int = 2
+    task_retry_backoff_seconds: float = 10.0
+    
+    # 0: the container's cgroup limit, or physical memory
+    worker_memory_limit_mb: int = 0
+    worker_memory_headroom_mb: int = 512
+    # Memory reserved for jobs without recorded peaks: base plus MB per second of processed audio, by pipeline mode
+    worker_memory_prior_base_mb: float = 512.0
+    worker_memory_prior_mb_per_second: dict[str, float] = {"full": 8.0, "hybrid": 6.0, "mock": 0.5, "offline": 8.0}
+    worker_memory_defer_seconds: float = 15.0
+    worker_memory_max_deferrals: int = 20
+    # Replace a pool process after a task whose peak RSS exceeded this (0: never)
+    worker_max_memory_per_child_mb: int = 0
+    upload_quota_bytes: int = 20 * 1024 ** 3
+    output_quota_bytes: int = 10 * 1024 ** 3
+    cache_quota_bytes: int = 20 * 1024 ** 3
+    janitor_interval_seconds: int = 300
+    orphan_grace_seconds: int = 3600
     
     class Config:
         env_file = ".env"
@@ -0,0 +1,187 @@
+"""
+Worker-side memory governor.
+
+Before a remix starts, its pool process reserves the memory the job is
+expected to add: the cost model's predicted peak minus the process's
+current RSS, or a per-mode prior per second of audio without history.
+Reservations of every pool process on a host live in one Redis hash, keyed
+by hostname, with the reserving pid and its RSS at that point. Memory a job
+has already allocated shows up in the host's usage, so only the part of a
+reservation its process hasn't grown into yet counts as outstanding.
+Entries whose process is gone are dropped, so a killed worker can't leak
+its reservation.
+
+A job fits if the host's usage plus outstanding reservations plus its own
+need stay under the memory limit (the container's cgroup limit, or physical
+memory) less WORKER_MEMORY_HEADROOM_MB. Jobs that don't fit are requeued
+with a delay. A job that doesn't fit while no other live job on the host
+holds a reservation runs anyway, since waiting can't free anything for it.
+"""
+import json
+import os
+import socket
+import time
+from pathlib import Path
+from backend.config import settings
+from backend.worker import redis_client
+from backend.pipeline.cost_model import PAGE_SIZE, current_rss
+
+MB = 1024 ** 2
+
+def _read_int(path: str) -> int | None:
+    try:
+        value = Path(path).read_text().strip()
+    except OSError:
+        return None
+    return int(value) if value.isdigit() else None
+
+def _meminfo() -> dict:
+    try:
+        lines = Path("/proc/meminfo").read_text().splitlines()
+    except OSError:
+        return {}
+    fields = {}
+    for line in lines:
+        name, _, value = line.partition(":")
+        fields[name] = int(value.split()[0]) * 1024
+    return fields
+
+def _inactive_file(stat_path: str, field: str) -> int:
+    try:
+        for line in Path(stat_path).read_text().splitlines():
+            name, _, value = line.partition(" ")
+            if name == field:
+                return int(value)
+    except OSError:
+        pass
+    return 0
+
+def host_memory() -> tuple[float, float] | None:
+    """(limit MB, used MB) of the container's cgroup, or the machine without a cgroup limit"""
+    meminfo = _meminfo()
+    if not meminfo:
+        return None
+    total = meminfo["MemTotal"]
+
+    # Reclaimable page cache counts towards cgroup usage but not towards what a job can get
+    for limit_path, usage_path, stat_path, field in (
+        ("/sys/fs/cgroup/memory.max", "/sys/fs/cgroup/memory.current", "/sys/fs/cgroup/memory.stat", "inactive_file"),
+        ("/sys/fs/cgroup/memory/memory.limit_in_bytes", "/sys/fs/cgroup/memory/memory.usage_in_bytes",
+         "/sys/fs/cgroup/memory/memory.stat", "total_inactive_file"),
+    ):
+        limit, usage = _read_int(limit_path), _read_int(usage_path)
+        if limit is not None and usage is not None and limit < total:
+            limit_mb = settings.worker_memory_limit_mb or limit / MB
+            return limit_mb, (usage - _inactive_file(stat_path, field)) / MB
+
+    limit_mb = settings.worker_memory_limit_mb or total / MB
+    return limit_mb, (total - meminfo.get("MemAvailable", meminfo.get("MemFree", 0))) / MB
+
+def process_rss_mb(pid: int) -> float | None:
+    try:
+        with open(f"/proc/{pid}/statm") as f:
+            return int(f.read().split()[1]) * PAGE_SIZE / MB
+    except (OSError, IndexError, ValueError):
+        return None
+
+def reset_peak_rss() -> bool:
+    """Restart this process's VmHWM (and ru_maxrss) from its current RSS; needs Linux 4.0+"""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+def peak_rss_mb() -> float | None:
+    """VmHWM of this process: its RSS high-water mark since start or the last reset_peak_rss()"""
+    try:
+        for line in Path("/proc/self/status").read_text().splitlines():
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+def job_memory_mb(estimate: dict, mode: str, duration: float, preview: bool) -> float:
+    """Memory a job is expected to add to this process, in MB"""
+    if estimate["peak_mb"] is not None:
+        return max(estimate["peak_mb"] - current_rss() / MB, 0.0)
+    processed = min(duration, settings.preview_duration) if preview else duration
+    per_second = settings.worker_memory_prior_mb_per_second.get(mode, 8.0)
+    return settings.worker_memory_prior_base_mb + per_second * processed
+
+class MemoryGovernor:
+    def __init__(self, hostname: str = None):
+        self.key = f"memory:{hostname or socket.gethostname()}"
+
+    def _outstanding(self, exclude: str) -> tuple[float, int]:
+        """
+        MB reserved by other live jobs on this host that their processes
+        haven't allocated yet, and how many such jobs there are.
+        """
+        outstanding, others, stale = 0.0, 0, []
+        for job_id, raw in redis_client.hgetall(self.key).items():
+            entry = json.loads(raw)
+            rss = process_rss_mb(entry["pid"])
+            if rss is None:
+                stale.append(job_id)
+            elif job_id != exclude:
+                outstanding += max(entry["mb"] - max(rss - entry["rss_mb"], 0.0), 0.0)
+                others += 1
+        if stale:
+            redis_client.hdel(self.key, *stale)
+        return outstanding, others
+
+    def reserve(self, job_id: str, need_mb: float) -> bool:
+        """Reserve `need_mb` for a job if it fits on this host; False means try again later"""
+        memory = host_memory()
+        if memory is None:
+            return True
+        limit_mb, used_mb = memory
+
+        with redis_client.lock(f"{self.key}:lock", timeout=10, blocking_timeout=10):
+            outstanding, others = self._outstanding(exclude=job_id)
+            available = limit_mb - settings.worker_memory_headroom_mb - used_mb - outstanding
+            # Jobs that have grown into their reservations still free memory when they finish
+            if need_mb > available and others > 0:
+                print(f"Job {job_id} needs ~{need_mb:.0f} MB, {max(available, 0):.0f} MB available "
+                      f"({others} running jobs, {outstanding:.0f} MB reserved but not yet allocated)")
+                return False
+            if need_mb > available:
+                print(f"Job {job_id} needs ~{need_mb:.0f} MB but only {max(available, 0):.0f} MB is free; running it alone")
+
+            redis_client.hset(self.key, job_id, json.dumps({
+                "pid": os.getpid(),
+                "mb": need_mb,
+                "rss_mb": current_rss() / MB,
+                "reserved_at": time.time()
+            }))
+        return True
+
+    def release(self, job_id: str):
+        redis_client.hdel(self.key, job_id)
+
+memory_governor = MemoryGovernor()
+
+class TaskMemory:
+    """RSS of one task: at start, high-water mark and at the end"""
+
+    def __init__(self, reserved_mb: float = None):
+        self.reserved_mb = reserved_mb
+        self.tracks_peak = reset_peak_rss()
+        self.start_mb = current_rss() / MB
+
+    def report(self, stages: dict = None) -> dict:
+        stage_peaks = {stage: round(run["peak_mb"]) for stage, run in (stages or {}).items()}
+        end_mb = current_rss() / MB
+        peaks = [end_mb, *stage_peaks.values()]
+        if self.tracks_peak:
+            peaks.append(peak_rss_mb() or 0.0)
+        return {
+            "reserved_mb": round(self.reserved_mb) if self.reserved_mb is not None else None,
+            "rss_start_mb": round(self.start_mb),
+            "peak_rss_mb": round(max(peaks)),
+            "rss_end_mb": round(end_mb),
+            "stage_peak_mb": stage_peaks
+        }
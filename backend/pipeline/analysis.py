@@ -1,35 +1,119 @@
 import librosa
 import numpy as np
 from pathlib import Path
+from backend.pipeline.chroma import chroma_cache
+from backend.config import settings
+from backend.utils.audio import stream_audio
 
 class MusicAnalyzer:
     def __init__(self, sr: int = 44100):
         self.sr = sr
         
-    def analyze(self, audio_path: Path):
-        y, sr = librosa.load(audio_path, sr=self.sr)
+    def analyze(self, audio_path: Path, input_key: str = None):
+        """
+        Stream the decoded file through an IncrementalAnalyzer; memory doesn't grow with the full signal.
         
-        tempo, beats = librosa.beat.beat_track(y=y, sr=sr)
+        With `input_key` (the upload's content hash), the mix chroma is cached under it.
+        """
+        # No interim keys needed: longer chroma chunks mean fewer CQT filter bank builds
+        analyzer = IncrementalAnalyzer(self.sr, chroma_chunk_frames=4 * IncrementalAnalyzer.CHROMA_CHUNK_FRAMES)
+        for block in stream_audio(audio_path, sr=self.sr, mono=True):
+            analyzer.feed(block)
+        return analyzer.finalize(input_key=input_key)
+    
+    def _find_highlight(self, rms, beats, sr, window_seconds, hop_length=512):
+        """Start time of the loudest window (a cheap chorus proxy), snapped to a beat"""
+        window = int(window_seconds * sr / hop_length)
+        if len(rms) <= window:
+            return 0.0
         
-        chroma = librosa.feature.chroma_cqt(y=y, sr=sr)
-        key = self._estimate_key(chroma)
+        cumulative = np.concatenate([[0.0], np.cumsum(rms)])
+        start = int(np.argmax(cumulative[window:] - cumulative[:-window]))
         
-        chords = self._estimate_chords(chroma)
+        if len(beats) > 0:
+            start = int(beats[np.argmin(np.abs(beats - start))])
+            start = min(start, len(rms) - window)
         
-        spectral_centroid = librosa.feature.spectral_centroid(y=y, sr=sr)
-        brightness = float(np.mean(spectral_centroid))
+        return float(start * hop_length / sr)
+    
+    def _beat_grid(self, beats, tempo, n_frames, sr, hop_length=512):
+        """Tracked beat frames, with gaps (and the lead-in and tail the tracker trims) filled at the tempo's period"""
+        period = 60.0 / tempo * sr / hop_length
+        if len(beats) == 0:
+            return np.arange(0.0, n_frames, period).astype(int)
+        anchors = [beats[0] - period * np.arange(int(beats[0] // period), 0, -1)]
+        for a, b in zip(beats[:-1], beats[1:]):
+            steps = max(int(round((b - a) / period)), 1)
+            anchors.append(a + (b - a) * np.arange(steps) / steps)
+        anchors.append(beats[-1] + period * np.arange(int((n_frames - 1 - beats[-1]) // period) + 1))
+        return np.round(np.concatenate(anchors)).astype(int)
+    
+    def _structure(self, chroma, mel_db, rms, beats, sr, hop_length=512):
+        """
+        Sections of the track, found on a beat-synchronous self-similarity matrix.
         
-        rms = librosa.feature.rms(y=y)
-        energy = float(np.mean(rms))
+        Chroma and MFCCs (from the mel spectrum, frames x mels in dB) are
+        averaged between beats and compared by cosine similarity. Foote's
+        checkerboard kernel, slid along the diagonal, peaks on beats where the
+        music before and after differs. Peaks at least
+        structure_min_section_beats apart become boundaries. Sections as
+        similar to each other as to themselves share a label.
+        """
+        n_frames = min(chroma.shape[1], len(mel_db))
+        duration = len(rms) * hop_length / sr
+        half = settings.structure_kernel_beats // 2
+        beats = np.asarray(beats, dtype=int)
+        beats = beats[(beats > 0) & (beats < n_frames)]
+        if len(beats) < 2 * half:
+            return [{"index": 0, "start": 0.0, "end": round(duration, 3), "label": "A", "energy": 1.0}]
         
-        return {
-            "tempo": float(tempo),
-            "key": key,
-            "chords": chords,
-            "brightness": brightness,
-            "energy": energy,
-            "duration": len(y) / sr
-        }
+        mfcc = librosa.feature.mfcc(S=mel_db[:n_frames].T, n_mfcc=14)[1:]
+        mfcc = (mfcc - mfcc.mean(axis=1, keepdims=True)) / (mfcc.std(axis=1, keepdims=True) + 1e-6)
+        parts = [librosa.util.sync(feature, beats, aggregate=np.mean) for feature in (chroma[:, :n_frames], mfcc)]
+        features = np.vstack([part / (np.linalg.norm(part, axis=0, keepdims=True) + 1e-9) for part in parts])
+        similarity = features.T @ features / 2
+        
+        # Gaussian-tapered checkerboard: +1 within the past and within the future, -1 across them
+        offsets = np.arange(-half, half) + 0.5
+        taper = np.exp(-0.5 * (offsets / (0.5 * half)) ** 2)
+        kernel = np.outer(np.sign(offsets) * taper, np.sign(offsets) * taper)
+        padded = np.pad(similarity, half, mode="edge")
+        n_beats = len(similarity)
+        novelty = np.array([np.sum(kernel * padded[t:t + 2 * half, t:t + 2 * half]) for t in range(n_beats)])
+        novelty = np.maximum(novelty, 0.0)
+        
+        from scipy.signal import find_peaks
+        peaks, _ = find_peaks(
+            novelty,
+            height=novelty.mean() + 0.5 * novelty.std(),
+            distance=settings.structure_min_section_beats
+        )
+        edges = [0, *(int(p) for p in peaks if settings.structure_min_section_beats <= p <= n_beats - settings.structure_min_section_beats), n_beats]
+        
+        # Beat-synchronous column j starts at frame beats[j - 1]
+        starts = np.concatenate([[0], beats])
+        mean_rms = float(np.mean(rms)) or 1.0
+        sections, labels = [], []
+        for i, (lo, hi) in enumerate(zip(edges[:-1], edges[1:])):
+            start, end = starts[lo], starts[hi] if hi < len(starts) else len(rms)
+            label = None
+            for first, first_label in labels:
+                across = similarity[lo:hi, first[0]:first[1]].mean()
+                inside = min(similarity[lo:hi, lo:hi].mean(), similarity[first[0]:first[1], first[0]:first[1]].mean())
+                if across >= 0.9 * inside:
+                    label = first_label
+                    break
+            if label is None:
+                label = chr(ord("A") + len(labels))
+                labels.append(((lo, hi), label))
+            sections.append({
+                "index": i,
+                "start": round(float(start) * hop_length / sr, 3),
+                "end": round(min(float(end) * hop_length / sr, duration), 3),
+                "label": label,
+                "energy": round(float(np.mean(rms[start:end])) / mean_rms, 3)
+            })
+        return sections
     
     def _estimate_key(self, chroma):
         key_names = ['C', 'C#', 'D', 'D#', 'E', 'F', 'F#', 'G', 'G#', 'A', 'A#', 'B']
@@ -56,3 +140,203 @@ class MusicAnalyzer:
         minor = np.array([1, 0, 0, 1, 0, 0, 0, 1, 0, 0, 0, 0])
         return [major, minor]
 
+
+class IncrementalAnalyzer(MusicAnalyzer):
+    """
+    Analysis of audio that arrives in blocks, e.g. while it is being uploaded.
+    
+    feed() frames each block exactly as librosa's centered STFT frames the
+    whole signal. Per frame it keeps the RMS, spectral centroid and mel
+    spectrum, and updates running sums for energy and brightness. Chroma
+    comes from the CQT, computed in chunks of chroma_chunk_frames with
+    CHROMA_CONTEXT_SECONDS of audio on either side. That context covers the
+    longest CQT filter, so chunk edges don't show. Tuning is estimated once
+    from the first chunk.
+    
+    snapshot() returns interim estimates at any point. finalize() runs beat
+    tracking on the onset envelope and returns the full analysis. It matches
+    librosa's whole-signal beat_track, chroma_cqt, spectral_centroid and rms
+    up to float rounding and the tuning estimate. analyze() runs decoded
+    files through it; streams are analyzed at their own sample rate.
+    """
+    
+    N_FFT = 2048
+    HOP = 512
+    CHROMA_CHUNK_FRAMES = 864
+    CHROMA_CONTEXT_SECONDS = 2.0
+    TEMPOGRAM_CHUNK_FRAMES = 1024
+    
+    def __init__(self, sr: int = 44100, chroma_chunk_frames: int = None):
+        super().__init__(sr)
+        from scipy.signal import get_window
+        
+        self.chroma_chunk_frames = chroma_chunk_frames or self.CHROMA_CHUNK_FRAMES
+        
+        self._window = get_window("hann", self.N_FFT).astype(np.float32)
+        self._freqs = librosa.fft_frequencies(sr=sr, n_fft=self.N_FFT)
+        self._mel_basis = librosa.filters.mel(sr=sr, n_fft=self.N_FFT).T
+        self._context = int(self.CHROMA_CONTEXT_SECONDS * sr) // self.HOP * self.HOP
+        
+        # Centered framing: the signal is preceded by N_FFT / 2 zeros
+        self._buffer = np.zeros(self.N_FFT // 2, dtype=np.float32)
+        self._samples = 0
+        self._frames = 0
+        self._rms, self._centroid, self._mel_db = [], [], []
+        self._energy_sum = 0.0
+        self._brightness_sum = 0.0
+        
+        # Audio kept for the chroma chunks, starting at sample _history_start
+        self._history = np.zeros(0, dtype=np.float32)
+        self._history_start = 0
+        self._chroma = []
+        self._chroma_frames = 0
+        self._chroma_sum = np.zeros(12)
+        self._tuning = None
+    
+    @property
+    def duration(self) -> float:
+        return self._samples / self.sr
+    
+    def feed(self, block: np.ndarray):
+        """Add (frames,) or (channels, frames) audio at self.sr"""
+        block = np.asarray(block, dtype=np.float32)
+        if block.ndim == 2:
+            block = block.mean(axis=0)
+        self._samples += len(block)
+        self._buffer = np.concatenate([self._buffer, block])
+        self._history = np.concatenate([self._history, block])
+        self._consume_frames(len(self._buffer))
+        self._consume_chroma()
+    
+    def _consume_frames(self, available: int, limit: int = None):
+        """Analyze every complete STFT frame in the buffer and drop the samples no later frame needs"""
+        n_frames = 0 if available < self.N_FFT else (available - self.N_FFT) // self.HOP + 1
+        if limit is not None:
+            n_frames = min(n_frames, limit)
+        if n_frames == 0:
+            return
+        
+        frames = np.lib.stride_tricks.sliding_window_view(self._buffer[:available], self.N_FFT)[::self.HOP][:n_frames]
+        magnitude = np.abs(np.fft.rfft(frames * self._window, axis=-1))
+        
+        rms = np.sqrt(np.mean(frames ** 2, axis=-1))
+        total = magnitude.sum(axis=-1)
+        centroid = np.where(total > 0, magnitude @ self._freqs / np.maximum(total, 1e-30), 0.0)
+        
+        self._rms.append(rms)
+        self._centroid.append(centroid)
+        self._mel_db.append((10 * np.log10(np.maximum(magnitude ** 2 @ self._mel_basis, 1e-10))).astype(np.float32))
+        self._energy_sum += float(rms.sum())
+        self._brightness_sum += float(centroid.sum())
+        self._frames += n_frames
+        self._buffer = self._buffer[n_frames * self.HOP:]
+    
+    def _consume_chroma(self, final: bool = False):
+        """CQT chroma for every chunk whose right-hand context has arrived (or all remaining frames when final)"""
+        total_frames = 1 + self._samples // self.HOP
+        while True:
+            start = self._chroma_frames
+            end = start + self.chroma_chunk_frames
+            if final:
+                end = min(end, total_frames)
+                if start >= end:
+                    return
+            elif end * self.HOP + self._context > self._samples:
+                return
+            
+            seg_start = max(start * self.HOP - self._context, 0)
+            seg_end = min(end * self.HOP + self._context, self._samples)
+            segment = self._history[seg_start - self._history_start:seg_end - self._history_start]
+            if self._tuning is None:
+                self._tuning = librosa.estimate_tuning(y=segment, sr=self.sr, bins_per_octave=36)
+            
+            chroma = librosa.feature.chroma_cqt(y=segment, sr=self.sr, hop_length=self.HOP, tuning=self._tuning)
+            offset = start - seg_start // self.HOP
+            chroma = chroma[:, offset:offset + end - start]
+            
+            self._chroma.append(chroma)
+            self._chroma_sum += chroma.sum(axis=1)
+            self._chroma_frames = end
+            
+            keep_from = max(end * self.HOP - self._context, 0)
+            self._history = self._history[keep_from - self._history_start:]
+            self._history_start = keep_from
+    
+    def _onset_envelope(self) -> np.ndarray:
+        """librosa.onset.onset_strength(aggregate=np.median) over the frames seen so far"""
+        mel_db = np.concatenate(self._mel_db)
+        mel_db = np.maximum(mel_db, mel_db.max() - 80.0)
+        flux = np.median(np.maximum(mel_db[1:] - mel_db[:-1], 0.0), axis=-1)
+        pad = 1 + self.N_FFT // (2 * self.HOP)
+        return np.concatenate([np.zeros(pad), flux])[:len(mel_db)]
+    
+    def _tempo(self, onset_envelope: np.ndarray) -> float:
+        """
+        librosa.feature.tempo of the envelope.
+        
+        Its tempogram is one autocorrelation window per frame (hundreds of MB
+        for a long track) but only the time average is used, so the average
+        is accumulated over chunks of TEMPOGRAM_CHUNK_FRAMES instead.
+        """
+        win_length = librosa.time_to_frames(8.0, sr=self.sr, hop_length=self.HOP).item()
+        # What tempogram(center=True) pads the envelope with
+        padded = np.pad(onset_envelope, win_length // 2, mode="linear_ramp", end_values=0)
+        n_frames = len(padded) - win_length + 1
+        
+        total = np.zeros(win_length)
+        for start in range(0, n_frames, self.TEMPOGRAM_CHUNK_FRAMES):
+            end = min(start + self.TEMPOGRAM_CHUNK_FRAMES, n_frames)
+            total += librosa.feature.tempogram(
+                onset_envelope=padded[start:end + win_length - 1],
+                sr=self.sr,
+                hop_length=self.HOP,
+                win_length=win_length,
+                center=False
+            ).sum(axis=1)
+        return float(librosa.feature.tempo(tg=(total / n_frames)[:, None], sr=self.sr, hop_length=self.HOP)[0])
+    
+    def snapshot(self) -> dict:
+        """Interim estimates from the audio received so far"""
+        interim = {"duration": self.duration, "final": False}
+        if self._frames:
+            interim["energy"] = self._energy_sum / self._frames
+            interim["brightness"] = self._brightness_sum / self._frames
+        if self.duration >= 5.0:
+            interim["tempo"] = self._tempo(self._onset_envelope())
+        if self._chroma_frames:
+            interim["key"] = self._estimate_key(self._chroma_sum[:, None])
+        return interim
+    
+    def finalize(self, input_key: str = None) -> dict:
+        """
+        Flush the trailing frames and return the full analysis.
+        
+        With `input_key` (the upload's content hash), the mix chroma is cached under it.
+        """
+        n_frames = 1 + self._samples // self.HOP
+        self._buffer = np.concatenate([self._buffer, np.zeros(self.N_FFT // 2, dtype=np.float32)])
+        self._consume_frames(len(self._buffer), limit=n_frames - self._frames)
+        self._consume_chroma(final=True)
+        
+        onset_envelope = self._onset_envelope()
+        tempo = self._tempo(onset_envelope)
+        _, beats = librosa.beat.beat_track(onset_envelope=onset_envelope, sr=self.sr, hop_length=self.HOP, bpm=tempo)
+        chroma = np.concatenate(self._chroma, axis=1)
+        rms = np.concatenate(self._rms)
+        mel_db = np.concatenate(self._mel_db)
+        grid = self._beat_grid(beats, tempo, len(rms), self.sr, hop_length=self.HOP)
+        
+        if input_key:
+            chroma_cache.put(f"{input_key}-mix", chroma, fps=self.sr / self.HOP)
+        
+        return {
+            "tempo": tempo,
+            "key": self._estimate_key(chroma),
+            "chords": self._estimate_chords(chroma),
+            "brightness": float(np.mean(np.concatenate(self._centroid))),
+            "energy": float(np.mean(rms)),
+            "duration": self.duration,
+            "highlight_start": self._find_highlight(rms, beats, self.sr, settings.preview_duration, hop_length=self.HOP),
+            "beats": [round(float(t), 3) for t in librosa.frames_to_time(grid, sr=self.sr, hop_length=self.HOP)],
+            "sections": self._structure(chroma, mel_db, rms, grid, self.sr, hop_length=self.HOP)
+        }
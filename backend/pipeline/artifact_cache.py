@@ -0,0 +1,147 @@
+import json
+import os
+import shutil
+import numpy as np
+from pathlib import Path
+from backend.config import settings
+from backend.pipeline.fingerprint import fingerprint_index, refine_offset
+from backend.utils.audio import load_audio
+
+STEMS_SR = 44100
+
+class ArtifactCache:
+    """
+    On-disk cache of per-input pipeline artifacts (analysis JSON and stems).
+
+    Entries are keyed by the input key (the stored upload's file stem), so any
+    job on the same input reuses them. Stems are stored as one .npy per stem
+    and loaded memory-mapped.
+
+    Inputs the fingerprint index recognized as re-encodes of an earlier
+    upload are served from that upload's artifacts, shifted by the alignment
+    offset, before anything is recomputed.
+    """
+
+    def __init__(self, root: Path = None):
+        self.root = root or settings.cache_dir
+
+    def load_analysis(self, input_key: str):
+        path = self.root / "analysis" / f"{input_key}.json"
+        if not path.exists():
+            return None
+        os.utime(path)
+        return json.loads(path.read_text())
+
+    def save_analysis(self, input_key: str, analysis: dict):
+        path = self.root / "analysis" / f"{input_key}.json"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+        tmp_path.write_text(json.dumps(analysis))
+        tmp_path.replace(path)
+
+    def get_analysis(self, audio_path: Path, analyzer) -> dict:
+        analysis = self.load_analysis(audio_path.stem)
+        # Analyses cached before the structure map existed are redone
+        if analysis is None or "sections" not in analysis:
+            # Stored uploads are named by content hash, so the stem is a safe cache key
+            analysis = self._aliased_analysis(audio_path.stem) or analyzer.analyze(audio_path, input_key=audio_path.stem)
+            self.save_analysis(audio_path.stem, analysis)
+        return analysis
+    
+    def _aliased_analysis(self, input_key: str):
+        alias = fingerprint_index.alias(input_key)
+        source = self.load_analysis(alias["source_key"]) if alias else None
+        if source is None or "sections" not in source:
+            return None
+        
+        from backend.pipeline.chroma import chroma_cache
+        
+        offset, duration = alias["offset"], alias["duration"]
+        mix_chroma = chroma_cache.get(f"{alias['source_key']}-mix")
+        if mix_chroma is not None:
+            chroma, fps = mix_chroma
+            start = max(int(round(offset * fps)), 0)
+            chroma_cache.put(f"{input_key}-mix", chroma[:, start:start + int(duration * fps) + 1], fps=fps)
+        
+        print(f"Reusing analysis of {alias['source_key'][:12]} (offset {offset:+.2f}s)")
+        highlight_start = min(max(source["highlight_start"] - offset, 0.0), max(duration - settings.preview_duration, 0.0))
+        beats = [round(t - offset, 3) for t in source["beats"] if 0.0 <= t - offset <= duration]
+        sections = []
+        for section in source["sections"]:
+            start, end = max(section["start"] - offset, 0.0), min(section["end"] - offset, duration)
+            if end - start >= 1.0:
+                sections.append(dict(section, index=len(sections), start=round(start, 3), end=round(end, 3)))
+        return dict(source, duration=duration, highlight_start=highlight_start, beats=beats, sections=sections)
+
+    def get_stems(self, audio_path: Path, separator, offset: float = 0.0, duration: float = None,
+                  shifts: int = None, overlap: float = None, cancel=None) -> dict:
+        stems_key = self.stems_key(audio_path.stem, offset, duration, shifts)
+        stems = self.load_stems(stems_key)
+        if stems is None:
+            stems = self._aliased_stems(audio_path, offset, duration, shifts)
+            if stems is None:
+                stems = separator.separate(audio_path, offset=offset, duration=duration, shifts=shifts, overlap=overlap, cancel=cancel)
+            self.save_stems(stems_key, stems)
+        return stems
+    
+    def _aliased_stems(self, audio_path: Path, offset: float, duration: float, shifts: int):
+        """Slice of the full stems of the recording `audio_path` was recognized as, if cached"""
+        alias = fingerprint_index.alias(audio_path.stem)
+        if alias is None:
+            return None
+        
+        source = None
+        for source_shifts in dict.fromkeys([shifts, settings.demucs_shifts]):
+            source = self.load_stems(self.stems_key(alias["source_key"], shifts=source_shifts))
+            if source is not None:
+                break
+        if source is None:
+            return None
+        
+        if not alias["refined"]:
+            reference = sum(stem.mean(axis=0) for stem in source.values())
+            alias["offset"] = refine_offset(load_audio(audio_path, sr=STEMS_SR, mono=True), reference, STEMS_SR, alias["offset"])
+            fingerprint_index.refine_alias(audio_path.stem, alias["offset"])
+        
+        start = int(round((alias["offset"] + offset) * STEMS_SR))
+        length = int(round((duration or alias["duration"]) * STEMS_SR))
+        src_lo, src_hi = max(start, 0), min(start + length, min(stem.shape[-1] for stem in source.values()))
+        if src_hi - src_lo < 0.95 * length:
+            return None
+        
+        print(f"Reusing stems of {alias['source_key'][:12]} (offset {alias['offset']:+.3f}s)")
+        stems = {}
+        for name, stem in source.items():
+            sliced = np.zeros((stem.shape[0], length), dtype=np.float32)
+            sliced[:, src_lo - start:src_hi - start] = stem[:, src_lo:src_hi]
+            stems[name] = sliced
+        return stems
+
+    def stems_key(self, input_key: str, offset: float = 0.0, duration: float = None, shifts: int = None) -> str:
+        shifts = settings.demucs_shifts if shifts is None else shifts
+        span = "full" if not offset and not duration else f"{offset:.2f}-{duration:.2f}"
+        return f"{input_key}_{span}_s{shifts}"
+
+    def stems_dir(self, stems_key: str) -> Path:
+        return self.root / "stems" / stems_key
+
+    def load_stems(self, stems_key: str, mmap: bool = True):
+        stems_dir = self.stems_dir(stems_key)
+        if not (stems_dir / "complete").exists():
+            return None
+        os.utime(stems_dir)
+        mmap_mode = "r" if mmap else None
+        return {path.stem: np.load(path, mmap_mode=mmap_mode) for path in sorted(stems_dir.glob("*.npy"))}
+
+    def save_stems(self, stems_key: str, stems: dict):
+        stems_dir = self.stems_dir(stems_key)
+        tmp_dir = stems_dir.with_name(f"{stems_dir.name}.{os.getpid()}.tmp")
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        tmp_dir.mkdir(parents=True)
+        for name, stem in stems.items():
+            np.save(tmp_dir / f"{name}.npy", np.ascontiguousarray(stem, dtype=np.float32))
+        (tmp_dir / "complete").touch()
+        shutil.rmtree(stems_dir, ignore_errors=True)
+        tmp_dir.rename(stems_dir)
+
+artifact_cache = ArtifactCache()
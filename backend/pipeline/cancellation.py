@@ -0,0 +1,34 @@
+"""
+Cooperative cancellation for pipeline runs.
+
+The worker wraps the job's Redis cancellation flag in a CancelToken and
+passes it down the pipeline, which checks it between stages, between
+Demucs chunks and inside the MusicGen token loop. Polling is throttled so
+tight loops don't hit Redis on every iteration.
+"""
+import time
+from typing import Callable
+
+class JobCancelled(Exception):
+    """Raised inside the pipeline when the job's cancellation flag is set"""
+
+class CancelToken:
+    def __init__(self, check: Callable[[], bool], poll_interval: float = 0.5):
+        self._check = check
+        self.poll_interval = poll_interval
+        self._cancelled = False
+        self._last_poll = 0.0
+
+    @property
+    def cancelled(self) -> bool:
+        now = time.monotonic()
+        if not self._cancelled and now - self._last_poll >= self.poll_interval:
+            self._cancelled = bool(self._check())
+            self._last_poll = now
+        return self._cancelled
+
+    def raise_if_cancelled(self):
+        if self.cancelled:
+            raise JobCancelled()
+
+NEVER_CANCELLED = CancelToken(lambda: False, poll_interval=float("inf"))
@@ -0,0 +1,70 @@
+import os
+import numpy as np
+import librosa
+from collections import OrderedDict
+from backend.config import settings
+
+def compute_chroma(audio: np.ndarray, sr: int, hop_length: int = 2048) -> np.ndarray:
+    """Chroma (12, frames) of a mono or multichannel signal"""
+    if audio.ndim == 2:
+        audio = audio.mean(axis=0)
+    return librosa.feature.chroma_stft(y=audio, sr=sr, n_fft=hop_length * 4, hop_length=hop_length)
+
+def resample_chroma(chroma: np.ndarray, src_fps: float, dst_fps: float) -> np.ndarray:
+    """Linearly interpolate chroma frames to a new frame rate"""
+    n_src = chroma.shape[-1]
+    n_dst = max(int(round(n_src * dst_fps / src_fps)), 1)
+    src_times = np.arange(n_src) / src_fps
+    dst_times = np.arange(n_dst) / dst_fps
+    return np.stack([np.interp(dst_times, src_times, row) for row in chroma])
+
+def to_melody_features(chroma: np.ndarray) -> np.ndarray:
+    """
+    Convert chroma (12, frames) to MusicGen-Melody conditioning features.
+
+    Mirrors the feature extractor: frames become one-hot vectors on their
+    dominant pitch class, shaped (frames, 12).
+    """
+    features = np.zeros((chroma.shape[-1], chroma.shape[0]), dtype=np.float32)
+    features[np.arange(chroma.shape[-1]), chroma.argmax(axis=0)] = 1.0
+    return features
+
+class ChromaCache:
+    """
+    Per-input chroma cache, held in memory (LRU) and persisted under cache_dir.
+    """
+
+    def __init__(self, max_entries: int = 32):
+        self.max_entries = max_entries
+        self.cache_dir = settings.cache_dir / "chroma"
+        self._entries = OrderedDict()
+
+    def get(self, key: str):
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+        path = self.cache_dir / f"{key}.npz"
+        if not path.exists():
+            return None
+
+        os.utime(path)
+        with np.load(path) as data:
+            entry = (data["chroma"], float(data["fps"]))
+        self._remember(key, entry)
+        return entry
+
+    def put(self, key: str, chroma: np.ndarray, fps: float):
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.cache_dir / f"{key}.tmp.npz"
+        np.savez(tmp_path, chroma=chroma, fps=fps)
+        tmp_path.replace(self.cache_dir / f"{key}.npz")
+        self._remember(key, (chroma, fps))
+
+    def _remember(self, key: str, entry):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+chroma_cache = ChromaCache()
@@ -0,0 +1,248 @@
+"""
+Runtime and memory cost model for remix jobs.
+
+Workers time each pipeline stage with a StageTimer, which also samples the
+process's resident memory while the stage runs. Completed jobs record one
+row per stage in a small SQLite database at the root of cache_dir, which is
+shared by the API and the workers and never evicted by the janitor.
+
+Predictions fit seconds and peak MB as a linear function of input duration
+for each (mode, model variant, preview, stage). Runs at the same input
+sample rate are preferred. A stage with fewer than MIN_RUNS recorded runs
+falls back to a prior built from settings.admission_mode_cost, which has no
+memory estimate.
+"""
+import os
+import sqlite3
+import sys
+import threading
+import time
+from contextlib import contextmanager
+import numpy as np
+from backend.config import settings
+from backend.pipeline.model_registry import variant_for_tier
+
+STAGE_LABELS = {
+    "analysis": "Analyzing audio structure",
+    "separation": "Separating audio stems",
+    "generation": "Generating remix with AI",
+    "vocals": "Matching vocals to the remix",
+    "mix": "Mixing and mastering",
+}
+
+# Share of the runtime per stage, used for stages without history
+PRIOR_STAGE_SHARE = {
+    "full": {"analysis": 0.05, "separation": 0.25, "generation": 0.6, "vocals": 0.05, "mix": 0.05},
+    "hybrid": {"analysis": 0.15, "separation": 0.75, "mix": 0.1},
+    "mock": {"generation": 1.0},
+}
+
+MIN_RUNS = 3
+RUNS_KEPT_PER_STAGE = 200
+FIT_TTL = 60.0
+
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+def current_rss() -> int:
+    """Resident set size of this process in bytes"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * PAGE_SIZE
+    except OSError:
+        # No procfs (macOS): fall back to the lifetime peak
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+def job_variant(mode: str, quality: str, preview: bool) -> str | None:
+    """MusicGen variant a job will run with; None for pipelines without MusicGen"""
+    if mode not in ("full", "offline"):
+        return None
+    return variant_for_tier(quality or (settings.preview_quality if preview else None))
+
+def _fit(durations: np.ndarray, values: np.ndarray, conservative: bool = False):
+    """(intercept, slope) of values over durations, or None without enough runs"""
+    if len(values) < MIN_RUNS:
+        return None
+    if np.ptp(durations) < 1.0:
+        intercept, slope = float(values.mean()), 0.0
+    else:
+        slope, intercept = np.polyfit(durations, values, 1)
+    if conservative:
+        # Shift the line up to the worst observed run, so peaks are rarely underestimated
+        intercept += max(float((values - (intercept + slope * durations)).max()), 0.0)
+    return float(intercept), float(slope)
+
+class CostModel:
+    def __init__(self, path=None):
+        self.path = path or settings.cache_dir / "cost_model.sqlite3"
+        self._lock = threading.Lock()
+        self._fits = {}
+        self._fitted_at = 0.0
+
+    @contextmanager
+    def _connect(self):
+        """Connection that commits on success and is always closed"""
+        conn = sqlite3.connect(self.path, timeout=10)
+        try:
+            with conn:
+                self._create_schema(conn)
+                yield conn
+        finally:
+            conn.close()
+
+    def _create_schema(self, conn: sqlite3.Connection):
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS stage_runs (
+                id INTEGER PRIMARY KEY,
+                mode TEXT NOT NULL,
+                variant TEXT NOT NULL,
+                preview INTEGER NOT NULL,
+                sample_rate INTEGER NOT NULL,
+                duration REAL NOT NULL,
+                stage TEXT NOT NULL,
+                seconds REAL NOT NULL,
+                peak_mb REAL NOT NULL,
+                recorded_at REAL NOT NULL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS stage_runs_group ON stage_runs (mode, variant, preview, stage)")
+
+    def record(self, mode: str, variant: str, preview: bool, sample_rate: int, duration: float, stages: dict):
+        """Store the stage timings ({stage: {"seconds", "peak_mb"}}) of one completed job"""
+        group = (mode, variant or "", int(preview))
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            for stage, run in stages.items():
+                conn.execute(
+                    "INSERT INTO stage_runs (mode, variant, preview, sample_rate, duration, stage, seconds, peak_mb, recorded_at)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (*group, int(sample_rate), float(duration), stage, run["seconds"], run["peak_mb"], now)
+                )
+                conn.execute(
+                    "DELETE FROM stage_runs WHERE mode = ? AND variant = ? AND preview = ? AND stage = ? AND id NOT IN ("
+                    " SELECT id FROM stage_runs WHERE mode = ? AND variant = ? AND preview = ? AND stage = ?"
+                    " ORDER BY id DESC LIMIT ?)",
+                    (*group, stage, *group, stage, RUNS_KEPT_PER_STAGE)
+                )
+        self._fitted_at = 0.0
+
+    def _refresh(self):
+        """Refit every stage from the database at most every FIT_TTL seconds"""
+        if time.monotonic() - self._fitted_at < FIT_TTL:
+            return
+        with self._lock:
+            with self._connect() as conn:
+                rows = conn.execute(
+                    "SELECT mode, variant, preview, stage, sample_rate, duration, seconds, peak_mb FROM stage_runs"
+                ).fetchall()
+
+            groups = {}
+            for mode, variant, preview, stage, sample_rate, duration, seconds, peak_mb in rows:
+                for key in ((mode, variant, preview, stage, sample_rate), (mode, variant, preview, stage, None)):
+                    groups.setdefault(key, []).append((duration, seconds, peak_mb))
+
+            fits = {}
+            for key, runs in groups.items():
+                durations, seconds, peaks = (np.array(column, dtype=np.float64) for column in zip(*runs))
+                seconds_fit = _fit(durations, seconds)
+                if seconds_fit:
+                    fits[key] = (seconds_fit, _fit(durations, peaks, conservative=True))
+
+            self._fits = fits
+            self._fitted_at = time.monotonic()
+
+    def predict(self, mode: str, variant: str, duration: float, sample_rate: int = None, preview: bool = False) -> dict:
+        """
+        Estimated seconds and peak MB per stage and for the whole job.
+
+        `peak_mb` is None while no stage has recorded history.
+        """
+        self._refresh()
+        shares = PRIOR_STAGE_SHARE.get(mode, PRIOR_STAGE_SHARE["full"])
+        processed = min(duration, settings.preview_duration) if preview else duration
+        prior_seconds = processed * settings.admission_mode_cost.get(mode, 1.0)
+
+        stages = {}
+        for stage, share in shares.items():
+            group = (mode, variant or "", int(preview), stage)
+            fit = self._fits.get((*group, sample_rate)) or self._fits.get((*group, None))
+            if fit:
+                (seconds_intercept, seconds_slope), (peak_intercept, peak_slope) = fit
+                stages[stage] = {
+                    "seconds": max(seconds_intercept + seconds_slope * duration, 0.0),
+                    "peak_mb": max(peak_intercept + peak_slope * duration, 0.0)
+                }
+            else:
+                stages[stage] = {"seconds": prior_seconds * share, "peak_mb": None}
+
+        peaks = [run["peak_mb"] for run in stages.values() if run["peak_mb"] is not None]
+        return {
+            "seconds": sum(run["seconds"] for run in stages.values()),
+            "peak_mb": max(peaks) if peaks else None,
+            "stages": stages
+        }
+
+class StageTimer:
+    """
+    Times pipeline stages and samples peak resident memory while each runs.
+
+    Given an estimate from CostModel.predict and an `on_progress(progress,
+    stage, eta_seconds)` callback, it also reports progress between `start`
+    and `end` percent, weighting each stage by its predicted runtime and
+    advancing inside long stages.
+    """
+
+    def __init__(self, estimate: dict = None, on_progress=None, start: int = 5, end: int = 90,
+                 sample_interval: float = 0.1):
+        self.estimate = estimate
+        self.on_progress = on_progress
+        self.start = start
+        self.end = end
+        self.sample_interval = sample_interval
+        self.stages = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        stop = threading.Event()
+        peak = [current_rss()]
+        started = time.perf_counter()
+
+        def sample():
+            ticks = 0
+            while not stop.wait(self.sample_interval):
+                peak[0] = max(peak[0], current_rss())
+                ticks += 1
+                if ticks % 10 == 0:
+                    self._report(name, time.perf_counter() - started)
+
+        self._report(name, 0.0)
+        sampler = threading.Thread(target=sample, daemon=True)
+        sampler.start()
+        try:
+            yield
+        finally:
+            stop.set()
+            sampler.join()
+            peak[0] = max(peak[0], current_rss())
+            self.stages[name] = {"seconds": time.perf_counter() - started, "peak_mb": peak[0] / 1024 ** 2}
+
+    def _report(self, name: str, elapsed: float):
+        if self.on_progress is None or self.estimate is None:
+            return
+        predicted = {stage: run["seconds"] for stage, run in self.estimate["stages"].items()}
+        total = sum(predicted.values()) or 1.0
+        current = predicted.get(name, 0.0)
+        done = sum(seconds for stage, seconds in predicted.items() if stage in self.stages)
+        upcoming = sum(seconds for stage, seconds in predicted.items() if stage not in self.stages and stage != name)
+
+        # Never claim a stage is finished while it's still running
+        fraction = min((done + min(elapsed, current * 0.95)) / total, 1.0)
+        self.on_progress(
+            int(self.start + (self.end - self.start) * fraction),
+            STAGE_LABELS.get(name, name),
+            round(upcoming + max(current - elapsed, 0.0))
+        )
+
+cost_model = CostModel()
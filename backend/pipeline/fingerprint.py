@@ -0,0 +1,283 @@
+"""
+Perceptual fingerprints for recognizing re-encoded uploads.
+
+Byte-identical uploads already share a blob (backend.storage.uploads), but
+the same recording re-encoded as MP3, M4A or FLAC hashes differently. At
+upload the audio is decoded to mono at FINGERPRINT_SR, and the strongest
+peaks of its log spectrogram become landmarks. Each peak is paired with the
+next few peaks after it, and the pair (f1, f2, dt) is packed into one
+integer hash stored with the anchor's frame. Lossy codecs keep the
+strongest spectral peaks, so most landmarks survive re-encoding.
+
+Hashes live in an SQLite inverted index at the root of cache_dir. A lookup
+votes for (track, source frame - query frame). A re-encode of an indexed
+upload produces a sharp vote peak at the offset where it starts in the
+earlier upload. Confident matches that lie inside the earlier recording are
+stored as aliases. artifact_cache then serves their analysis and stems from
+the earlier upload, shifted by the offset. An alias keeps its own hashes
+aside, so when its source is forgotten it is indexed in the source's place
+and later re-encodes of the recording still match.
+"""
+import sqlite3
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from pathlib import Path
+import numpy as np
+from backend.config import settings
+from backend.utils.audio import AUDIO_LIBS_AVAILABLE, load_audio
+
+FINGERPRINT_SR = 11025
+N_FFT = 1024
+HOP = 256
+FRAME_SECONDS = HOP / FINGERPRINT_SR
+
+PEAKS_PER_SECOND = 15
+PEAK_NEIGHBORHOOD = (21, 11)  # frequency bins, frames
+FAN_OUT = 5
+MAX_DT = 63  # frames; dt is packed into 6 bits
+MAX_DF = 128  # bins
+
+# A match must lie within the earlier recording, give or take this much
+ALIGNMENT_TOLERANCE = 1.0
+
+def spectral_peaks(audio: np.ndarray) -> np.ndarray:
+    """(frame, bin) of the strongest local maxima of the log spectrogram, sorted by frame"""
+    from scipy.ndimage import maximum_filter
+
+    n_frames = 1 + max(len(audio) - N_FFT, 0) // HOP
+    frames = np.lib.stride_tricks.sliding_window_view(np.pad(audio, (0, N_FFT)), N_FFT)[::HOP][:n_frames]
+    spectrum = np.log(np.abs(np.fft.rfft(frames * np.hanning(N_FFT), axis=-1)) + 1e-6)
+
+    is_peak = (spectrum == maximum_filter(spectrum, size=PEAK_NEIGHBORHOOD)) & (spectrum > np.median(spectrum))
+    frame_idx, bin_idx = np.nonzero(is_peak)
+    budget = max(int(n_frames * FRAME_SECONDS * PEAKS_PER_SECOND), 1)
+    strongest = np.argsort(spectrum[frame_idx, bin_idx])[::-1][:budget]
+
+    peaks = np.stack([frame_idx[strongest], bin_idx[strongest]], axis=1)
+    return peaks[np.lexsort((peaks[:, 1], peaks[:, 0]))]
+
+def landmark_hashes(audio: np.ndarray) -> np.ndarray:
+    """(hash, anchor frame) pairs for a mono signal at FINGERPRINT_SR"""
+    peaks = spectral_peaks(audio)
+    hashes = []
+    for i, (t1, f1) in enumerate(peaks):
+        paired = 0
+        for t2, f2 in peaks[i + 1:]:
+            dt = t2 - t1
+            if dt > MAX_DT:
+                break
+            if dt == 0 or abs(f2 - f1) > MAX_DF:
+                continue
+            hashes.append(((int(f1) << 16) | (int(f2) << 6) | int(dt), int(t1)))
+            paired += 1
+            if paired == FAN_OUT:
+                break
+    return np.array(hashes, dtype=np.int64).reshape(-1, 2)
+
+def refine_offset(query: np.ndarray, reference: np.ndarray, sr: int, offset: float,
+                  search: float = 0.1, window: float = 5.0) -> float:
+    """
+    Sample-accurate start of `query` within `reference` near a coarse offset (seconds).
+
+    Cross-correlates a window from the middle of the query against the
+    reference. This also absorbs codec priming delay, which landmarks
+    resolve only to one hop.
+    """
+    from scipy.signal import correlate
+
+    n, s = int(window * sr), int(search * sr)
+    q_start = max((len(query) - n) // 2, 0)
+    segment = query[q_start:q_start + n]
+    r_start = int(round(offset * sr)) + q_start - s
+    lo = max(r_start, 0)
+    region = reference[lo:r_start + len(segment) + 2 * s]
+    if len(segment) == 0 or len(region) < len(segment):
+        return offset
+
+    lag = int(np.argmax(correlate(region, segment, mode="valid", method="fft")))
+    return (lo + lag - q_start) / sr
+
+class FingerprintIndex:
+    def __init__(self, path: Path = None):
+        self.path = path or settings.cache_dir / "fingerprints.sqlite3"
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def _connect(self):
+        """Connection that commits on success and is always closed"""
+        conn = sqlite3.connect(self.path, timeout=10)
+        try:
+            with conn:
+                self._create_schema(conn)
+                yield conn
+        finally:
+            conn.close()
+
+    def _create_schema(self, conn: sqlite3.Connection):
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS tracks (
+                id INTEGER PRIMARY KEY,
+                input_key TEXT NOT NULL UNIQUE,
+                duration REAL NOT NULL,
+                n_hashes INTEGER NOT NULL,
+                created_at REAL NOT NULL
+            )
+        """)
+        conn.execute("CREATE TABLE IF NOT EXISTS hashes (hash INTEGER NOT NULL, track_id INTEGER NOT NULL, frame INTEGER NOT NULL)")
+        conn.execute("CREATE INDEX IF NOT EXISTS hashes_by_hash ON hashes (hash)")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS aliases (
+                input_key TEXT PRIMARY KEY,
+                source_key TEXT NOT NULL,
+                offset REAL NOT NULL,
+                duration REAL NOT NULL,
+                matches INTEGER NOT NULL,
+                confidence REAL NOT NULL,
+                refined INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        conn.execute("CREATE TABLE IF NOT EXISTS alias_hashes (input_key TEXT NOT NULL, hash INTEGER NOT NULL, frame INTEGER NOT NULL)")
+        conn.execute("CREATE INDEX IF NOT EXISTS alias_hashes_by_input ON alias_hashes (input_key)")
+
+    def add_track(self, input_key: str, duration: float, hashes: np.ndarray):
+        with self._lock, self._connect() as conn:
+            self._insert_track(conn, input_key, duration, [(int(h), int(t)) for h, t in hashes])
+
+    def _insert_track(self, conn: sqlite3.Connection, input_key: str, duration: float, hashes: list):
+        conn.execute("DELETE FROM hashes WHERE track_id IN (SELECT id FROM tracks WHERE input_key = ?)", (input_key,))
+        conn.execute("DELETE FROM tracks WHERE input_key = ?", (input_key,))
+        track_id = conn.execute(
+            "INSERT INTO tracks (input_key, duration, n_hashes, created_at) VALUES (?, ?, ?, ?)",
+            (input_key, duration, len(hashes), time.time())
+        ).lastrowid
+        conn.executemany(
+            "INSERT INTO hashes (hash, track_id, frame) VALUES (?, ?, ?)",
+            ((h, track_id, t) for h, t in hashes)
+        )
+
+    def match(self, hashes: np.ndarray):
+        """
+        Best aligned match for a query's hashes, or None.
+
+        Returns {source_key, offset, duration, matches, confidence}, where
+        `offset` is where the query starts in the source (seconds).
+        """
+        if len(hashes) == 0:
+            return None
+
+        query_frames = {}
+        for h, t in hashes:
+            query_frames.setdefault(int(h), []).append(int(t))
+
+        votes = Counter()
+        unique = list(query_frames)
+        with self._connect() as conn:
+            for start in range(0, len(unique), 500):
+                chunk = unique[start:start + 500]
+                rows = conn.execute(
+                    f"SELECT hash, track_id, frame FROM hashes WHERE hash IN ({','.join('?' * len(chunk))})", chunk
+                )
+                for h, track_id, frame in rows:
+                    for t in query_frames[h]:
+                        votes[(track_id, frame - t)] += 1
+
+            if not votes:
+                return None
+
+            # Landmarks jitter by a frame across codecs, so neighbouring offsets count too
+            (track_id, delta), _ = votes.most_common(1)[0]
+            matches = sum(votes[(track_id, delta + d)] for d in (-1, 0, 1))
+            source_key, source_duration = conn.execute(
+                "SELECT input_key, duration FROM tracks WHERE id = ?", (track_id,)
+            ).fetchone()
+
+        return {
+            "source_key": source_key,
+            "offset": delta * FRAME_SECONDS,
+            "duration": source_duration,
+            "matches": matches,
+            "confidence": matches / len(hashes)
+        }
+
+    def add_alias(self, input_key: str, match: dict, duration: float, hashes: np.ndarray):
+        """Record an input as a re-encode of match["source_key"], keeping its hashes for when the source is forgotten"""
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO aliases (input_key, source_key, offset, duration, matches, confidence)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (input_key, match["source_key"], match["offset"], duration, match["matches"], match["confidence"])
+            )
+            conn.execute("DELETE FROM alias_hashes WHERE input_key = ?", (input_key,))
+            conn.executemany(
+                "INSERT INTO alias_hashes (input_key, hash, frame) VALUES (?, ?, ?)",
+                ((input_key, int(h), int(t)) for h, t in hashes)
+            )
+
+    def alias(self, input_key: str):
+        """{source_key, offset, duration, refined} of an input recognized as a re-encode, or None"""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT source_key, offset, duration, refined FROM aliases WHERE input_key = ?", (input_key,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {"source_key": row[0], "offset": row[1], "duration": row[2], "refined": bool(row[3])}
+
+    def refine_alias(self, input_key: str, offset: float):
+        with self._lock, self._connect() as conn:
+            conn.execute("UPDATE aliases SET offset = ?, refined = 1 WHERE input_key = ?", (offset, input_key))
+
+    def forget(self, input_key: str):
+        """
+        Drop an input's fingerprints and alias, e.g. once its upload is deleted.
+
+        Inputs aliased to it lose their source, so each is indexed as a track
+        of its own from the hashes kept with its alias.
+        """
+        with self._lock, self._connect() as conn:
+            conn.execute("DELETE FROM hashes WHERE track_id IN (SELECT id FROM tracks WHERE input_key = ?)", (input_key,))
+            conn.execute("DELETE FROM tracks WHERE input_key = ?", (input_key,))
+            conn.execute("DELETE FROM aliases WHERE input_key = ?", (input_key,))
+            conn.execute("DELETE FROM alias_hashes WHERE input_key = ?", (input_key,))
+
+            orphans = conn.execute("SELECT input_key, duration FROM aliases WHERE source_key = ?", (input_key,)).fetchall()
+            for alias_key, duration in orphans:
+                hashes = conn.execute("SELECT hash, frame FROM alias_hashes WHERE input_key = ?", (alias_key,)).fetchall()
+                # Aliases recorded before their hashes were kept have nothing to index
+                if hashes:
+                    self._insert_track(conn, alias_key, duration, hashes)
+                conn.execute("DELETE FROM aliases WHERE input_key = ?", (alias_key,))
+                conn.execute("DELETE FROM alias_hashes WHERE input_key = ?", (alias_key,))
+
+fingerprint_index = FingerprintIndex()
+
+def fingerprint_upload(path: Path, duration: float):
+    """
+    Fingerprint a new upload and either alias it to an earlier recording or index it.
+
+    Returns the match when the upload was recognized, else None.
+    """
+    if not settings.fingerprint_enabled or not AUDIO_LIBS_AVAILABLE:
+        return None
+
+    hashes = landmark_hashes(load_audio(path, sr=FINGERPRINT_SR, mono=True))
+    match = fingerprint_index.match(hashes)
+
+    recognized = (
+        match is not None
+        and match["matches"] >= settings.fingerprint_min_matches
+        and match["confidence"] >= settings.fingerprint_min_confidence
+        and match["offset"] >= -ALIGNMENT_TOLERANCE
+        and match["offset"] + duration <= match["duration"] + ALIGNMENT_TOLERANCE
+    )
+    if recognized:
+        print(f"Upload {path.stem[:12]} matches {match['source_key'][:12]} at {match['offset']:+.2f}s "
+              f"({match['matches']} landmarks, {match['confidence']:.0%})")
+        fingerprint_index.add_alias(path.stem, match, duration, hashes)
+        return match
+
+    fingerprint_index.add_track(path.stem, duration, hashes)
+    return None
@@ -6,7 +6,7 @@ import numpy as np
 class MusicGenerator:
     def __init__(self):
         self.device = "cuda" if torch.cuda.is_available() else "cpu"
-        self.model = MusicGen.get_pretrained('facebook/musicgen-melody', device=self.device)
+        self.model = MusicGen.get_pretrained(settings.musicgen_model, device=self.device)
         self.model.set_generation_params(duration=30)
         
     def generate(self, description: str, duration: float = 30.0, temperature: float = 1.0):
@@ -1,73 +1,246 @@
+import os
+import threading
 import torch
+import transformers
 import numpy as np
-from transformers import AutoProcessor, MusicgenForConditionalGeneration
+from collections import OrderedDict
+from pathlib import Path
+from transformers import AutoProcessor, MusicgenForConditionalGeneration, MusicgenMelodyForConditionalGeneration
+from transformers import StoppingCriteria, StoppingCriteriaList
 from backend.config import settings
+from backend.pipeline.chroma import compute_chroma, resample_chroma, to_melody_features
+from backend.pipeline.text_encoder_cache import CachedTextEncoder
+
+class CancelStoppingCriteria(StoppingCriteria):
+    """Stops the token loop as soon as the job's CancelToken fires"""
+
+    def __init__(self, cancel):
+        self.cancel = cancel
+
+    def __call__(self, input_ids: torch.LongTensor, scores: torch.FloatTensor, **kwargs) -> torch.BoolTensor:
+        return torch.full((input_ids.shape[0],), self.cancel.cancelled, dtype=torch.bool, device=input_ids.device)
+
+def model_memory_mb(model: torch.nn.Module) -> float:
+    """
+    Weight memory of a model in MB.
+
+    Dynamically quantized Linear layers keep their int8 weights in packed
+    params, outside parameters() and buffers(), so those are counted
+    separately.
+    """
+    tensors = list(model.parameters()) + list(model.buffers())
+    for module in model.modules():
+        if isinstance(module, torch.ao.nn.quantized.dynamic.Linear):
+            tensors.append(module.weight())
+            if module.bias() is not None:
+                tensors.append(module.bias())
+    return sum(t.numel() * t.element_size() for t in tensors) / 1024 ** 2
 
 class MusicGenerator:
-    def __init__(self):
+    def __init__(self, model_name: str = None, inference_mode: str = None):
         self.device = "cuda" if torch.cuda.is_available() else "cpu"
-        print(f"Loading MusicGen model on {self.device}...")
-        
-        self.model = MusicgenForConditionalGeneration.from_pretrained('facebook/musicgen-small')
-        self.processor = AutoProcessor.from_pretrained('facebook/musicgen-small')
-        
+        self.model_name = model_name or settings.musicgen_model
+        self.supports_melody = "melody" in self.model_name
+        self.inference_mode = inference_mode or settings.musicgen_inference_mode
+        print(f"Loading MusicGen model {self.model_name} on {self.device} ({self.inference_mode})...")
+
+        if settings.torch_num_threads > 0:
+            torch.set_num_threads(settings.torch_num_threads)
+
+        if self.inference_mode == "optimized" and self.device == "cpu":
+            self.model = self._load_optimized_model()
+        else:
+            self.model = self._model_class().from_pretrained(self.model_name)
+        self.processor = AutoProcessor.from_pretrained(self.model_name)
+
         self.model = self.model.to(self.device)
+        self.model.eval()
+        self.model.generation_config.use_cache = True
+
+        if settings.musicgen_compile:
+            self.model.decoder.forward = torch.compile(self.model.decoder.forward, dynamic=True)
+
+        # Installed after loading so the int8 checkpoint is saved without the wrapper
+        self.model.text_encoder = CachedTextEncoder(self.model.text_encoder, self.model_name)
+        self._token_cache = OrderedDict()
+        self._token_lock = threading.Lock()
+
         self.sample_rate = self.model.config.audio_encoder.sampling_rate
-        
+        self.chroma_fps = None
+        if self.supports_melody:
+            feature_extractor = self.processor.feature_extractor
+            self.chroma_fps = feature_extractor.sampling_rate / feature_extractor.hop_length
+        self.memory_mb = model_memory_mb(self.model)
+
         print(f"✓ MusicGen loaded successfully (sample rate: {self.sample_rate}Hz)")
-    
-    def generate(self, description: str, duration: float = 30.0, temperature: float = 1.0):
-        """Generate music from text description"""
-        inputs = self.processor(
-            text=[description],
-            padding=True,
-            return_tensors="pt",
-        ).to(self.device)
-        
+
+    def _model_class(self):
+        if self.supports_melody:
+            return MusicgenMelodyForConditionalGeneration
+        return MusicgenForConditionalGeneration
+
+    def _load_optimized_model(self):
+        """
+        Load MusicGen with int8 dynamic quantization on the decoder linear layers.
+
+        The model is always rebuilt from the pretrained weights and quantized,
+        which gives the quantized module structure. The int8 state_dict saved
+        under settings.cache_dir is then loaded into it with
+        weights_only=True, so nothing in the writable cache directory is
+        unpickled as code. A checkpoint that fails to load is replaced by a
+        fresh conversion.
+        """
+        model = self._quantized_pretrained()
+        checkpoint = self._optimized_checkpoint_path()
+        if checkpoint.exists():
+            print(f"   Loading pre-converted checkpoint: {checkpoint}")
+            try:
+                model.load_state_dict(torch.load(checkpoint, map_location="cpu", weights_only=True))
+                return model
+            except Exception as e:
+                print(f"   Couldn't load {checkpoint.name} ({e}), converting again")
+                # A partial load may have overwritten some weights
+                model = self._quantized_pretrained()
+
+        checkpoint.parent.mkdir(parents=True, exist_ok=True)
+        # Pool processes may convert at the same time on a cold start
+        tmp_path = checkpoint.with_name(f"{checkpoint.name}.{os.getpid()}.tmp")
+        torch.save(model.state_dict(), tmp_path)
+        tmp_path.replace(checkpoint)
+        print(f"   Saved int8 checkpoint: {checkpoint}")
+
+        return model
+
+    def _quantized_pretrained(self):
+        """The pretrained model with its decoder's linear layers dynamically quantized to int8"""
+        model = self._model_class().from_pretrained(self.model_name)
+        model.eval()
+        torch.ao.quantization.quantize_dynamic(
+            model.decoder,
+            {torch.nn.Linear},
+            dtype=torch.qint8,
+            inplace=True
+        )
+        return model
+
+    def _optimized_checkpoint_path(self) -> Path:
+        model_slug = self.model_name.replace("/", "--")
+        return settings.cache_dir / "musicgen" / (
+            f"{model_slug}-int8-torch{torch.__version__}-transformers{transformers.__version__}.state.pt"
+        )
+
+    def _text_inputs(self, text: str) -> dict:
+        """Tokenized prompt on the model's device; tokenization is memoized like the encoder outputs"""
+        with self._token_lock:
+            inputs = self._token_cache.get(text)
+            if inputs is None:
+                inputs = dict(self.processor(text=[text], padding=True, return_tensors="pt"))
+                self._token_cache[text] = inputs
+                if len(self._token_cache) > settings.text_encoder_cache_entries:
+                    self._token_cache.popitem(last=False)
+            else:
+                self._token_cache.move_to_end(text)
+        return {name: tensor.to(self.device) for name, tensor in inputs.items()}
+
+    def _conditioning_text(self, description: str) -> str:
+        """Text the model is conditioned on for generate_with_conditioning()"""
+        if self.supports_melody:
+            return description
+        return f"{description}, keeping the original melodic structure and rhythm"
+
+    def prewarm_text_encoder(self, descriptions) -> int:
+        """Encode prompts ahead of time so jobs using them skip the text encoder; returns how many were new"""
+        encoder = self.model.text_encoder
+        misses = encoder.misses
+        with torch.inference_mode():
+            for description in descriptions:
+                encoder(**self._text_inputs(self._conditioning_text(description)), return_dict=True)
+        return encoder.misses - misses
+
+    def _generate(self, inputs, duration: float, seed: int = None, cancel=None, **sampling) -> np.ndarray:
         max_tokens = int(duration * 50)
-        
-        audio_values = self.model.generate(
-            **inputs,
-            max_new_tokens=max_tokens,
-            do_sample=True,
+
+        if seed is not None:
+            torch.manual_seed(seed)
+
+        if cancel is not None:
+            sampling["stopping_criteria"] = StoppingCriteriaList([CancelStoppingCriteria(cancel)])
+
+        with torch.inference_mode():
+            audio_values = self.model.generate(
+                **inputs,
+                max_new_tokens=max_tokens,
+                use_cache=True,
+                **sampling
+            )
+
+        # A cancelled run stops early with truncated audio; never return it
+        if cancel is not None:
+            cancel.raise_if_cancelled()
+
+        return audio_values[0, 0].cpu().numpy()
+
+    def generate(self, description: str, duration: float = 30.0, temperature: float = 1.0, do_sample: bool = True):
+        """Generate music from text description"""
+        inputs = self._text_inputs(description)
+
+        return self._generate(
+            inputs,
+            duration,
+            do_sample=do_sample,
             temperature=temperature,
             guidance_scale=3.0
         )
-        
-        audio = audio_values[0, 0].cpu().numpy()
-        
-        return audio
-    
-    def generate_with_conditioning(self, melody_audio: np.ndarray, description: str, duration: float = 30.0):
+
+    def generate_with_conditioning(
+        self,
+        melody_audio: np.ndarray,
+        description: str,
+        duration: float = 30.0,
+        melody_chroma: np.ndarray = None,
+        melody_sample_rate: int = 44100,
+        seed: int = None,
+        cancel=None
+    ):
         """
         Generate music conditioned on input melody.
-        
-        Note: The base musicgen-small model doesn't have melody conditioning.
-        For now, we use strong genre descriptions to guide the transformation.
-        Future: Use musicgen-melody model when available in transformers.
+
+        Melody variants are conditioned on chroma features, shaped
+        (frames, 12) at self.chroma_fps. Pass `melody_chroma` to reuse
+        precomputed features; otherwise they are derived from `melody_audio`.
+        Variants without melody conditioning fall back to strong genre
+        descriptions to guide the transformation. `cancel` stops the token
+        loop early and raises JobCancelled.
         """
-        if melody_audio.ndim == 2:
-            melody_audio = melody_audio.mean(axis=0)
-        
-        enhanced_description = f"{description}, keeping the original melodic structure and rhythm"
-        
-        inputs = self.processor(
-            text=[enhanced_description],
-            padding=True,
-            return_tensors="pt",
-        ).to(self.device)
-        
-        max_tokens = int(duration * 50)
-        
-        audio_values = self.model.generate(
-            **inputs,
-            max_new_tokens=max_tokens,
+        inputs = self._text_inputs(self._conditioning_text(description))
+
+        if not self.supports_melody:
+            return self._generate(
+                inputs,
+                duration,
+                seed=seed,
+                cancel=cancel,
+                do_sample=True,
+                temperature=0.9,
+                guidance_scale=4.0
+            )
+
+        if melody_chroma is None:
+            chroma = compute_chroma(melody_audio, sr=melody_sample_rate)
+            chroma = resample_chroma(chroma, melody_sample_rate / 2048, self.chroma_fps)
+            melody_chroma = to_melody_features(chroma)
+
+        n_frames = int(np.ceil(duration * self.chroma_fps))
+        melody_chroma = melody_chroma[:n_frames]
+
+        inputs["input_features"] = torch.from_numpy(melody_chroma).float()[None].to(self.device)
+
+        return self._generate(
+            inputs,
+            duration,
+            seed=seed,
+            cancel=cancel,
             do_sample=True,
             temperature=0.9,
             guidance_scale=4.0
         )
-        
-        audio = audio_values[0, 0].cpu().numpy()
-        
-        return audio
-
@@ -0,0 +1,21 @@
+def load_remix_processor():
+    """
+    Best pipeline the installed dependencies support, as (processor class, mode).
+
+    Falls back from the full MusicGen pipeline to the Demucs-only hybrid and
+    finally to the mock pipeline.
+    """
+    try:
+        from backend.pipeline.processor_full import RemixProcessor
+        return RemixProcessor, "full"
+    except ImportError:
+        pass
+    
+    try:
+        from backend.pipeline.processor_hybrid import HybridRemixProcessor
+        return HybridRemixProcessor, "hybrid"
+    except ImportError:
+        pass
+    
+    from backend.pipeline.mock_pipeline import MockRemixProcessor
+    return MockRemixProcessor, "mock"
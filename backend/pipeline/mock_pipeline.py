@@ -2,21 +2,32 @@ import time
 import numpy as np
 from pathlib import Path
 from backend.config import settings
-
-STYLE_PRESETS = {
-    "lofi_chill": "lofi hip hop, chill beats, mellow, relaxed, jazzy chords, vinyl crackle",
-    "synthwave": "synthwave, 80s synths, retro futuristic, neon, electronic, atmospheric",
-    "neo_soul": "neo soul, smooth, rnb, warm electric piano, deep bass, soulful",
-    "acoustic": "acoustic guitar, organic, natural, unplugged, intimate, singer songwriter",
-    "edm": "electronic dance music, energetic, uplifting, festival, big drops, euphoric",
-    "jazz": "jazz, sophisticated, swing, improvisational, brass section, walking bass",
-    "rock": "rock music, electric guitars, drums, energetic, powerful, anthemic",
-    "orchestral": "orchestral, cinematic, epic, strings, brass, dramatic, sweeping"
-}
+from backend.pipeline.cancellation import CancelToken, NEVER_CANCELLED
+from backend.pipeline.cost_model import StageTimer
+from backend.registry import COMPACT_STYLE_PRESETS as STYLE_PRESETS
 
 class MockRemixProcessor:
-    def process(self, audio_path: Path, style: str, energy: float = 1.0, brightness: float = 1.0):
-        time.sleep(2)
+    def process(
+        self,
+        audio_path: Path,
+        style: str,
+        energy: float = 1.0,
+        brightness: float = 1.0,
+        quality: str = None,
+        preview: bool = False,
+        seed: int = None,
+        output_path: Path = None,
+        cancel: CancelToken = None,
+        workspace=None,
+        timer: StageTimer = None,
+        sections: list = None
+    ):
+        cancel = cancel or NEVER_CANCELLED
+        timer = timer or StageTimer()
+        with timer.stage("generation"):
+            for _ in range(4):
+                cancel.raise_if_cancelled()
+                time.sleep(0.5)
         
         analysis = {
             "tempo": 120.0,
@@ -29,10 +40,12 @@ class MockRemixProcessor:
         
         style_description = self._build_description(style, analysis, energy, brightness)
         
-        output_path = settings.output_dir / f"remix_{audio_path.stem}_mock.wav"
+        if output_path is None:
+            output_path = settings.output_dir / f"remix_{audio_path.stem}_mock.wav"
+        output_path.parent.mkdir(parents=True, exist_ok=True)
         
         sample_rate = 44100
-        duration = 5
+        duration = 2 if preview else 5
         frequency = 440
         t = np.linspace(0, duration, int(sample_rate * duration))
         audio = np.sin(2 * np.pi * frequency * t)
@@ -47,6 +60,8 @@ class MockRemixProcessor:
             "output_path": str(output_path),
             "analysis": analysis,
             "style_description": style_description,
+            "seed": seed,
+            "preview": preview,
             "note": "This is a mock output. Install ML dependencies with: pip install -r requirements-ml.txt"
         }
     
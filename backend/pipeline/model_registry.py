@@ -0,0 +1,106 @@
+import gc
+import json
+import os
+import threading
+from collections import OrderedDict
+from backend.config import settings
+
+def default_variant() -> str:
+    """Variant name configured by settings.musicgen_model (falls back to the raw model id)"""
+    for name, model_id in settings.musicgen_variants.items():
+        if model_id == settings.musicgen_model:
+            return name
+    return settings.musicgen_model
+
+def resolve_model_id(variant: str) -> str:
+    return settings.musicgen_variants.get(variant, variant)
+
+def variant_for_tier(tier: str = None) -> str:
+    if not tier:
+        return default_variant()
+    if tier not in settings.musicgen_quality_tiers:
+        raise ValueError(f"Unknown quality tier '{tier}'. Available: {list(settings.musicgen_quality_tiers)}")
+    return settings.musicgen_quality_tiers[tier]
+
+class ModelRegistry:
+    """
+    Keeps MusicGen variants resident per process.
+
+    At most `max_resident` generators are kept in memory within the memory
+    budget. Least recently used ones are evicted before a new variant loads,
+    to make room for its expected size: the size measured the last time it
+    loaded (recorded under cache_dir), or settings.musicgen_size_estimates_mb.
+    """
+
+    def __init__(self, max_resident: int = None, memory_budget_mb: int = None):
+        self.max_resident = max_resident or settings.musicgen_max_resident
+        self.memory_budget_mb = memory_budget_mb or settings.musicgen_memory_budget_mb
+        self.sizes_path = settings.cache_dir / "musicgen" / "sizes.json"
+        self._generators = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, variant: str = None):
+        variant = variant or default_variant()
+
+        with self._lock:
+            if variant in self._generators:
+                self._generators.move_to_end(variant)
+                return self._generators[variant]
+
+            from backend.pipeline.generation_transformers import MusicGenerator
+
+            self._evict(incoming_mb=self._expected_mb(variant))
+            generator = MusicGenerator(model_name=resolve_model_id(variant))
+            self._generators[variant] = generator
+            self._record_size(variant, generator)
+            return generator
+
+    def resident(self) -> dict:
+        with self._lock:
+            return {name: round(gen.memory_mb, 1) for name, gen in self._generators.items()}
+
+    def _size_key(self, variant: str) -> str:
+        return f"{resolve_model_id(variant)}:{settings.musicgen_inference_mode}"
+
+    def _recorded_sizes(self) -> dict:
+        try:
+            return json.loads(self.sizes_path.read_text())
+        except (OSError, ValueError):
+            return {}
+
+    def _expected_mb(self, variant: str) -> float:
+        recorded = self._recorded_sizes().get(self._size_key(variant))
+        if recorded is not None:
+            return recorded
+        estimates = settings.musicgen_size_estimates_mb
+        # Unknown model ids are assumed to be as large as the largest known variant
+        return estimates.get(variant, max(estimates.values(), default=0))
+
+    def _record_size(self, variant: str, generator):
+        sizes = self._recorded_sizes()
+        sizes[self._size_key(variant)] = round(generator.memory_mb, 1)
+        try:
+            self.sizes_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.sizes_path.with_name(f"sizes.{os.getpid()}.tmp")
+            tmp_path.write_text(json.dumps(sizes))
+            tmp_path.replace(self.sizes_path)
+        except OSError as e:
+            print(f"Couldn't record MusicGen size: {e}")
+
+    def _evict(self, incoming_mb: float):
+        """Evict least recently used variants until one more of `incoming_mb` fits"""
+        def over_budget():
+            total_mb = sum(gen.memory_mb for gen in self._generators.values())
+            return len(self._generators) >= self.max_resident or total_mb + incoming_mb > self.memory_budget_mb
+
+        evicted = False
+        while self._generators and over_budget():
+            oldest = next(iter(self._generators))
+            print(f"Evicting MusicGen variant '{oldest}' from memory")
+            del self._generators[oldest]
+            evicted = True
+        if evicted:
+            # Free the evicted weights (reference cycles included) before the next model loads
+            gc.collect()
+
+model_registry = ModelRegistry()
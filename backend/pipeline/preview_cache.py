@@ -0,0 +1,29 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+from backend.config import settings
+
+def preview_key(input_key: str, style: str, energy: float, brightness: float, quality: str = None, seed: int = None) -> str:
+    params = [input_key, style, round(energy, 2), round(brightness, 2), quality or settings.preview_quality]
+    # Seeded previews are a different render; unseeded ones keep their existing keys
+    if seed is not None:
+        params.append(seed)
+    raw = json.dumps(params)
+    return hashlib.sha1(raw.encode()).hexdigest()[:16]
+
+def preview_output_path(key: str) -> Path:
+    return settings.cache_dir / "previews" / f"{key}.wav"
+
+def load_preview(key: str):
+    result_path = preview_output_path(key).with_suffix(".json")
+    if not result_path.exists() or not preview_output_path(key).exists():
+        return None
+    os.utime(preview_output_path(key))
+    os.utime(result_path)
+    return json.loads(result_path.read_text())
+
+def save_preview(key: str, result: dict):
+    result_path = preview_output_path(key).with_suffix(".json")
+    result_path.parent.mkdir(parents=True, exist_ok=True)
+    result_path.write_text(json.dumps(result))
@@ -5,17 +5,7 @@ from backend.pipeline.analysis import MusicAnalyzer
 from backend.pipeline.generation import MusicGenerator
 from backend.utils.audio import save_audio, normalize_audio, load_audio
 from backend.config import settings
-
-STYLE_PRESETS = {
-    "lofi_chill": "lofi hip hop, chill beats, mellow, relaxed, jazzy chords, vinyl crackle",
-    "synthwave": "synthwave, 80s synths, retro futuristic, neon, electronic, atmospheric",
-    "neo_soul": "neo soul, smooth, rnb, warm electric piano, deep bass, soulful",
-    "acoustic": "acoustic guitar, organic, natural, unplugged, intimate, singer songwriter",
-    "edm": "electronic dance music, energetic, uplifting, festival, big drops, euphoric",
-    "jazz": "jazz, sophisticated, swing, improvisational, brass section, walking bass",
-    "rock": "rock music, electric guitars, drums, energetic, powerful, anthemic",
-    "orchestral": "orchestral, cinematic, epic, strings, brass, dramatic, sweeping"
-}
+from backend.registry import COMPACT_STYLE_PRESETS as STYLE_PRESETS
 
 class RemixProcessor:
     def __init__(self):
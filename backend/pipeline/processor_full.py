@@ -1,197 +1,377 @@
 from pathlib import Path
+import random
 import numpy as np
 from backend.pipeline.separation import StemSeparator
 from backend.pipeline.analysis import MusicAnalyzer
-from backend.pipeline.generation_transformers import MusicGenerator
-from backend.pipeline.vocal_processing import VocalProcessor
-from backend.utils.audio import save_audio, normalize_audio, load_audio
+from backend.pipeline.model_registry import model_registry, variant_for_tier
+from backend.pipeline.vocal_processing import VocalProcessor, detect_vocal_activity
+from backend.pipeline.chroma import chroma_cache, compute_chroma, resample_chroma, to_melody_features
+from backend.pipeline.artifact_cache import artifact_cache
+from backend.pipeline.cancellation import CancelToken, NEVER_CANCELLED
+from backend.pipeline.workspace import JobWorkspace, NO_WORKSPACE
+from backend.pipeline.mix_engine import MixEngine
+from backend.pipeline.cost_model import StageTimer
+from backend.pipeline.sections import (
+    SPLICE_SR, crossfade_seconds, padded_span, span_loudness, beat_phase_shift, shift_audio, fit_length, splice,
+    generation_windows, join_windows
+)
+from backend.utils.resample import Resampler
+from backend.utils.audio import stream_audio
 from backend.config import settings
+from backend.registry import STYLE_PRESETS, GENRE_CHARACTERISTICS
 
-STYLE_PRESETS = {
-    "lofi_chill": "lofi hip hop, chill beats, mellow jazz chords, vinyl crackle, relaxed atmosphere, smooth bass",
-    "synthwave": "synthwave 80s, retro synthesizers, neon aesthetic, electronic drums, nostalgic melodies, spacey pads",
-    "neo_soul": "neo soul, smooth rnb, warm electric piano, deep bass grooves, soulful atmosphere, jazz harmonies",
-    "acoustic": "acoustic guitar, organic instrumentation, natural sound, unplugged, intimate performance, folk elements",
-    "edm": "electronic dance music, festival banger, energetic drops, uplifting melodies, euphoric synths, big room sound",
-    "jazz": "jazz music, sophisticated harmonies, swing rhythm, improvisation, brass section, walking bass, bebop influences",
-    "rock": "rock music, electric guitars with distortion, powerful drums, energetic performance, anthemic sound, band arrangement",
-    "orchestral": "orchestral cinematic, epic strings, brass fanfares, dramatic percussion, sweeping melodies, film score atmosphere"
-}
+KEY_NAMES = ['C', 'C#', 'D', 'D#', 'E', 'F', 'F#', 'G', 'G#', 'A', 'A#', 'B']
 
-GENRE_CHARACTERISTICS = {
-    "lofi_chill": {
-        "tempo_range": (70, 90),
-        "energy": 0.4,
-        "complexity": "simple",
-        "description": "Laid-back hip-hop influenced beats with jazz elements"
-    },
-    "synthwave": {
-        "tempo_range": (100, 130),
-        "energy": 0.7,
-        "complexity": "medium",
-        "description": "80s-inspired electronic music with retro synthesizers"
-    },
-    "neo_soul": {
-        "tempo_range": (80, 100),
-        "energy": 0.6,
-        "complexity": "complex",
-        "description": "Contemporary R&B with jazz and soul influences"
-    },
-    "acoustic": {
-        "tempo_range": (80, 120),
-        "energy": 0.5,
-        "complexity": "simple",
-        "description": "Organic instruments, primarily guitar-based"
-    },
-    "edm": {
-        "tempo_range": (120, 140),
-        "energy": 0.9,
-        "complexity": "medium",
-        "description": "High-energy electronic dance music with big drops"
-    },
-    "jazz": {
-        "tempo_range": (100, 180),
-        "energy": 0.6,
-        "complexity": "complex",
-        "description": "Sophisticated harmonies with improvisation"
-    },
-    "rock": {
-        "tempo_range": (110, 150),
-        "energy": 0.8,
-        "complexity": "medium",
-        "description": "Electric guitar-driven energetic music"
-    },
-    "orchestral": {
-        "tempo_range": (60, 120),
-        "energy": 0.7,
-        "complexity": "complex",
-        "description": "Cinematic orchestral arrangements"
-    }
-}
+def preset_prompts() -> list:
+    """
+    Every prompt _build_genre_aware_description can produce whose tempo phrase is fixed.
+
+    Covers each style and key, the energy and brightness bands, and the
+    tempo phrases for inputs outside the style's tempo range. Inputs inside
+    the range name their exact BPM and are cached on first use instead.
+    """
+    prompts = {}
+    for style in STYLE_PRESETS:
+        tempo_range = GENRE_CHARACTERISTICS.get(style, {}).get("tempo_range")
+        tempos = [tempo_range[0] - 1, tempo_range[1] + 1] if tempo_range else [100.0]
+        for tempo in tempos:
+            for key in KEY_NAMES:
+                for energy in (0.7, 1.0, 1.3):
+                    for brightness in (0.7, 1.0, 1.3):
+                        analysis = {"tempo": tempo, "key": key}
+                        prompts[RemixProcessor._build_genre_aware_description(style, analysis, energy, brightness)] = None
+    return list(prompts)
+
+def prewarm_text_encoder(variant: str = None):
+    """Load a MusicGen variant and cache the text-encoder outputs of all preset prompts"""
+    generator = model_registry.get(variant)
+    encoded = generator.prewarm_text_encoder(preset_prompts())
+    print(f"✓ Text encoder cache warm for {generator.model_name} ({encoded} prompts encoded)")
 
 class RemixProcessor:
     def __init__(self):
         self.separator = StemSeparator()
         self.analyzer = MusicAnalyzer()
-        self.generator = MusicGenerator()
+        self.models = model_registry
         self.vocal_processor = VocalProcessor()
         
-    def process(self, audio_path: Path, style: str, energy: float = 1.0, brightness: float = 1.0):
-        original_audio = load_audio(audio_path, sr=44100)
-        
+    def process(
+        self,
+        audio_path: Path,
+        style: str,
+        energy: float = 1.0,
+        brightness: float = 1.0,
+        quality: str = None,
+        preview: bool = False,
+        seed: int = None,
+        output_path: Path = None,
+        cancel: CancelToken = None,
+        workspace: JobWorkspace = None,
+        timer: StageTimer = None,
+        sections: list = None
+    ):
+        cancel = cancel or NEVER_CANCELLED
+        workspace = workspace or NO_WORKSPACE
+        timer = timer or StageTimer()
+        resampler = Resampler()
+        if preview:
+            quality = quality or settings.preview_quality
+        variant = variant_for_tier(quality)
+        generator = self.models.get(variant)
+        
+        # A retry must reuse the first attempt's seed to match its checkpoints
+        seed = workspace.checkpoint(
+            "params", lambda: {"seed": random.randrange(2 ** 31) if seed is None else seed}
+        )["seed"]
+
+        cancel.raise_if_cancelled()
         print(f"Step 1: Analyzing musical structure...")
-        analysis = self.analyzer.analyze(audio_path)
-        
-        print(f"Step 2: Separating stems with Demucs v4...")
-        stems = self.separator.separate(audio_path)
+        with timer.stage("analysis"):
+            analysis = workspace.checkpoint("analysis", lambda: artifact_cache.get_analysis(audio_path, self.analyzer))
+        
+        if sections:
+            return self._remix_sections(
+                audio_path, sections, analysis, style, energy, brightness, generator, variant, seed,
+                output_path, cancel, workspace, timer, resampler
+            )
+        
+        with timer.stage("separation"):
+            if preview:
+                offset = analysis["highlight_start"]
+                duration = min(settings.preview_duration, analysis["duration"] - offset)
+                print(f"Step 2: Separating preview excerpt ({offset:.1f}s - {offset + duration:.1f}s)...")
+                stems = artifact_cache.get_stems(
+                    audio_path,
+                    self.separator,
+                    offset=offset,
+                    duration=duration,
+                    shifts=settings.preview_demucs_shifts,
+                    overlap=settings.preview_demucs_overlap,
+                    cancel=cancel
+                )
+            else:
+                offset = 0.0
+                duration = min(analysis["duration"], 30.0)
+                print(f"Step 2: Separating stems with Demucs v4...")
+                stems = artifact_cache.get_stems(audio_path, self.separator, cancel=cancel)
         
         print(f"Step 3: Building genre-aware description...")
         style_description = self._build_genre_aware_description(
             style, analysis, energy, brightness
         )
         
-        print(f"Step 4: Generating {style} version with MusicGen...")
+        print(f"Step 4: Generating {style} version with MusicGen ({variant})...")
         print(f"   Prompt: {style_description}")
         
-        duration = min(analysis["duration"], 30.0)
-        
-        instrumental = self._combine_instrumental_stems(stems)
-        
-        remix = self.generator.generate_with_conditioning(
-            melody_audio=instrumental,
-            description=style_description,
-            duration=duration
-        )
-        
+        def generate():
+            instrumental = self._combine_instrumental_stems(stems)
+            
+            melody_chroma = None
+            if generator.supports_melody:
+                melody_chroma = self._get_melody_chroma(audio_path, stems, generator.chroma_fps, offset)
+            
+            return generator.generate_with_conditioning(
+                melody_audio=instrumental,
+                description=style_description,
+                duration=duration,
+                melody_chroma=melody_chroma,
+                seed=seed,
+                cancel=cancel
+            )
+        
+        with timer.stage("generation"):
+            remix = workspace.checkpoint("generated", generate)
+        
+        cancel.raise_if_cancelled()
         print(f"Step 5: Analyzing AI-generated instrumental...")
+        sources = {"instrumental": remix}
+        activity = {}
         vocals = stems.get('vocals')
         if vocals is not None and vocals.shape[-1] > 0:
-            # Analyze what MusicGen actually created
-            import librosa as lb
-            
-            # MusicGen generates at 32kHz, analyze that
-            generated_tempo = lb.beat.tempo(y=remix[0] if remix.ndim > 1 else remix, sr=self.generator.sample_rate)[0]
-            
-            print(f"   Original vocals: {analysis['tempo']:.1f} BPM")
-            print(f"   AI-generated instrumental: {generated_tempo:.1f} BPM")
-            
-            # Calculate how much to adjust vocals to match the actual generated output
-            tempo_diff = abs(generated_tempo - analysis["tempo"])
-            
-            if tempo_diff > 5.0:
-                print(f"   Matching vocals to AI-generated tempo...")
-                print(f"   - Adjusting: {analysis['tempo']:.1f} → {generated_tempo:.1f} BPM")
-                
-                # Determine if we need pitch adjustment based on the tempo change
-                tempo_ratio = generated_tempo / analysis["tempo"]
-                pitch_adjustment = 0.0
-                
-                # For significant tempo changes, adjust pitch slightly to maintain vocal character
-                if tempo_ratio < 0.85:  # Slowing down significantly
-                    pitch_adjustment = -0.5
-                    print(f"   - Lowering pitch by 0.5 semitones for slower tempo")
-                elif tempo_ratio > 1.15:  # Speeding up significantly
-                    pitch_adjustment = +0.5
-                    print(f"   - Raising pitch by 0.5 semitones for faster tempo")
-                
-                # Resample vocals to match MusicGen's sample rate first
-                if self.generator.sample_rate != 44100:
-                    print(f"   Resampling vocals: 44100 → {self.generator.sample_rate} Hz")
-                    vocals = lb.resample(
-                        vocals, 
-                        orig_sr=44100, 
-                        target_sr=self.generator.sample_rate
-                    )
-                    if vocals.ndim == 1:
-                        vocals = np.expand_dims(vocals, axis=0)
-                
-                # Now adjust to match the generated tempo
-                vocals = self.vocal_processor.adjust_vocals_for_genre(
-                    vocals=vocals,
-                    original_tempo=analysis["tempo"],
-                    target_tempo=generated_tempo,  # Match actual MusicGen output
-                    pitch_shift_semitones=pitch_adjustment,
-                    preserve_formants=True,
-                    sample_rate=self.generator.sample_rate
+            with timer.stage("vocals"):
+                sources["vocals"] = workspace.checkpoint(
+                    "vocals",
+                    lambda: self._match_vocals(np.asarray(vocals), remix, analysis, generator.sample_rate, resampler)
                 )
-                print(f"   ✓ Vocals matched to AI-generated instrumental")
-            else:
-                print(f"   Tempos already aligned (within 5 BPM)")
-                
-                # Still need to resample to match MusicGen's sample rate
-                if self.generator.sample_rate != 44100:
-                    print(f"   Resampling vocals: 44100 → {self.generator.sample_rate} Hz")
-                    vocals = lb.resample(
-                        vocals, 
-                        orig_sr=44100, 
-                        target_sr=self.generator.sample_rate
-                    )
-                    if vocals.ndim == 1:
-                        vocals = np.expand_dims(vocals, axis=0)
-            
-            remix = self._blend_with_vocals(remix, vocals, blend_ratio=0.65)
+                # Lets the mix skip the vocals (and ducking) where they're silent
+                activity["vocals"] = detect_vocal_activity(sources["vocals"], generator.sample_rate)
+        
+        cancel.raise_if_cancelled()
+        print(f"Step 6: Mixing and mastering...")
+        if output_path is None:
+            suffix = "_preview" if preview else ""
+            output_path = settings.output_dir / f"remix_{audio_path.stem}_{style}_{variant}{suffix}.wav"
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        with timer.stage("mix"):
+            MixEngine(generator.sample_rate).render_to_file(
+                output_path,
+                sources,
+                gains={"instrumental": 0.65, "vocals": 0.35},
+                sidechain="vocals",
+                length=remix.shape[-1],
+                activity=activity
+            )
         
-        remix = normalize_audio(remix)
+        return {
+            "output_path": str(output_path),
+            "analysis": analysis,
+            "style_description": style_description,
+            "stems_used": list(stems.keys()),
+            "mode": "full",
+            "model": f"MusicGen {variant} (via Transformers)",
+            "model_variant": variant,
+            "seed": seed,
+            "preview": preview,
+            "excerpt": {"start": offset, "duration": duration},
+            "genre_characteristics": GENRE_CHARACTERISTICS.get(style, {})
+        }
+    
+    def _remix_sections(self, audio_path: Path, sections: list, analysis: dict, style: str, energy: float,
+                        brightness: float, generator, variant: str, seed: int, output_path: Path,
+                        cancel: CancelToken, workspace: JobWorkspace, timer: StageTimer, resampler: Resampler):
+        """
+        Regenerate only the [start, end] spans in `sections` and splice them into the original.
+
+        Each span is padded by half a crossfade on both sides, then separated,
+        generated and vocal-matched on its own. It is mixed to the original's
+        loudness over the span and shifted onto the original's beat grid. The
+        prompt names the track's own tempo, so the remix keeps pace with the
+        music around it. Spans over SECTION_MAX_GENERATION_SECONDS are
+        generated in crossfaded windows.
+        """
+        fade = crossfade_seconds(analysis)
+        spans = [padded_span(section, fade, analysis["duration"]) for section in sections]
+        print(f"Step 2: Separating {len(spans)} section(s) ({sum(d for _, d in spans):.1f}s of {analysis['duration']:.1f}s)...")
+        with timer.stage("separation"):
+            stems = [
+                artifact_cache.get_stems(audio_path, self.separator, offset=offset, duration=duration, cancel=cancel)
+                for offset, duration in spans
+            ]
+        
+        style_description = self._build_genre_aware_description(style, analysis, energy, brightness, keep_tempo=True)
+        print(f"Step 3: Generating {style} sections with MusicGen ({variant})...")
+        print(f"   Prompt: {style_description}")
         
-        output_path = settings.output_dir / f"remix_{audio_path.stem}_{style}.wav"
-        save_audio(remix, output_path, sr=self.generator.sample_rate)
+        def generate_window(span_stems: dict, offset: float, duration: float):
+            melody_chroma = None
+            if generator.supports_melody:
+                melody_chroma = self._get_melody_chroma(audio_path, span_stems, generator.chroma_fps, offset)
+            return generator.generate_with_conditioning(
+                melody_audio=self._combine_instrumental_stems(span_stems),
+                description=style_description,
+                duration=duration,
+                melody_chroma=melody_chroma,
+                seed=seed,
+                cancel=cancel
+            )
+        
+        def generate(i: int):
+            offset, duration = spans[i]
+            windows = generation_windows(duration, settings.section_max_generation_seconds, fade)
+            if len(windows) == 1:
+                return generate_window(stems[i], offset, duration)
+            
+            # Each window is put on the beat grid before joining, so the crossfades don't smear beats
+            sr = generator.sample_rate
+            parts = []
+            for start, length in windows:
+                window_stems = {
+                    name: stem[..., int(round(start * 44100)):int(round((start + length) * 44100))]
+                    for name, stem in stems[i].items() if stem is not None
+                }
+                audio = generate_window(window_stems, offset + start, length)
+                first_beat = next((t for t in analysis["beats"] if t >= offset + start), offset + start)
+                parts.append(shift_audio(audio, beat_phase_shift(audio, sr, analysis["tempo"], first_beat - offset - start)))
+            starts = [int(round(start * sr)) for start, _ in windows]
+            return join_windows(parts, starts, int(round(duration * sr)), int(round(fade * sr)))
+        
+        with timer.stage("generation"):
+            remixes = [workspace.checkpoint(f"generated-{i}", lambda i=i: generate(i)) for i in range(len(spans))]
+        
+        cancel.raise_if_cancelled()
+        print(f"Step 4: Matching vocals...")
+        vocals = []
+        with timer.stage("vocals"):
+            for i, remix in enumerate(remixes):
+                stem = stems[i].get("vocals")
+                if stem is None or stem.shape[-1] == 0:
+                    vocals.append(None)
+                    continue
+                vocals.append(workspace.checkpoint(
+                    f"vocals-{i}",
+                    lambda stem=stem, remix=remix: self._match_vocals(np.asarray(stem), remix, analysis, generator.sample_rate, resampler)
+                ))
+        
+        cancel.raise_if_cancelled()
+        print(f"Step 5: Mixing and splicing into the original...")
+        if output_path is None:
+            output_path = settings.output_dir / f"remix_{audio_path.stem}_{style}_{variant}_sections.wav"
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        with timer.stage("mix"):
+            replacements = []
+            for i, (offset, duration) in enumerate(spans):
+                sources, activity = {"instrumental": remixes[i]}, {}
+                if vocals[i] is not None:
+                    sources["vocals"] = vocals[i]
+                    activity["vocals"] = detect_vocal_activity(vocals[i], generator.sample_rate)
+                engine = MixEngine(generator.sample_rate, target_lufs=span_loudness(audio_path, offset, duration))
+                mixed = np.concatenate(list(engine.iter_blocks(
+                    sources,
+                    gains={"instrumental": 0.65, "vocals": 0.35},
+                    sidechain="vocals",
+                    length=remixes[i].shape[-1],
+                    activity=activity
+                )), axis=-1)
+                mixed = fit_length(resampler(mixed, generator.sample_rate, SPLICE_SR), int(round(duration * SPLICE_SR)))
+                
+                # Section boundaries are beats of the original; the first may start before the first beat
+                first_beat = next((t for t in analysis["beats"] if t >= sections[i][0]), sections[i][0])
+                replacements.append((offset, shift_audio(mixed, beat_phase_shift(mixed, SPLICE_SR, analysis["tempo"], first_beat - offset))))
+            splice(audio_path, output_path, replacements, fade)
         
         return {
             "output_path": str(output_path),
             "analysis": analysis,
             "style_description": style_description,
-            "stems_used": list(stems.keys()),
+            "stems_used": sorted({name for span_stems in stems for name in span_stems}),
             "mode": "full",
-            "model": "MusicGen (via Transformers)",
+            "model": f"MusicGen {variant} (via Transformers)",
+            "model_variant": variant,
+            "seed": seed,
+            "preview": False,
+            "sections": [{"start": start, "end": end} for start, end in sections],
+            "excerpt": {"start": 0.0, "duration": analysis["duration"]},
             "genre_characteristics": GENRE_CHARACTERISTICS.get(style, {})
         }
     
-    def _build_genre_aware_description(self, style: str, analysis: dict, energy: float, brightness: float):
+    def _match_vocals(self, vocals: np.ndarray, remix: np.ndarray, analysis: dict, sample_rate: int,
+                      resampler: Resampler = None) -> np.ndarray:
+        """Resample the original vocals to the generator's rate and match them to the generated tempo"""
+        # Analyze what MusicGen actually created
+        import librosa as lb
+        resampler = resampler or Resampler()
+        
+        # Bring vocals to MusicGen's sample rate first
+        if sample_rate != 44100:
+            print(f"   Resampling vocals: 44100 → {sample_rate} Hz")
+            vocals = resampler(vocals, 44100, sample_rate)
+        if vocals.ndim == 1:
+            vocals = np.expand_dims(vocals, axis=0)
+        
+        # MusicGen generates at 32kHz, analyze that
+        generated_tempo = lb.beat.tempo(y=remix[0] if remix.ndim > 1 else remix, sr=sample_rate)[0]
+        
+        print(f"   Original vocals: {analysis['tempo']:.1f} BPM")
+        print(f"   AI-generated instrumental: {generated_tempo:.1f} BPM")
+        
+        # Calculate how much to adjust vocals to match the actual generated output
+        tempo_diff = abs(generated_tempo - analysis["tempo"])
+        
+        if tempo_diff > 5.0:
+            print(f"   Matching vocals to AI-generated tempo...")
+            print(f"   - Adjusting: {analysis['tempo']:.1f} → {generated_tempo:.1f} BPM")
+            
+            # Determine if we need pitch adjustment based on the tempo change
+            tempo_ratio = generated_tempo / analysis["tempo"]
+            pitch_adjustment = 0.0
+            
+            # For significant tempo changes, adjust pitch slightly to maintain vocal character
+            if tempo_ratio < 0.85:  # Slowing down significantly
+                pitch_adjustment = -0.5
+                print(f"   - Lowering pitch by 0.5 semitones for slower tempo")
+            elif tempo_ratio > 1.15:  # Speeding up significantly
+                pitch_adjustment = +0.5
+                print(f"   - Raising pitch by 0.5 semitones for faster tempo")
+            
+            # Now adjust to match the generated tempo; only voiced spans are processed
+            activity = detect_vocal_activity(vocals, sample_rate)
+            voiced = (activity[:, 1] - activity[:, 0]).sum() / vocals.shape[-1]
+            print(f"   - Voice detected in {voiced:.0%} of the stem; processing only those spans")
+            vocals = self.vocal_processor.adjust_vocals_for_genre(
+                vocals=vocals,
+                original_tempo=analysis["tempo"],
+                target_tempo=generated_tempo,  # Match actual MusicGen output
+                pitch_shift_semitones=pitch_adjustment,
+                preserve_formants=True,
+                sample_rate=sample_rate,
+                activity=activity
+            )
+            print(f"   ✓ Vocals matched to AI-generated instrumental")
+        else:
+            print(f"   Tempos already aligned (within 5 BPM)")
+        
+        return vocals
+    
+    @staticmethod
+    def _build_genre_aware_description(style: str, analysis: dict, energy: float, brightness: float,
+                                       keep_tempo: bool = False):
         """
         Build a detailed genre-aware description for MusicGen.
         
         MusicGen was trained on 20,000 hours of music across many genres.
         The key to good genre transformation is detailed, specific prompts.
+        With `keep_tempo` the prompt names the input's own BPM even outside
+        the genre's range (for sections spliced back into the original).
         """
         base_style = STYLE_PRESETS.get(style, style)
         genre_info = GENRE_CHARACTERISTICS.get(style, {})
@@ -200,7 +380,9 @@ class RemixProcessor:
         key = analysis["key"]
         
         tempo_adjustment = ""
-        if genre_info and "tempo_range" in genre_info:
+        if keep_tempo:
+            tempo_adjustment = f"{int(tempo)} BPM"
+        elif genre_info and "tempo_range" in genre_info:
             min_t, max_t = genre_info["tempo_range"]
             if tempo < min_t:
                 tempo_adjustment = f"upbeat {int((min_t + max_t) / 2)} BPM"
@@ -252,6 +434,42 @@ class RemixProcessor:
         
         return instrumental
     
+    def _get_melody_chroma(self, audio_path: Path, stems: dict, fps: float, offset: float = 0.0) -> np.ndarray:
+        """
+        Melody conditioning features for this input, computed once and cached.
+
+        Like AudioCraft's chroma conditioner, drums and bass are dropped so the
+        chroma follows the melodic stems (vocals + other). Falls back to the
+        full-mix chroma cached by the analyzer (or recomputed when it isn't
+        cached) when those stems are missing.
+        """
+        length = max((stem.shape[-1] for stem in stems.values() if stem is not None), default=0)
+        key = f"{audio_path.stem}-melody-{offset:.2f}-{length}-{fps:.4f}"
+        cached = chroma_cache.get(key)
+        if cached is not None:
+            return cached[0]
+        
+        melodic = [stems[name] for name in ('vocals', 'other') if stems.get(name) is not None]
+        if melodic:
+            min_length = min(stem.shape[-1] for stem in melodic)
+            melodic_mix = sum(stem[..., :min_length] for stem in melodic)
+            chroma = compute_chroma(melodic_mix, sr=44100)
+            src_fps = 44100 / 2048
+        else:
+            mix_chroma = chroma_cache.get(f"{audio_path.stem}-mix")
+            if mix_chroma is not None:
+                chroma, src_fps = mix_chroma
+                chroma = chroma[:, int(offset * src_fps):]
+            else:
+                # Evicted or never cached: recompute from the mix over the same span
+                blocks = list(stream_audio(audio_path, sr=44100, offset=offset, duration=length / 44100 if length else None))
+                chroma = compute_chroma(np.concatenate(blocks, axis=-1), sr=44100)
+                src_fps = 44100 / 2048
+        
+        features = to_melody_features(resample_chroma(chroma, src_fps, fps))
+        chroma_cache.put(key, features, fps=fps)
+        return features
+    
     def _get_genre_vocal_pitch(self, style: str, original_tempo: float, target_tempo: float) -> float:
         """
         Intelligently determine pitch adjustment based on genre and tempo change.
@@ -283,26 +501,3 @@ class RemixProcessor:
         
         # Clamp to reasonable range
         return max(-2.0, min(2.0, base_pitch))
-    
-    def _blend_with_vocals(self, remix: np.ndarray, vocals: np.ndarray, blend_ratio: float = 0.65) -> np.ndarray:
-        """Blend generated instrumental with original vocals"""
-        min_length = min(remix.shape[-1], vocals.shape[-1])
-        
-        if remix.ndim == 1:
-            remix = np.expand_dims(remix, 0)
-        if vocals.ndim == 1:
-            vocals = np.expand_dims(vocals, 0)
-        
-        if remix.shape[0] == 1 and vocals.shape[0] == 2:
-            remix = np.repeat(remix, 2, axis=0)
-        elif remix.shape[0] == 2 and vocals.shape[0] == 1:
-            vocals = np.repeat(vocals, 2, axis=0)
-        
-        blended = np.zeros_like(remix)
-        blended[..., :min_length] = remix[..., :min_length] * blend_ratio + vocals[..., :min_length] * (1 - blend_ratio)
-        
-        if min_length < remix.shape[-1]:
-            blended[..., min_length:] = remix[..., min_length:]
-        
-        return blended
-
@@ -2,40 +2,74 @@ from pathlib import Path
 import numpy as np
 from backend.pipeline.separation import StemSeparator
 from backend.pipeline.analysis import MusicAnalyzer
-from backend.utils.audio import save_audio, normalize_audio, load_audio
+from backend.pipeline.artifact_cache import artifact_cache
+from backend.pipeline.cancellation import CancelToken, NEVER_CANCELLED
+from backend.pipeline.workspace import JobWorkspace, NO_WORKSPACE
+from backend.pipeline.stem_mix import stem_gains
+from backend.pipeline.mix_engine import MixEngine
+from backend.pipeline.cost_model import StageTimer
+from backend.pipeline.sections import crossfade_seconds, padded_span, span_loudness, fit_length, splice
 from backend.config import settings
-
-STYLE_PRESETS = {
-    "lofi_chill": "lofi hip hop, chill beats, mellow, relaxed, jazzy chords, vinyl crackle",
-    "synthwave": "synthwave, 80s synths, retro futuristic, neon, electronic, atmospheric",
-    "neo_soul": "neo soul, smooth, rnb, warm electric piano, deep bass, soulful",
-    "acoustic": "acoustic guitar, organic, natural, unplugged, intimate, singer songwriter",
-    "edm": "electronic dance music, energetic, uplifting, festival, big drops, euphoric",
-    "jazz": "jazz, sophisticated, swing, improvisational, brass section, walking bass",
-    "rock": "rock music, electric guitars, drums, energetic, powerful, anthemic",
-    "orchestral": "orchestral, cinematic, epic, strings, brass, dramatic, sweeping"
-}
+from backend.registry import COMPACT_STYLE_PRESETS as STYLE_PRESETS
 
 class HybridRemixProcessor:
     def __init__(self):
         self.separator = StemSeparator()
         self.analyzer = MusicAnalyzer()
         
-    def process(self, audio_path: Path, style: str, energy: float = 1.0, brightness: float = 1.0):
-        original_audio = load_audio(audio_path, sr=44100)
-        
-        analysis = self.analyzer.analyze(audio_path)
-        
-        stems = self.separator.separate(audio_path)
+    def process(
+        self,
+        audio_path: Path,
+        style: str,
+        energy: float = 1.0,
+        brightness: float = 1.0,
+        quality: str = None,
+        preview: bool = False,
+        seed: int = None,
+        output_path: Path = None,
+        cancel: CancelToken = None,
+        workspace: JobWorkspace = None,
+        timer: StageTimer = None,
+        sections: list = None
+    ):
+        cancel = cancel or NEVER_CANCELLED
+        workspace = workspace or NO_WORKSPACE
+        timer = timer or StageTimer()
+        cancel.raise_if_cancelled()
+        with timer.stage("analysis"):
+            analysis = workspace.checkpoint("analysis", lambda: artifact_cache.get_analysis(audio_path, self.analyzer))
+        
+        if sections:
+            return self._remix_sections(audio_path, sections, analysis, style, energy, brightness, seed, output_path, cancel, timer)
+        
+        with timer.stage("separation"):
+            if preview:
+                offset = analysis["highlight_start"]
+                duration = min(settings.preview_duration, analysis["duration"] - offset)
+                stems = artifact_cache.get_stems(
+                    audio_path,
+                    self.separator,
+                    offset=offset,
+                    duration=duration,
+                    shifts=settings.preview_demucs_shifts,
+                    overlap=settings.preview_demucs_overlap,
+                    cancel=cancel
+                )
+            else:
+                offset = 0.0
+                duration = analysis["duration"]
+                stems = artifact_cache.get_stems(audio_path, self.separator, cancel=cancel)
+        
+        cancel.raise_if_cancelled()
         
         style_description = self._build_description(style, analysis, energy, brightness)
         
-        remix = self._style_transfer_stems(stems, style, energy, brightness, analysis)
-        
-        remix = normalize_audio(remix)
-        
-        output_path = settings.output_dir / f"remix_{audio_path.stem}.wav"
-        save_audio(remix, output_path, sr=44100)
+        if output_path is None:
+            suffix = "_preview" if preview else ""
+            output_path = settings.output_dir / f"remix_{audio_path.stem}{suffix}.wav"
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        with timer.stage("mix"):
+            MixEngine(44100).render_to_file(output_path, stems, stem_gains(energy, brightness), sidechain="vocals")
         
         return {
             "output_path": str(output_path),
@@ -43,36 +77,48 @@ class HybridRemixProcessor:
             "style_description": style_description,
             "stems_used": list(stems.keys()),
             "mode": "hybrid",
+            "seed": seed,
+            "preview": preview,
+            "excerpt": {"start": offset, "duration": duration},
             "note": "Using Demucs + Librosa. MusicGen unavailable (requires xformers)"
         }
     
-    def _style_transfer_stems(self, stems: dict, style: str, energy: float, brightness: float, analysis: dict) -> np.ndarray:
-        vocals = stems.get('vocals', np.zeros((2, 44100)))
-        drums = stems.get('drums', np.zeros((2, 44100)))
-        bass = stems.get('bass', np.zeros((2, 44100)))
-        other = stems.get('other', np.zeros((2, 44100)))
-        
-        max_len = max(vocals.shape[-1], drums.shape[-1], bass.shape[-1], other.shape[-1])
-        
-        def pad_stem(stem, target_len):
-            if stem.shape[-1] < target_len:
-                padding = np.zeros((stem.shape[0], target_len - stem.shape[-1]))
-                return np.concatenate([stem, padding], axis=-1)
-            return stem[:, :target_len]
-        
-        vocals = pad_stem(vocals, max_len)
-        drums = pad_stem(drums, max_len)
-        bass = pad_stem(bass, max_len)
-        other = pad_stem(other, max_len)
-        
-        drums_adjusted = drums * energy
-        bass_adjusted = bass * (1.0 + (energy - 1.0) * 0.5)
+    def _remix_sections(self, audio_path: Path, sections: list, analysis: dict, style: str, energy: float,
+                        brightness: float, seed: int, output_path: Path, cancel: CancelToken, timer: StageTimer):
+        """Re-mix only the [start, end] spans in `sections` and splice them into the original"""
+        fade = crossfade_seconds(analysis)
+        spans = [padded_span(section, fade, analysis["duration"]) for section in sections]
+        with timer.stage("separation"):
+            stems = [
+                artifact_cache.get_stems(audio_path, self.separator, offset=offset, duration=duration, cancel=cancel)
+                for offset, duration in spans
+            ]
+        
+        cancel.raise_if_cancelled()
+        if output_path is None:
+            output_path = settings.output_dir / f"remix_{audio_path.stem}_sections.wav"
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        with timer.stage("mix"):
+            # Stems keep the original's timeline, so no beat alignment is needed
+            replacements = []
+            for (offset, duration), span_stems in zip(spans, stems):
+                engine = MixEngine(44100, target_lufs=span_loudness(audio_path, offset, duration))
+                mixed = np.concatenate(list(engine.iter_blocks(span_stems, stem_gains(energy, brightness), sidechain="vocals")), axis=-1)
+                replacements.append((offset, fit_length(mixed, int(round(duration * 44100)))))
+            splice(audio_path, output_path, replacements, fade)
         
-        other_adjusted = other * brightness
-        
-        remix = vocals * 0.3 + drums_adjusted * 0.25 + bass_adjusted * 0.25 + other_adjusted * 0.2
-        
-        return remix
+        return {
+            "output_path": str(output_path),
+            "analysis": analysis,
+            "style_description": self._build_description(style, analysis, energy, brightness),
+            "stems_used": sorted({name for span_stems in stems for name in span_stems}),
+            "mode": "hybrid",
+            "seed": seed,
+            "preview": False,
+            "sections": [{"start": start, "end": end} for start, end in sections],
+            "excerpt": {"start": 0.0, "duration": analysis["duration"]},
+            "note": "Using Demucs + Librosa. MusicGen unavailable (requires xformers)"
+        }
     
     def _build_description(self, style: str, analysis: dict, energy: float, brightness: float):
         base_style = STYLE_PRESETS.get(style, style)
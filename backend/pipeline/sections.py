@@ -0,0 +1,182 @@
+"""
+Partial remixes of selected song sections.
+
+The analysis' structure map (MusicAnalyzer._structure) divides a track into
+sections on beat boundaries. A partial remix separates and regenerates only
+the selected sections, each padded by half a crossfade on both sides, so
+its cost follows the selected length rather than the song's. splice() then
+streams the original and swaps each remixed span in. The equal-power
+crossfades are centred on the section boundaries, which are beats of the
+original. Generated audio is shifted so its beats land on the original's
+beat grid, and each span is mixed to the original's loudness over the same
+stretch. Spans longer than MusicGen's context are generated in overlapping
+windows, each aligned to the grid, then joined with the same crossfade.
+"""
+import math
+import numpy as np
+from pathlib import Path
+from backend.config import settings
+from backend.pipeline.mix_engine import LoudnessMeter
+from backend.utils.audio import probe_audio, stream_audio
+
+SPLICE_SR = 44100
+
+def select_sections(analysis: dict, indices: list, min_gap: float = 0.0) -> list:
+    """
+    [start, end] spans in seconds of the chosen structure-map sections.
+
+    Sections that touch, or are less than `min_gap` seconds apart, are
+    merged into one span so their crossfades don't overlap.
+    """
+    sections = analysis.get("sections") or []
+    unknown = sorted(set(i for i in indices if not 0 <= i < len(sections)))
+    if unknown:
+        raise ValueError(f"Unknown section index {unknown[0]}; this track has sections 0-{len(sections) - 1}")
+
+    spans = []
+    for i in sorted(set(indices)):
+        start, end = sections[i]["start"], sections[i]["end"]
+        if spans and start - spans[-1][1] < max(min_gap, 1e-3):
+            spans[-1][1] = end
+        else:
+            spans.append([start, end])
+    return spans
+
+def crossfade_seconds(analysis: dict) -> float:
+    return settings.section_crossfade_beats * 60.0 / analysis["tempo"]
+
+def padded_span(span: list, fade: float, duration: float) -> tuple:
+    """(offset, duration) to process for a span: half a crossfade either side, within the track"""
+    offset = max(span[0] - fade / 2, 0.0)
+    return offset, min(span[1] + fade / 2, duration) - offset
+
+def generation_windows(duration: float, max_window: float, overlap: float) -> list:
+    """(start, length) in seconds of the fewest equal windows of at most `max_window` covering `duration`, overlapping by `overlap`"""
+    if duration <= max_window:
+        return [(0.0, duration)]
+    n = math.ceil((duration - overlap) / (max_window - overlap))
+    step = (duration - overlap) / n
+    return [(i * step, step + overlap) for i in range(n)]
+
+def join_windows(parts: list, starts: list, n: int, fade: int) -> np.ndarray:
+    """
+    Join (channels, frames) windows starting at sample `starts` into n samples.
+
+    Consecutive windows overlap by `fade` samples and are crossfaded at
+    equal power there.
+    """
+    n_channels = max(part.shape[0] for part in parts)
+    out = np.zeros((n_channels, n), dtype=np.float32)
+    ramp = np.sin(np.linspace(0.0, np.pi / 2, fade)).astype(np.float32)
+    for k, (part, start) in enumerate(zip(parts, starts)):
+        end = starts[k + 1] + fade if k + 1 < len(parts) else n
+        part = fit_length(np.atleast_2d(part), end - start).copy()
+        if k > 0:
+            part[..., :fade] *= ramp
+        if k + 1 < len(parts):
+            part[..., -fade:] *= ramp[::-1]
+        out[:, start:end] += part
+    return out
+
+def span_loudness(audio_path: Path, offset: float, duration: float):
+    """Integrated loudness (LUFS) of the original over a span, or None for silence"""
+    meter = None
+    for block in stream_audio(audio_path, sr=SPLICE_SR, offset=offset, duration=duration):
+        meter = meter or LoudnessMeter(SPLICE_SR, block.shape[0])
+        meter.add(block)
+    return meter.integrated() if meter else None
+
+def beat_phase_shift(audio: np.ndarray, sr: int, tempo: float, lead_in: float) -> int:
+    """
+    Samples to delay `audio` by so its beats fall on a grid at `tempo` with a beat `lead_in` seconds in.
+
+    The beat phase is the circular mean of the onset envelope over one beat
+    period. It is moved onto the grid by the smallest shift, under half a
+    period.
+    """
+    import librosa
+
+    hop = 512
+    mono = audio.mean(axis=0) if audio.ndim == 2 else audio
+    envelope = librosa.onset.onset_strength(y=mono, sr=sr, hop_length=hop)
+    # The cut at either end of the excerpt reads as an onset
+    edge = 2048 // hop + 1
+    envelope[:edge] = envelope[-edge:] = 0.0
+    period = 60.0 / tempo * sr
+    if len(envelope) * hop < 2 * period:
+        return 0
+    angles = 2 * np.pi * librosa.frames_to_samples(np.arange(len(envelope)), hop_length=hop) / period
+    beat_phase = np.angle(np.sum(envelope * np.exp(1j * angles))) / (2 * np.pi) * period
+    shift = (lead_in * sr - beat_phase + period / 2) % period - period / 2
+    return int(round(shift))
+
+def shift_audio(audio: np.ndarray, shift: int) -> np.ndarray:
+    """Delay (shift > 0) or advance audio by whole samples, keeping its length; gaps are filled by repeating the edge"""
+    if shift == 0:
+        return audio
+    pad = [(0, 0)] * (audio.ndim - 1)
+    if shift > 0:
+        return np.pad(audio[..., :audio.shape[-1] - shift], pad + [(shift, 0)], mode="edge")
+    return np.pad(audio[..., -shift:], pad + [(0, -shift)], mode="edge")
+
+def fit_length(audio: np.ndarray, n: int) -> np.ndarray:
+    """Trim or zero-pad audio to n samples"""
+    if audio.shape[-1] >= n:
+        return audio[..., :n]
+    return np.pad(audio, [(0, 0)] * (audio.ndim - 1) + [(0, n - audio.shape[-1])])
+
+def _weights(start: int, end: int, spans: list) -> np.ndarray:
+    """Crossfade position (0 original, 1 remix) of samples [start, end) given (fade_in, full, fade_out, stop) boundaries"""
+    t = np.arange(start, end, dtype=np.float64)
+    weights = np.zeros(end - start)
+    for fade_in, full, fade_out, stop in spans:
+        rising = np.clip((t - fade_in) / max(full - fade_in, 1), 0.0, 1.0)
+        falling = np.clip((stop - t) / max(stop - fade_out, 1), 0.0, 1.0)
+        weights = np.maximum(weights, np.minimum(rising, falling))
+    return weights
+
+def splice(audio_path: Path, output_path: Path, replacements: list, fade: float):
+    """
+    Write the original with remixed spans swapped in.
+
+    `replacements` holds (offset seconds, (channels, frames) audio at
+    SPLICE_SR) per padded span from padded_span(). Crossfades cover `fade`
+    seconds around each span's inner boundaries; at the track's edges the
+    remix starts or ends without one.
+    """
+    import soundfile as sf
+
+    info = probe_audio(audio_path)
+    total = int(round(info["frames"] / info["sample_rate"] * SPLICE_SR))
+    fade_samples = int(round(fade * SPLICE_SR))
+    n_channels = max([info["channels"], *(audio.shape[0] for _, audio in replacements)])
+
+    bounds = []
+    for offset, audio in replacements:
+        start = int(round(offset * SPLICE_SR))
+        stop = start + audio.shape[-1]
+        full = start + fade_samples if start > 0 else start
+        fade_out = stop - fade_samples if stop < total - 1 else stop
+        bounds.append((start, full, fade_out, stop))
+
+    position = 0
+    with sf.SoundFile(str(output_path), "w", samplerate=SPLICE_SR, channels=n_channels) as f:
+        for block in stream_audio(audio_path, sr=SPLICE_SR):
+            if block.shape[0] < n_channels:
+                block = np.repeat(block, n_channels, axis=0)[:n_channels]
+            end = position + block.shape[-1]
+            theta = _weights(position, end, bounds) * (np.pi / 2)
+            out = block * np.cos(theta).astype(np.float32)
+
+            for (offset, audio), (_, _, _, stop) in zip(replacements, bounds):
+                start = int(round(offset * SPLICE_SR))
+                lo, hi = max(start, position), min(stop, end)
+                if lo >= hi:
+                    continue
+                remix = audio[..., lo - start:hi - start]
+                if remix.ndim == 1 or remix.shape[0] < n_channels:
+                    remix = np.broadcast_to(np.atleast_2d(remix)[:1], (n_channels, hi - lo))
+                out[:, lo - position:hi - position] += remix * np.sin(theta[lo - position:hi - position]).astype(np.float32)
+
+            f.write(out.T)
+            position = end
@@ -1,9 +1,11 @@
+import numpy as np
 import torch
-import torchaudio
 from demucs.pretrained import get_model
 from demucs.apply import apply_model
 from pathlib import Path
 from backend.config import settings
+from backend.pipeline.cancellation import NEVER_CANCELLED
+from backend.utils.audio import stream_audio
 
 class StemSeparator:
     def __init__(self):
@@ -11,20 +13,35 @@ class StemSeparator:
         self.model = get_model(settings.demucs_model)
         self.model.to(self.device)
         
-    def separate(self, audio_path: Path):
-        wav, sr = torchaudio.load(audio_path)
-        
-        if sr != self.model.samplerate:
-            wav = torchaudio.functional.resample(wav, sr, self.model.samplerate)
+    def separate(self, audio_path: Path, offset: float = 0.0, duration: float = None, shifts: int = None, overlap: float = None, cancel=None):
+        """
+        Separate a file (or the span starting at `offset` seconds) into stems.
+
+        `shifts` and `overlap` default to the full-quality settings; previews
+        pass lower values to trade quality for speed. The input is decoded
+        twice as a block stream rather than loaded whole: once for the
+        normalization statistics, then chunk by chunk into Demucs, checking
+        `cancel` between chunks.
+        """
+        shifts = settings.demucs_shifts if shifts is None else shifts
+        overlap = settings.demucs_overlap if overlap is None else overlap
+        cancel = cancel or NEVER_CANCELLED
         
-        wav = wav.to(self.device)
-        ref = wav.mean(0)
-        wav = (wav - ref.mean()) / ref.std()
+        def blocks():
+            return stream_audio(audio_path, sr=self.model.samplerate, offset=offset, duration=duration)
         
-        with torch.no_grad():
-            sources = apply_model(self.model, wav[None], device=self.device)[0]
+        # Demucs normalizes by the mean and std of the mono mix over the whole input
+        length, n_channels, total, total_sq = 0, 0, 0.0, 0.0
+        for block in blocks():
+            ref = block.mean(axis=0, dtype=np.float64)
+            length += len(ref)
+            n_channels = block.shape[0]
+            total += ref.sum()
+            total_sq += np.square(ref).sum()
+        mean = total / max(length, 1)
+        std = float(np.sqrt(max(total_sq - length * mean ** 2, 0.0) / max(length - 1, 1))) or 1.0
         
-        sources = sources * ref.std() + ref.mean()
+        sources = self._apply_chunked(blocks(), length, n_channels, mean, std, shifts, overlap, cancel)
         
         stem_names = ["drums", "bass", "other", "vocals"]
         stems = {}
@@ -34,3 +51,50 @@ class StemSeparator:
             
         return stems
 
+    def _read_chunks(self, blocks, length: int, chunk: int, fade: int):
+        """(start, end, (channels, frames) array) for chunks overlapping by `fade`, buffering only one chunk"""
+        blocks = iter(blocks)
+        buffer, buffer_start = None, 0
+        for start in range(0, length, chunk - fade):
+            end = min(start + chunk, length)
+            while buffer is None or buffer_start + buffer.shape[-1] < end:
+                block = next(blocks, None)
+                if block is None:
+                    break
+                buffer = block if buffer is None else np.concatenate([buffer, block], axis=-1)
+            
+            yield start, end, buffer[:, start - buffer_start:end - buffer_start]
+            if end == length:
+                return
+            
+            buffer = buffer[:, start + chunk - fade - buffer_start:]
+            buffer_start = start + chunk - fade
+
+    def _apply_chunked(self, blocks, length: int, n_channels: int, mean: float, std: float,
+                       shifts: int, overlap: float, cancel) -> torch.Tensor:
+        """Run Demucs over fixed-size chunks of a block stream, crossfading linearly where they overlap"""
+        chunk = int(settings.demucs_chunk_seconds * self.model.samplerate)
+        fade = int(settings.demucs_chunk_overlap_seconds * self.model.samplerate)
+        if length <= chunk:
+            chunk = length
+        
+        sources = torch.zeros(len(self.model.sources), n_channels, length, device=self.device)
+        weight = torch.zeros(length, device=self.device)
+        ramp = torch.linspace(0.0, 1.0, fade + 2, device=self.device)[1:-1]
+        
+        for start, end, audio in self._read_chunks(blocks, length, chunk, fade):
+            cancel.raise_if_cancelled()
+            wav = (torch.from_numpy(np.ascontiguousarray(audio)).to(self.device) - mean) / std
+            with torch.no_grad():
+                out = apply_model(self.model, wav[None], shifts=shifts, overlap=overlap, device=self.device)[0]
+            
+            window = torch.ones(end - start, device=self.device)
+            if start > 0:
+                window[:fade] = ramp[:end - start]
+            if end < length:
+                window[-fade:] = ramp.flip(0)
+            
+            sources[..., start:end] += out.to(self.device) * window
+            weight[start:end] += window
+        
+        return sources / weight * std + mean
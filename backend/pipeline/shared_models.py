@@ -0,0 +1,96 @@
+"""
+Model weights shared across Celery's prefork pool processes.
+
+By default every pool process loads its own Demucs and MusicGen, so model
+memory grows with the worker's concurrency. With worker_preload_models the
+worker's parent process builds the remix processor (and the default
+MusicGen variant in full mode) before the pool forks. Pool processes
+inherit the weights as copy-on-write pages. Inference never writes to
+parameters, so those pages stay shared by every process. gc.freeze() moves
+the parent's objects out of the collector's reach, so collections in the
+children don't dirty their pages either.
+
+Loading runs single-threaded and before any CUDA context exists, because
+neither OpenMP thread pools nor CUDA survive fork. GPU workers therefore
+keep loading models per process.
+"""
+import gc
+import os
+from pathlib import Path
+
+_parent_threads = None
+
+def preload(processor_class, mode: str):
+    """Build a processor in the worker's parent process, or return None where weights can't be shared"""
+    global _parent_threads
+    if mode == "mock":
+        return processor_class()
+
+    import torch
+    if torch.cuda.is_available():
+        print("Not preloading models: CUDA can't be shared across forked pool processes")
+        return None
+
+    # A parallel region here would start an OpenMP pool that forked children can't use
+    _parent_threads = torch.get_num_threads()
+    torch.set_num_threads(1)
+
+    processor = processor_class()
+    if mode == "full":
+        from backend.pipeline.model_registry import model_registry
+        model_registry.get()
+
+    gc.collect()
+    gc.freeze()
+    usage = memory_usage()
+    if usage:
+        print(f"✓ Models preloaded in worker parent ({usage['rss_mb']:.0f} MB resident, shared with pool processes)")
+    return processor
+
+def after_fork():
+    """Restore the thread count preload() lowered; call in each pool process"""
+    if _parent_threads is None:
+        return
+    import torch
+    from backend.config import settings
+    torch.set_num_threads(settings.torch_num_threads or _parent_threads)
+
+def memory_usage(pid="self") -> dict | None:
+    """
+    Resident, proportional and unique set size of a process in MB.
+
+    Shared pages count fully towards `rss_mb` and split among their sharers
+    in `pss_mb`. `uss_mb` is the memory freed if the process exited. Returns
+    None without /proc/<pid>/smaps_rollup (non-Linux).
+    """
+    try:
+        text = Path(f"/proc/{pid}/smaps_rollup").read_text()
+    except OSError:
+        return None
+
+    fields = {}
+    for line in text.splitlines()[1:]:
+        name, _, value = line.partition(":")
+        parts = value.split()
+        if parts and parts[-1] == "kB":
+            fields[name] = int(parts[0]) / 1024
+    return {
+        "rss_mb": fields.get("Rss", 0.0),
+        "pss_mb": fields.get("Pss", 0.0),
+        "uss_mb": fields.get("Private_Clean", 0.0) + fields.get("Private_Dirty", 0.0),
+        "shared_mb": fields.get("Shared_Clean", 0.0) + fields.get("Shared_Dirty", 0.0),
+    }
+
+def pool_memory(parent_pid: int = None) -> dict:
+    """memory_usage() of a worker's parent and each of its pool processes, by pid"""
+    parent_pid = parent_pid or os.getpid()
+    try:
+        children = Path(f"/proc/{parent_pid}/task/{parent_pid}/children").read_text().split()
+    except OSError:
+        children = []
+    report = {}
+    for pid in [parent_pid, *map(int, children)]:
+        usage = memory_usage(pid)
+        if usage:
+            report[pid] = usage
+    return report
@@ -0,0 +1,36 @@
+import numpy as np
+
+STEM_NAMES = ["vocals", "drums", "bass", "other"]
+
+def stem_gains(energy: float, brightness: float) -> dict:
+    """Per-stem gains: energy drives drums (and half as much bass), brightness drives 'other'"""
+    return {
+        "vocals": 0.3,
+        "drums": 0.25 * energy,
+        "bass": 0.25 * (1.0 + (energy - 1.0) * 0.5),
+        "other": 0.2 * brightness,
+    }
+
+def mix_stems(stems: dict, energy: float = 1.0, brightness: float = 1.0, block_size: int = 1 << 18) -> np.ndarray:
+    """
+    Weighted sum of separated stems.
+
+    Works block by block so memory-mapped stems are read once without
+    full-length temporaries. Shorter stems are treated as zero-padded.
+    """
+    gains = stem_gains(energy, brightness)
+    present = [name for name in STEM_NAMES if stems.get(name) is not None]
+    if not present:
+        return np.zeros((2, 44100), dtype=np.float32)
+
+    n_channels = max(stems[name].shape[0] for name in present)
+    length = max(stems[name].shape[-1] for name in present)
+    mix = np.zeros((n_channels, length), dtype=np.float32)
+
+    for name in present:
+        stem = stems[name]
+        for start in range(0, stem.shape[-1], block_size):
+            end = min(start + block_size, stem.shape[-1])
+            mix[:, start:end] += stem[:, start:end] * np.float32(gains[name])
+
+    return mix
@@ -0,0 +1,117 @@
+"""
+Memoized MusicGen text-encoder outputs.
+
+Prompts are built from a handful of style presets and tempo, key, energy
+and brightness phrases, so the same few thousand prompts repeat across jobs.
+CachedTextEncoder replaces a MusicGen model's T5 text encoder and returns
+stored hidden states for token sequences it has already encoded. Entries
+are keyed by model and token ids. Recent ones stay in memory (LRU), and
+all of them are persisted under cache_dir/text_encoder, so other worker
+processes and restarts skip the encoder too. MusicGen's generate() calls
+the text encoder through get_text_encoder(), so both the plain and the
+melody models pick the wrapper up without changes to the decoding loop.
+"""
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+import numpy as np
+import torch
+from transformers.modeling_outputs import BaseModelOutput
+from backend.config import settings
+
+class CachedTextEncoder(torch.nn.Module):
+    def __init__(self, encoder: torch.nn.Module, model_name: str, max_entries: int = None, persist: bool = None):
+        super().__init__()
+        self.encoder = encoder
+        self.model_slug = model_name.replace("/", "--")
+        self.max_entries = max_entries or settings.text_encoder_cache_entries
+        self.persist = settings.text_encoder_cache_persist if persist is None else persist
+        self.cache_dir = settings.cache_dir / "text_encoder"
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __getattr__(self, name):
+        # Model code reads attributes such as .config and .main_input_name off the text encoder
+        if name == "encoder":
+            return super().__getattr__(name)
+        try:
+            return super().__getattr__(name)
+        except AttributeError:
+            return getattr(self.encoder, name)
+
+    def forward(
+        self,
+        input_ids: torch.LongTensor = None,
+        attention_mask: torch.FloatTensor = None,
+        head_mask: torch.FloatTensor = None,
+        inputs_embeds: torch.FloatTensor = None,
+        output_attentions: bool = None,
+        output_hidden_states: bool = None,
+        return_dict: bool = None
+    ):
+        # Explicit parameters (no **kwargs) so generate() only passes what T5EncoderModel accepts
+        if input_ids is None or head_mask is not None or inputs_embeds is not None or output_attentions or output_hidden_states:
+            return self.encoder(
+                input_ids=input_ids,
+                attention_mask=attention_mask,
+                head_mask=head_mask,
+                inputs_embeds=inputs_embeds,
+                output_attentions=output_attentions,
+                output_hidden_states=output_hidden_states,
+                return_dict=return_dict
+            )
+
+        key = self._key(input_ids, attention_mask)
+        hidden = self._lookup(key)
+        if hidden is None:
+            self.misses += 1
+            hidden = self.encoder(input_ids=input_ids, attention_mask=attention_mask, return_dict=True).last_hidden_state
+            self._store(key, hidden)
+        else:
+            self.hits += 1
+            hidden = hidden.to(device=input_ids.device, dtype=next(self.encoder.parameters()).dtype)
+
+        if return_dict is False:
+            return (hidden,)
+        return BaseModelOutput(last_hidden_state=hidden)
+
+    def _key(self, input_ids: torch.Tensor, attention_mask: torch.Tensor = None) -> str:
+        digest = hashlib.sha1(str(tuple(input_ids.shape)).encode())
+        digest.update(input_ids.cpu().numpy().astype(np.int64).tobytes())
+        if attention_mask is not None:
+            digest.update(attention_mask.cpu().numpy().astype(np.int64).tobytes())
+        return f"{self.model_slug}-{digest.hexdigest()}"
+
+    def _lookup(self, key: str):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key]
+
+        path = self.cache_dir / f"{key}.npy"
+        if not self.persist or not path.exists():
+            return None
+        os.utime(path)
+        hidden = torch.from_numpy(np.load(path))
+        self._remember(key, hidden)
+        return hidden
+
+    def _store(self, key: str, hidden: torch.Tensor):
+        hidden = hidden.detach()
+        self._remember(key, hidden)
+        if self.persist:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.cache_dir / f"{key}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as f:
+                np.save(f, hidden.float().cpu().numpy())
+            tmp_path.replace(self.cache_dir / f"{key}.npy")
+
+    def _remember(self, key: str, hidden: torch.Tensor):
+        with self._lock:
+            self._entries[key] = hidden
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
@@ -1,6 +1,70 @@
 import numpy as np
 import librosa
 from typing import Optional
+from backend.config import settings
+
+VAD_FRAME_SECONDS = 0.04
+VAD_HOP_SECONDS = 0.02
+VAD_MAX_FLATNESS = 0.5
+VAD_MIN_ACTIVE_SECONDS = 0.1
+SEGMENT_FADE_SECONDS = 0.01
+
+def detect_vocal_activity(audio: np.ndarray, sr: int) -> np.ndarray:
+    """
+    Find the spans of a vocal stem that contain voice.
+    
+    A frame counts as active when its RMS is within
+    vocal_activity_threshold_db of the loudest frame (and above
+    vocal_activity_floor_db) and its spectrum isn't noise-flat, which
+    rejects separation hiss. Gaps shorter than
+    vocal_activity_min_gap_seconds are closed, very short bursts dropped,
+    and each span is padded by vocal_activity_padding_seconds.
+    
+    Args:
+        audio: Vocal audio, (samples,) or (channels, samples)
+        sr: Sample rate
+        
+    Returns:
+        (n_spans, 2) array of [start, end) sample indices, sorted and disjoint
+    """
+    mono = audio.mean(axis=0) if audio.ndim == 2 else audio
+    frame = int(VAD_FRAME_SECONDS * sr)
+    hop = int(VAD_HOP_SECONDS * sr)
+    if len(mono) < frame:
+        return np.zeros((0, 2), dtype=np.int64)
+    
+    frames = np.lib.stride_tricks.sliding_window_view(mono, frame)[::hop]
+    rms_db = 10 * np.log10(np.mean(frames ** 2, axis=-1) + 1e-12)
+    power = np.abs(np.fft.rfft(frames * np.hanning(frame).astype(np.float32), axis=-1)) ** 2 + 1e-12
+    flatness = np.exp(np.mean(np.log(power), axis=-1)) / np.mean(power, axis=-1)
+    
+    threshold = max(rms_db.max() + settings.vocal_activity_threshold_db, settings.vocal_activity_floor_db)
+    active = (rms_db > threshold) & (flatness < VAD_MAX_FLATNESS)
+    
+    # Runs of active frames as [start, end) frame indices
+    edges = np.diff(np.concatenate([[0], active.astype(np.int8), [0]]))
+    starts, ends = np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+    if len(starts) == 0:
+        return np.zeros((0, 2), dtype=np.int64)
+    
+    # Close short gaps, then drop what is still too short to be voice
+    gap = settings.vocal_activity_min_gap_seconds / VAD_HOP_SECONDS
+    keep = np.concatenate([[True], starts[1:] - ends[:-1] > gap])
+    starts, ends = starts[keep], np.concatenate([ends[np.flatnonzero(keep)[1:] - 1], ends[-1:]])
+    long_enough = ends - starts >= VAD_MIN_ACTIVE_SECONDS / VAD_HOP_SECONDS
+    starts, ends = starts[long_enough], ends[long_enough]
+    
+    pad = int(settings.vocal_activity_padding_seconds * sr)
+    spans = np.stack([starts * hop - pad, (ends - 1) * hop + frame + pad], axis=1).clip(0, len(mono))
+    
+    # Padding can make neighbours overlap
+    merged = []
+    for start, end in spans:
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return np.array(merged, dtype=np.int64).reshape(-1, 2)
 
 class VocalProcessor:
     """
@@ -18,7 +82,8 @@ class VocalProcessor:
         target_tempo: float,
         pitch_shift_semitones: float = 0.0,
         preserve_formants: bool = True,
-        sample_rate: int = 44100
+        sample_rate: int = 44100,
+        activity: np.ndarray = None
     ) -> np.ndarray:
         """
         Adjust vocals to match the target tempo and optionally shift pitch.
@@ -30,6 +95,7 @@ class VocalProcessor:
             pitch_shift_semitones: Pitch shift in semitones (e.g., 2.0 = up 2 semitones)
             preserve_formants: If True, keeps vocal character when pitch shifting
             sample_rate: Sample rate of the vocal audio
+            activity: Voiced spans from detect_vocal_activity (detected if None)
             
         Returns:
             Processed vocal audio
@@ -39,19 +105,25 @@ class VocalProcessor:
         # Calculate tempo change ratio
         tempo_ratio = target_tempo / original_tempo
         
+        # Both channels share one activity map, so their voiced spans stay aligned
+        if activity is None:
+            activity = detect_vocal_activity(vocals, sample_rate)
+        
         # If vocals are stereo, process each channel
         if len(vocals.shape) > 1 and vocals.shape[0] == 2:
             processed_left = self._process_mono_vocal(
                 vocals[0], 
                 tempo_ratio, 
                 pitch_shift_semitones,
-                preserve_formants
+                preserve_formants,
+                activity
             )
             processed_right = self._process_mono_vocal(
                 vocals[1], 
                 tempo_ratio, 
                 pitch_shift_semitones,
-                preserve_formants
+                preserve_formants,
+                activity
             )
             return np.stack([processed_left, processed_right])
         else:
@@ -62,7 +134,8 @@ class VocalProcessor:
                 vocals, 
                 tempo_ratio, 
                 pitch_shift_semitones,
-                preserve_formants
+                preserve_formants,
+                activity
             )
             return np.expand_dims(processed, axis=0)
     
@@ -71,16 +144,45 @@ class VocalProcessor:
         vocal: np.ndarray,
         tempo_ratio: float,
         pitch_shift_semitones: float,
-        preserve_formants: bool
+        preserve_formants: bool,
+        activity: np.ndarray = None
     ) -> np.ndarray:
         """
         Process a mono vocal track.
+        
+        With an activity map, only the voiced spans are stretched and
+        shifted, each placed where it lands after the stretch; everything
+        else is written as silence at the output length.
         """
-        # Step 1: Time stretch to match tempo
+        # Only stretch if significant difference
         # tempo_ratio < 1.0 = slow down
         # tempo_ratio > 1.0 = speed up
-        if abs(tempo_ratio - 1.0) > 0.05:  # Only stretch if significant difference
-            vocal = librosa.effects.time_stretch(vocal, rate=tempo_ratio)
+        rate = tempo_ratio if abs(tempo_ratio - 1.0) > 0.05 else 1.0
+        if activity is None:
+            return self._process_segment(vocal, rate, pitch_shift_semitones)
+        
+        # librosa's time_stretch output length
+        output = np.zeros(int(round(len(vocal) / rate)), dtype=np.float32)
+        fade = int(SEGMENT_FADE_SECONDS * self.sr)
+        for start, end in activity:
+            segment = self._process_segment(vocal[start:end], rate, pitch_shift_semitones)
+            
+            # Short fades hide the phase vocoder's edge effects inside the padding
+            n = min(fade, len(segment) // 2)
+            if n > 0:
+                ramp = (0.5 - 0.5 * np.cos(np.linspace(0, np.pi, n))).astype(np.float32)
+                segment[:n] *= ramp
+                segment[-n:] *= ramp[::-1]
+            
+            out_start = int(round(start / rate))
+            segment = segment[:len(output) - out_start]
+            output[out_start:out_start + len(segment)] += segment
+        return output
+    
+    def _process_segment(self, vocal: np.ndarray, rate: float, pitch_shift_semitones: float) -> np.ndarray:
+        # Step 1: Time stretch to match tempo
+        if rate != 1.0:
+            vocal = librosa.effects.time_stretch(vocal, rate=rate)
         
         # Step 2: Pitch shift if requested
         if abs(pitch_shift_semitones) > 0.1:
@@ -90,7 +192,7 @@ class VocalProcessor:
                 n_steps=pitch_shift_semitones
             )
         
-        return vocal
+        return np.asarray(vocal, dtype=np.float32)
     
     def estimate_optimal_pitch_shift(
         self,
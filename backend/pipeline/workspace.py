@@ -0,0 +1,68 @@
+import json
+import os
+import shutil
+import numpy as np
+from backend.config import settings
+
+class JobWorkspace:
+    """
+    Per-job checkpoint directory under cache_dir/jobs/{job_id}.
+
+    Each pipeline stage stores its output (JSON for dicts, .npy for arrays)
+    through checkpoint(), so a retried task loads finished stages instead of
+    recomputing them. Stages shared across jobs (analysis, stems) are also
+    content-cached by artifact_cache; the workspace only adds what is
+    specific to one job's parameters and seed.
+    """
+
+    def __init__(self, job_id: str = None):
+        self.job_id = job_id
+        self.root = settings.cache_dir / "jobs" / job_id if job_id else None
+
+    def checkpoint(self, stage: str, compute):
+        if self.root is None:
+            return compute()
+
+        cached = self.load(stage)
+        if cached is not None:
+            print(f"   Resuming from checkpoint: {stage}")
+            return cached
+
+        value = compute()
+        self.save(stage, value)
+        return value
+
+    def load(self, stage: str):
+        if self.root is None:
+            return None
+        for path in (self.root / f"{stage}.json", self.root / f"{stage}.npy"):
+            if path.exists():
+                os.utime(self.root)
+                if path.suffix == ".json":
+                    return json.loads(path.read_text())
+                return np.load(path)
+        return None
+
+    def save(self, stage: str, value):
+        if self.root is None:
+            return
+        self.root.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.root / f"{stage}.{os.getpid()}.tmp"
+        if isinstance(value, np.ndarray):
+            with open(tmp_path, "wb") as f:
+                np.save(f, value)
+            tmp_path.replace(self.root / f"{stage}.npy")
+        else:
+            tmp_path.write_text(json.dumps(value))
+            tmp_path.replace(self.root / f"{stage}.json")
+
+    def completed_stages(self) -> list:
+        if self.root is None or not self.root.exists():
+            return []
+        return sorted(path.stem for path in self.root.iterdir() if path.suffix in (".json", ".npy"))
+
+    def cleanup(self):
+        if self.root is not None:
+            shutil.rmtree(self.root, ignore_errors=True)
+
+NO_WORKSPACE = JobWorkspace()
@@ -0,0 +1,143 @@
+"""
+Dependency-free registry of style presets and system capabilities.
+
+Imported by the API process, so it must not pull in any ML libraries.
+"""
+from backend.config import settings
+
+STYLE_PRESETS = {
+    "lofi_chill": "lofi hip hop, chill beats, mellow jazz chords, vinyl crackle, relaxed atmosphere, smooth bass",
+    "synthwave": "synthwave 80s, retro synthesizers, neon aesthetic, electronic drums, nostalgic melodies, spacey pads",
+    "neo_soul": "neo soul, smooth rnb, warm electric piano, deep bass grooves, soulful atmosphere, jazz harmonies",
+    "acoustic": "acoustic guitar, organic instrumentation, natural sound, unplugged, intimate performance, folk elements",
+    "edm": "electronic dance music, festival banger, energetic drops, uplifting melodies, euphoric synths, big room sound",
+    "jazz": "jazz music, sophisticated harmonies, swing rhythm, improvisation, brass section, walking bass, bebop influences",
+    "rock": "rock music, electric guitars with distortion, powerful drums, energetic performance, anthemic sound, band arrangement",
+    "orchestral": "orchestral cinematic, epic strings, brass fanfares, dramatic percussion, sweeping melodies, film score atmosphere"
+}
+
+COMPACT_STYLE_PRESETS = {
+    "lofi_chill": "lofi hip hop, chill beats, mellow, relaxed, jazzy chords, vinyl crackle",
+    "synthwave": "synthwave, 80s synths, retro futuristic, neon, electronic, atmospheric",
+    "neo_soul": "neo soul, smooth, rnb, warm electric piano, deep bass, soulful",
+    "acoustic": "acoustic guitar, organic, natural, unplugged, intimate, singer songwriter",
+    "edm": "electronic dance music, energetic, uplifting, festival, big drops, euphoric",
+    "jazz": "jazz, sophisticated, swing, improvisational, brass section, walking bass",
+    "rock": "rock music, electric guitars, drums, energetic, powerful, anthemic",
+    "orchestral": "orchestral, cinematic, epic, strings, brass, dramatic, sweeping"
+}
+
+GENRE_CHARACTERISTICS = {
+    "lofi_chill": {
+        "tempo_range": (70, 90),
+        "energy": 0.4,
+        "complexity": "simple",
+        "description": "Laid-back hip-hop influenced beats with jazz elements"
+    },
+    "synthwave": {
+        "tempo_range": (100, 130),
+        "energy": 0.7,
+        "complexity": "medium",
+        "description": "80s-inspired electronic music with retro synthesizers"
+    },
+    "neo_soul": {
+        "tempo_range": (80, 100),
+        "energy": 0.6,
+        "complexity": "complex",
+        "description": "Contemporary R&B with jazz and soul influences"
+    },
+    "acoustic": {
+        "tempo_range": (80, 120),
+        "energy": 0.5,
+        "complexity": "simple",
+        "description": "Organic instruments, primarily guitar-based"
+    },
+    "edm": {
+        "tempo_range": (120, 140),
+        "energy": 0.9,
+        "complexity": "medium",
+        "description": "High-energy electronic dance music with big drops"
+    },
+    "jazz": {
+        "tempo_range": (100, 180),
+        "energy": 0.6,
+        "complexity": "complex",
+        "description": "Sophisticated harmonies with improvisation"
+    },
+    "rock": {
+        "tempo_range": (110, 150),
+        "energy": 0.8,
+        "complexity": "medium",
+        "description": "Electric guitar-driven energetic music"
+    },
+    "orchestral": {
+        "tempo_range": (60, 120),
+        "energy": 0.7,
+        "complexity": "complex",
+        "description": "Cinematic orchestral arrangements"
+    }
+}
+
+MODE_RANK = ["full", "hybrid", "mock"]
+
+def best_mode(modes) -> str:
+    """Most capable mode among the running workers ("offline" if none)"""
+    for mode in MODE_RANK:
+        if mode in modes:
+            return mode
+    return "offline"
+
+def describe_system(mode: str) -> dict:
+    idle_status = "offline" if mode == "offline" else "mock"
+    demucs_status = "active" if mode in ["full", "hybrid"] else idle_status
+    librosa_status = "active" if mode in ["full", "hybrid"] else idle_status
+    musicgen_status = "active (via Transformers)" if mode == "full" else "unavailable" if mode == "hybrid" else idle_status
+    
+    return {
+        "platform": "Neural Remix Engine (NRX)",
+        "version": "1.0.0",
+        "mode": mode,
+        "description": "Multi-model AI platform for intelligent music transformation",
+        "ai_subsystems": {
+            "input_processing": {
+                "model": "Demucs v4 (htdemucs)",
+                "purpose": "Source separation - isolates vocals, drums, bass, other",
+                "status": demucs_status
+            },
+            "analysis_engine": {
+                "model": "Librosa v0.11",
+                "purpose": "Musical analysis - tempo, key, chords, spectral features",
+                "status": librosa_status
+            },
+            "generation_engine": {
+                "model": f"MusicGen ({settings.musicgen_model})",
+                "purpose": "Audio-conditional generation - transforms style while preserving structure",
+                "status": musicgen_status
+            },
+            "post_processing": {
+                "model": "Custom mixing pipeline",
+                "purpose": "Stem blending, vocal preservation, normalization",
+                "status": "active"
+            },
+            "style_mapping": {
+                "model": "Rule-based presets (future: CLAP/MERT)",
+                "purpose": "Maps text descriptions to musical parameters",
+                "status": "active"
+            }
+        },
+        "models": {
+            "default": settings.musicgen_model,
+            "variants": settings.musicgen_variants,
+            "quality_tiers": settings.musicgen_quality_tiers,
+            "max_resident": settings.musicgen_max_resident
+        },
+        "capabilities": [
+            "Preserves original song identity",
+            "Transforms genre/style intelligently" if mode == "full" else "Adjusts stem levels intelligently",
+            "Maintains vocal characteristics",
+            "Adapts tempo and key awareness",
+            "Per-stem processing and mixing"
+        ],
+        "distinction": "NRX is a platform orchestrating multiple AI models, not a single model wrapper",
+        "note": "Running in FULL mode: All AI models active! MusicGen via Transformers (no xformers needed)" if mode == "full" else "Running in hybrid mode: Demucs + Librosa working. MusicGen unavailable" if mode == "hybrid" else "No remix workers are running" if mode == "offline" else None
+    }
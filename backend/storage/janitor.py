@@ -0,0 +1,187 @@
+"""
+Storage lifecycle manager for uploads, outputs and cache.
+
+A janitor sweep removes orphans (outputs and job checkpoints whose Redis
+job has expired, unreferenced upload blobs, stale partial writes) and then evicts the least
+recently used artifacts until each directory is under its byte quota.
+Upload blobs that a file_id still references and checkpoints of unfinished
+jobs are never evicted.
+Last access is tracked through mtime, which readers bump with
+touch_artifact(); output ownership is tracked in Redis.
+
+Sweeps run in a background thread of the worker's main process and take a
+Redis lock, so concurrent workers never sweep at the same time. Usage stats
+are published to Redis for /api/storage.
+
+Usage (one-off sweep):
+    python -m backend.storage.janitor
+"""
+import json
+import os
+import shutil
+import threading
+import time
+from pathlib import Path
+from backend.config import settings
+from backend.worker import redis_client
+from backend.storage.uploads import purge_blob, is_referenced
+
+OWNERS_KEY = "artifacts:owner"
+STATS_KEY = "storage:stats"
+LOCK_KEY = "storage:janitor"
+
+# Entries touched this recently may still be being written or read
+MIN_EVICTION_AGE = 60
+
+# Cache categories that are expensive to rebuild and never evicted
+PROTECTED_CACHE_CATEGORIES = {"musicgen"}
+
+TERMINAL_STATUSES = {"completed", "failed", "cancelled"}
+
+def track_artifact(path: Path, job_id: str):
+    """Record the job that owns an output artifact"""
+    redis_client.hset(OWNERS_KEY, str(path), job_id)
+
+def touch_artifact(path: Path):
+    """Mark an artifact as recently used"""
+    try:
+        os.utime(path)
+    except FileNotFoundError:
+        pass
+
+def _managed_dirs():
+    return {
+        "uploads": (settings.upload_dir, settings.upload_quota_bytes),
+        "outputs": (settings.output_dir, settings.output_quota_bytes),
+        "cache": (settings.cache_dir, settings.cache_quota_bytes),
+    }
+
+def _entry_size(path: Path) -> int:
+    if path.is_dir() and not path.is_symlink():
+        return sum(f.stat().st_size for f in path.rglob("*") if f.is_file())
+    return path.lstat().st_size
+
+def _list_entries(kind: str, root: Path):
+    """Eviction units: files for uploads/outputs, one level below each category for cache"""
+    if kind == "cache":
+        parents = [p for p in root.iterdir() if p.is_dir() and p.name not in PROTECTED_CACHE_CATEGORIES]
+    else:
+        parents = [root]
+
+    entries = []
+    for parent in parents:
+        for path in parent.iterdir():
+            try:
+                entries.append({"path": path, "size": _entry_size(path), "mtime": path.lstat().st_mtime})
+            except FileNotFoundError:
+                continue
+    return entries
+
+def _is_orphan(kind: str, path: Path) -> bool:
+    if ".tmp" in path.name or path.name.startswith(".incoming-"):
+        return True
+
+    if kind == "outputs":
+        owner = redis_client.hget(OWNERS_KEY, str(path))
+        return owner is None or not redis_client.exists(f"job:{owner}")
+
+    if kind == "cache" and path.parent.name == "jobs":
+        return not redis_client.exists(f"job:{path.name}")
+    
+    if kind == "uploads":
+        return _is_blob(path) and not is_referenced(path.name)
+
+    return False
+
+def _is_blob(path: Path) -> bool:
+    return len(path.stem) == 64 and all(c in "0123456789abcdef" for c in path.stem)
+
+def _is_pinned(kind: str, path: Path) -> bool:
+    """
+    Entries quota eviction must keep: upload blobs a file_id still points
+    at, and checkpoints of jobs that haven't finished (a retry resumes from
+    them, and a long stage doesn't touch them).
+    """
+    if kind == "uploads":
+        return _is_blob(path) and is_referenced(path.name)
+    if kind == "cache" and path.parent.name == "jobs":
+        status = redis_client.hget(f"job:{path.name}", "status")
+        return status is not None and status not in TERMINAL_STATUSES
+    return False
+
+def _remove(kind: str, path: Path):
+    if kind == "uploads":
+        purge_blob(path.name)
+    elif path.is_dir():
+        shutil.rmtree(path, ignore_errors=True)
+    else:
+        path.unlink(missing_ok=True)
+
+    if kind == "outputs":
+        redis_client.hdel(OWNERS_KEY, str(path))
+
+def sweep(kind: str, root: Path, quota: int, now: float = None) -> dict:
+    now = now or time.time()
+    entries = _list_entries(kind, root)
+    removed_orphans = 0
+    evicted = 0
+
+    live = []
+    for entry in entries:
+        if now - entry["mtime"] > settings.orphan_grace_seconds and _is_orphan(kind, entry["path"]):
+            _remove(kind, entry["path"])
+            removed_orphans += 1
+        else:
+            live.append(entry)
+
+    used = sum(entry["size"] for entry in live)
+    for entry in sorted(live, key=lambda e: e["mtime"]):
+        if used <= quota:
+            break
+        if now - entry["mtime"] < MIN_EVICTION_AGE or _is_pinned(kind, entry["path"]):
+            continue
+        _remove(kind, entry["path"])
+        used -= entry["size"]
+        evicted += 1
+
+    return {
+        "bytes_used": used,
+        "quota_bytes": quota,
+        "files": len(live) - evicted,
+        "orphans_removed": removed_orphans,
+        "evicted": evicted,
+        "updated_at": now
+    }
+
+def run_janitor():
+    """Run one sweep over all managed directories. Returns None if another sweep holds the lock."""
+    lock = redis_client.lock(LOCK_KEY, timeout=max(settings.janitor_interval_seconds, 60))
+    if not lock.acquire(blocking=False):
+        return None
+
+    try:
+        stats = {kind: sweep(kind, root, quota) for kind, (root, quota) in _managed_dirs().items()}
+        redis_client.set(STATS_KEY, json.dumps(stats))
+        return stats
+    finally:
+        lock.release()
+
+def get_usage_stats() -> dict:
+    data = redis_client.get(STATS_KEY)
+    return json.loads(data) if data else {}
+
+def start_janitor_thread(stop_event: threading.Event) -> threading.Thread:
+    def loop():
+        while not stop_event.is_set():
+            try:
+                run_janitor()
+            except Exception as e:
+                print(f"Storage janitor sweep failed: {e}")
+            stop_event.wait(settings.janitor_interval_seconds)
+
+    thread = threading.Thread(target=loop, name="storage-janitor", daemon=True)
+    thread.start()
+    return thread
+
+if __name__ == "__main__":
+    print(json.dumps(run_janitor(), indent=2))
@@ -0,0 +1,116 @@
+"""
+Content-addressed upload storage.
+
+Uploads are hashed while streaming to disk and stored once per content
+hash as `<sha256><ext>` under settings.upload_dir. Every upload still gets
+its own file_id; a reference-counted file_id -> blob index in Redis maps it
+to the shared blob. Because pipeline caches are keyed by the stored file's
+stem, re-uploads of the same song hit the separation and analysis caches.
+"""
+import hashlib
+import uuid
+from pathlib import Path
+from typing import BinaryIO, Optional
+from backend.config import settings
+from backend.worker import redis_client
+from backend.pipeline.fingerprint import fingerprint_index
+
+CHUNK_SIZE = 1024 * 1024
+
+FILE_BLOBS_KEY = "uploads:file_blob"
+BLOB_REFS_KEY = "uploads:blob_refs"
+
+class UploadTooLarge(Exception):
+    pass
+
+def _blob_lock(blob_name: str):
+    return redis_client.lock(f"uploads:lock:{blob_name}", timeout=30, blocking_timeout=10)
+
+def store_upload(fileobj: BinaryIO, ext: str):
+    """
+    Stream `fileobj` to disk while hashing it and register a new file_id.
+
+    Returns (file_id, blob_path, duplicate).
+    """
+    tmp_path = settings.upload_dir / f".incoming-{uuid.uuid4().hex}{ext}"
+    digest = hashlib.sha256()
+    size = 0
+
+    try:
+        with tmp_path.open("wb") as out:
+            while chunk := fileobj.read(CHUNK_SIZE):
+                size += len(chunk)
+                if size > settings.max_file_size:
+                    raise UploadTooLarge(f"File exceeds {settings.max_file_size} bytes")
+                digest.update(chunk)
+                out.write(chunk)
+
+        blob_name = f"{digest.hexdigest()}{ext}"
+        blob_path = settings.upload_dir / blob_name
+        file_id = str(uuid.uuid4())
+
+        with _blob_lock(blob_name):
+            duplicate = blob_path.exists()
+            if not duplicate:
+                tmp_path.replace(blob_path)
+
+            pipe = redis_client.pipeline()
+            pipe.hset(FILE_BLOBS_KEY, file_id, blob_name)
+            pipe.hincrby(BLOB_REFS_KEY, blob_name, 1)
+            pipe.execute()
+    finally:
+        tmp_path.unlink(missing_ok=True)
+
+    return file_id, blob_path, duplicate
+
+def resolve_upload(file_id: str) -> Optional[Path]:
+    blob_name = redis_client.hget(FILE_BLOBS_KEY, file_id)
+    if blob_name:
+        blob_path = settings.upload_dir / blob_name
+        return blob_path if blob_path.exists() else None
+
+    # Uploads stored before deduplication are named after their file_id
+    for ext in settings.allowed_formats:
+        candidate = settings.upload_dir / f"{file_id}{ext}"
+        if candidate.exists():
+            return candidate
+    return None
+
+def release_upload(file_id: str) -> bool:
+    """
+    Drop a file_id's reference to its blob, deleting the blob when unused.
+
+    Returns True if the blob was deleted.
+    """
+    blob_name = redis_client.hget(FILE_BLOBS_KEY, file_id)
+    if not blob_name:
+        return False
+
+    with _blob_lock(blob_name):
+        pipe = redis_client.pipeline()
+        pipe.hdel(FILE_BLOBS_KEY, file_id)
+        pipe.hincrby(BLOB_REFS_KEY, blob_name, -1)
+        _, refs = pipe.execute()
+
+        if refs > 0:
+            return False
+
+        redis_client.hdel(BLOB_REFS_KEY, blob_name)
+        (settings.upload_dir / blob_name).unlink(missing_ok=True)
+        fingerprint_index.forget(Path(blob_name).stem)
+        return True
+
+def purge_blob(blob_name: str):
+    """Forget a blob and every file_id pointing at it (used by storage eviction)"""
+    with _blob_lock(blob_name):
+        file_ids = [fid for fid, name in redis_client.hscan_iter(FILE_BLOBS_KEY) if name == blob_name]
+        pipe = redis_client.pipeline()
+        if file_ids:
+            pipe.hdel(FILE_BLOBS_KEY, *file_ids)
+        pipe.hdel(BLOB_REFS_KEY, blob_name)
+        pipe.execute()
+        (settings.upload_dir / blob_name).unlink(missing_ok=True)
+        fingerprint_index.forget(Path(blob_name).stem)
+
+def is_referenced(blob_name: str) -> bool:
+    return bool(redis_client.hexists(BLOB_REFS_KEY, blob_name))
@@ -1,55 +1,251 @@
-from celery import Celery
+import sqlite3
+import subprocess
+import threading
+import redis
+import soundfile
 from pathlib import Path
+from celery.signals import worker_init, worker_ready, worker_shutdown, worker_process_init
 from backend.config import settings
-from backend.worker import update_job_status
+from backend.celery_client import celery_app, REMIX_TASK, STRUCTURE_TASK
+from backend.worker import update_job_status, release_admission, finish_structure_analysis, is_cancel_requested, JobProgressReporter, publish_worker_mode, remove_worker_mode, WORKER_MODE_TTL
+from backend.pipeline.preview_cache import preview_output_path, save_preview
+from backend.pipeline.cancellation import CancelToken, JobCancelled
+from backend.pipeline.workspace import JobWorkspace
+from backend.pipeline.artifact_cache import artifact_cache
+from backend.pipeline.cost_model import cost_model, job_variant, StageTimer
+from backend.utils.audio import get_audio_info
+from backend.utils.encoding import encode_rendition
+from backend.storage.janitor import track_artifact, start_janitor_thread
+from backend.pipeline.loader import load_remix_processor
+from backend.pipeline import shared_models
+from backend.memory_governor import memory_governor, job_memory_mb, TaskMemory
 
-try:
-    from backend.pipeline.processor_full import RemixProcessor
-    USE_REAL_ML = "full"
-except ImportError:
-    try:
-        from backend.pipeline.processor_hybrid import HybridRemixProcessor as RemixProcessor
-        USE_REAL_ML = "hybrid"
-    except ImportError:
-        from backend.pipeline.mock_pipeline import MockRemixProcessor as RemixProcessor
-        USE_REAL_ML = "mock"
-
-celery_app = Celery(
-    "nrx",
-    broker=f"redis://{settings.redis_host}:{settings.redis_port}/0",
-    backend=f"redis://{settings.redis_host}:{settings.redis_port}/0"
-)
-
-@celery_app.task(bind=True)
-def process_remix_task(self, job_id: str, audio_path: str, style: str, energy: float, brightness: float):
+RemixProcessor, USE_REAL_ML = load_remix_processor()
+
+_worker_stop = threading.Event()
+
+# Errors a retry can get past: lost Redis connections, running out of
+# memory and cache I/O. Unreadable inputs, bad parameters and deterministic
+# model errors (shape or dtype mismatches) fail the same way every attempt.
+TRANSIENT_ERRORS = (redis.exceptions.ConnectionError, redis.exceptions.TimeoutError, MemoryError, OSError)
+# A corrupt or unsupported input raises LibsndfileError, a RuntimeError subclass
+PERMANENT_ERRORS = (soundfile.SoundFileError, FileNotFoundError, IsADirectoryError, NotADirectoryError, PermissionError)
+
+def is_out_of_memory(error: Exception) -> bool:
+    """torch.cuda.OutOfMemoryError, or the RuntimeError CPU allocators and older torch versions raise"""
+    return isinstance(error, RuntimeError) and (
+        type(error).__name__ == "OutOfMemoryError" or "out of memory" in str(error).lower()
+    )
+
+def is_transient(error: Exception) -> bool:
+    if isinstance(error, PERMANENT_ERRORS):
+        return False
+    return is_out_of_memory(error) or isinstance(error, TRANSIENT_ERRORS)
+
+if settings.worker_max_memory_per_child_mb:
+    # Checked by the pool between tasks against the process's peak RSS, which TaskMemory resets per task
+    celery_app.conf.worker_max_memory_per_child = settings.worker_max_memory_per_child_mb * 1024
+
+# One processor per process, so models are loaded once rather than per task
+_processor = None
+
+def get_processor():
+    global _processor
+    if _processor is None:
+        _processor = RemixProcessor()
+    return _processor
+
+@worker_init.connect
+def preload_models(**kwargs):
+    """With WORKER_PRELOAD_MODELS, load the models in the parent so pool processes share their weights"""
+    global _processor
+    if settings.worker_preload_models:
+        _processor = shared_models.preload(RemixProcessor, USE_REAL_ML)
+
+@worker_process_init.connect
+def restore_threads(**kwargs):
+    shared_models.after_fork()
+
+@worker_ready.connect
+def start_storage_janitor(sender=None, **kwargs):
+    start_janitor_thread(_worker_stop)
+
+@worker_ready.connect
+def announce_worker_mode(sender=None, **kwargs):
+    """Publish this worker's pipeline mode to Redis for /api/system, refreshed until shutdown"""
+    hostname = sender.hostname
+    
+    def refresh():
+        while not _worker_stop.is_set():
+            publish_worker_mode(hostname, USE_REAL_ML)
+            _worker_stop.wait(WORKER_MODE_TTL / 3)
+    
+    threading.Thread(target=refresh, daemon=True).start()
+
+@worker_process_init.connect
+def prewarm_generation(**kwargs):
+    """Load the default MusicGen variant in each pool process and pre-encode the preset prompts"""
+    if USE_REAL_ML != "full" or not settings.text_encoder_prewarm:
+        return
+    from backend.pipeline.processor_full import prewarm_text_encoder
+    threading.Thread(target=prewarm_text_encoder, daemon=True).start()
+
+@worker_shutdown.connect
+def withdraw_worker_mode(sender=None, **kwargs):
+    _worker_stop.set()
+    remove_worker_mode(sender.hostname)
+
+@celery_app.task(bind=True, name=REMIX_TASK, max_retries=settings.task_max_retries)
+def process_remix_task(
+    self,
+    job_id: str,
+    audio_path: str,
+    style: str,
+    energy: float,
+    brightness: float,
+    quality: str = None,
+    preview: bool = False,
+    seed: int = None,
+    preview_key: str = None,
+    output_format: str = None,
+    sections: list = None,
+    deferrals: int = 0
+):
+    result = None
+    cancel = CancelToken(lambda: is_cancel_requested(job_id))
+    workspace = JobWorkspace(job_id)
+    
     try:
-        update_job_status(job_id, "processing", 5, result={"stage": "Starting remix process"})
+        cancel.raise_if_cancelled()
         
-        processor = RemixProcessor()
+        progress = JobProgressReporter(job_id)
+        if self.request.retries:
+            progress.update(5, f"Retrying (attempt {self.request.retries + 1}), resuming after: {', '.join(workspace.completed_stages()) or 'nothing'}")
+        else:
+            progress.update(5, "Starting remix process")
         
-        update_job_status(job_id, "processing", 15, result={"stage": "Analyzing audio structure"})
-        
-        update_job_status(job_id, "processing", 30, result={"stage": "Separating audio stems (this takes a moment)"})
+        info = get_audio_info(Path(audio_path))
+        # A partial remix costs about as much as a track of the selected length
+        duration = sum(end - start for start, end in sections) if sections else info["duration"]
+        estimate = cost_model.predict(
+            USE_REAL_ML, job_variant(USE_REAL_ML, quality, preview), duration, info["sample_rate"], preview
+        )
+        need_mb = job_memory_mb(estimate, USE_REAL_ML, duration, preview)
+        reserved = memory_governor.reserve(job_id, need_mb)
+        if not reserved and deferrals < settings.worker_memory_max_deferrals:
+            # Requeued rather than retried, so error retries and their resume logic are unaffected
+            update_job_status(job_id, "queued", None, stage=f"Waiting for worker memory (~{need_mb:.0f} MB)")
+            self.signature_from_request(
+                kwargs={**self.request.kwargs, "deferrals": deferrals + 1},
+                countdown=settings.worker_memory_defer_seconds
+            ).apply_async()
+            return None
+        if not reserved:
+            print(f"Job {job_id} deferred {deferrals} times, running it without a memory reservation")
+        memory = TaskMemory(need_mb if reserved else None)
         
-        update_job_status(job_id, "processing", 55, result={"stage": "Generating remix with AI (this is the longest step)"})
+        timer = StageTimer(
+            estimate,
+            on_progress=lambda percent, stage, eta: progress.update(percent, stage, eta_seconds=eta)
+        )
         
-        result = processor.process(
+        result = get_processor().process(
             audio_path=Path(audio_path),
             style=style,
             energy=energy,
-            brightness=brightness
+            brightness=brightness,
+            quality=quality,
+            preview=preview,
+            seed=seed,
+            # Uploads are shared by content hash, so outputs are named by job
+            output_path=preview_output_path(preview_key) if preview_key else settings.output_dir / f"remix_{job_id}.wav",
+            cancel=cancel,
+            workspace=workspace,
+            timer=timer,
+            sections=sections
         )
         
-        update_job_status(job_id, "processing", 90, result={"stage": "Finalizing and mixing"})
+        cancel.raise_if_cancelled()
+        progress.update(90, "Finalizing and mixing", eta_seconds=0)
+        progress.flush()
+        
+        output_format = output_format or settings.output_format
+        if output_format != "wav":
+            try:
+                rendition = encode_rendition(Path(result["output_path"]), output_format)
+                result["renditions"] = {output_format: str(rendition)}
+                track_artifact(rendition, job_id)
+            except (subprocess.CalledProcessError, OSError) as e:
+                # The WAV is still a complete result
+                print(f"Encoding {output_format} for job {job_id} failed, keeping WAV only: {e}")
+        
+        track_artifact(Path(result["output_path"]), job_id)
         
         result["mode"] = USE_REAL_ML
+        result["memory"] = memory.report(timer.stages)
+        result["request"] = {
+            "audio_path": audio_path,
+            "style": style,
+            "energy": energy,
+            "brightness": brightness,
+            "quality": quality,
+            "sections": sections
+        }
+        
+        if preview_key:
+            save_preview(preview_key, result)
+        
+        # Resumed retries skip finished stages and would skew the model, as would
+        # section remixes, whose analysis covers the whole track
+        if not self.request.retries and not sections:
+            try:
+                cost_model.record(USE_REAL_ML, result.get("model_variant"), preview, info["sample_rate"], info["duration"], timer.stages)
+            except sqlite3.Error as e:
+                print(f"Could not record stage timings for job {job_id}: {e}")
         
-        update_job_status(job_id, "completed", 100, result=result)
+        update_job_status(job_id, "completed", 100, result=result, stage="Remix complete")
+        release_admission(job_id)
+        workspace.cleanup()
         
         return result
         
+    except JobCancelled:
+        print(f"Job {job_id} cancelled")
+        # A preview render lives in the shared preview cache, where another job may use it
+        if result and not preview_key:
+            Path(result["output_path"]).unlink(missing_ok=True)
+        update_job_status(job_id, "cancelled", None, stage="Cancelled")
+        release_admission(job_id)
+        workspace.cleanup()
+        return None
+        
     except Exception as e:
         error_msg = f"Error during remix: {str(e)}"
+        
+        if is_transient(e) and self.request.retries < self.max_retries:
+            countdown = settings.task_retry_backoff_seconds * 2 ** self.request.retries
+            print(f"Job {job_id} failed ({e}), retrying in {countdown:.0f}s")
+            update_job_status(job_id, "processing", None, stage=f"Retrying in {countdown:.0f}s after error: {e}")
+            raise self.retry(exc=e, countdown=countdown)
+        
+        # Checkpoints are left for inspection; the janitor removes them once the job expires
         update_job_status(job_id, "failed", 0, error=error_msg)
+        release_admission(job_id)
         raise
+    
+    finally:
+        memory_governor.release(job_id)
+
+@celery_app.task(name=STRUCTURE_TASK)
+def analyze_structure_task(audio_path: str):
+    """Analyze an upload for GET /structure; the analysis is cached and reused by its remixes"""
+    from backend.pipeline.analysis import MusicAnalyzer
 
+    audio_path = Path(audio_path)
+    try:
+        artifact_cache.get_analysis(audio_path, MusicAnalyzer())
+    except Exception as e:
+        print(f"Structure analysis of {audio_path.stem[:12]} failed: {e}")
+        finish_structure_analysis(audio_path.stem, error=str(e))
+        raise
+    finish_structure_analysis(audio_path.stem)
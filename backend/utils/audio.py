@@ -1,18 +1,128 @@
+import json
+import struct
+import subprocess
+import importlib.util
 import numpy as np
 from pathlib import Path
+from backend.utils.resample import StreamingResampler
 
+# librosa is imported lazily: this module is used by the API process, which
+# should not pay librosa's (numba) import cost just to probe an upload.
 try:
     import soundfile as sf
-    import librosa
-    AUDIO_LIBS_AVAILABLE = True
+    AUDIO_LIBS_AVAILABLE = importlib.util.find_spec("librosa") is not None
 except ImportError:
     AUDIO_LIBS_AVAILABLE = False
 
-def load_audio(path: Path, sr: int = 44100):
+BLOCK_FRAMES = 1 << 16
+
+def probe_audio(path: Path) -> dict:
+    """Sample rate, channels and frame count of a file, via libsndfile or ffprobe"""
+    try:
+        info = sf.info(str(path))
+        return {"sample_rate": info.samplerate, "channels": info.channels, "frames": info.frames}
+    except RuntimeError:
+        pass
+    
+    out = subprocess.run(
+        ["ffprobe", "-v", "error", "-select_streams", "a:0", "-show_entries", "stream=sample_rate,channels:format=duration",
+         "-of", "json", str(path)],
+        capture_output=True, check=True, text=True
+    ).stdout
+    probe = json.loads(out)
+    stream = probe["streams"][0]
+    sr = int(stream["sample_rate"])
+    return {"sample_rate": sr, "channels": int(stream["channels"]), "frames": int(float(probe["format"]["duration"]) * sr)}
+
+def _decode_blocks(path: Path, block_frames: int, offset: float, duration: float):
+    """Yield ((channels, frames) float32 block, sample_rate) at the file's native rate"""
+    try:
+        f = sf.SoundFile(str(path))
+    except RuntimeError:
+        f = None
+    
+    if f is not None:
+        with f:
+            f.seek(min(int(offset * f.samplerate), f.frames))
+            remaining = int(duration * f.samplerate) if duration is not None else None
+            while remaining is None or remaining > 0:
+                n = block_frames if remaining is None else min(block_frames, remaining)
+                block = f.read(n, dtype="float32", always_2d=True)
+                if len(block) == 0:
+                    return
+                if remaining is not None:
+                    remaining -= len(block)
+                yield block.T, f.samplerate
+        return
+    
+    # Containers libsndfile can't decode (e.g. m4a) are piped through ffmpeg as raw float32
+    info = probe_audio(path)
+    sr, channels = info["sample_rate"], info["channels"]
+    command = ["ffmpeg", "-v", "error", "-ss", str(offset), "-i", str(path)]
+    if duration is not None:
+        command += ["-t", str(duration)]
+    command += ["-f", "f32le", "-acodec", "pcm_f32le", "-"]
+    
+    frame_bytes = 4 * channels
+    proc = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    try:
+        while data := proc.stdout.read(block_frames * frame_bytes):
+            data = data[:len(data) - len(data) % frame_bytes]
+            yield np.frombuffer(data, dtype=np.float32).reshape(-1, channels).T, sr
+    finally:
+        proc.stdout.close()
+        proc.kill()
+        proc.wait()
+
+def stream_audio(path: Path, sr: int = None, mono: bool = False, block_frames: int = BLOCK_FRAMES,
+                 offset: float = 0.0, duration: float = None):
+    """
+    Decode a file block by block, resampling on the fly.
+    
+    Yields float32 (channels, block_frames) blocks, or (block_frames,) if
+    mono; only the last block is shorter. `sr` defaults to the native rate.
+    Memory stays proportional to `block_frames` whatever the file's length.
+    """
+    resampler = None
+    pending = []
+    pending_frames = 0
+    
+    def blocks():
+        nonlocal resampler
+        for block, native_sr in _decode_blocks(path, block_frames, offset, duration):
+            if mono:
+                block = block.mean(axis=0)
+            if resampler is None:
+                resampler = StreamingResampler(native_sr, sr or native_sr)
+            yield resampler.process(block)
+        tail = resampler.flush() if resampler is not None else None
+        if tail is not None and tail.shape[-1]:
+            yield tail
+    
+    # Resampling changes block lengths; re-slice to block_frames
+    for block in blocks():
+        pending.append(block)
+        pending_frames += block.shape[-1]
+        if pending_frames < block_frames:
+            continue
+        joined = np.concatenate(pending, axis=-1)
+        n_full = joined.shape[-1] // block_frames * block_frames
+        for start in range(0, n_full, block_frames):
+            yield joined[..., start:start + block_frames]
+        pending = [joined[..., n_full:]]
+        pending_frames = pending[0].shape[-1]
+    
+    if pending_frames:
+        yield np.concatenate(pending, axis=-1)
+
+def load_audio(path: Path, sr: int = 44100, mono: bool = False):
+    """Decode and convert with the shared resampler. Returns (channels, frames), or (frames,) if mono"""
     if not AUDIO_LIBS_AVAILABLE:
         return np.zeros((2, sr * 10))
-    audio, _ = librosa.load(path, sr=sr, mono=False)
-    return audio
+    blocks = list(stream_audio(path, sr=sr, mono=mono))
+    if not blocks:
+        return np.zeros(0 if mono else (1, 0), dtype=np.float32)
+    return np.concatenate(blocks, axis=-1)
 
 def save_audio(audio: np.ndarray, path: Path, sr: int = 44100):
     if not AUDIO_LIBS_AVAILABLE:
@@ -25,6 +135,30 @@ def normalize_audio(audio: np.ndarray, target_db: float = -14.0):
     gain = 10 ** ((target_db - current_db) / 20)
     return audio * gain
 
+def wav_header(n_channels: int, n_frames: int, sr: int) -> bytes:
+    """Header of a 16-bit PCM WAV file with a known frame count"""
+    data_size = n_frames * n_channels * 2
+    return (
+        b"RIFF" + struct.pack("<I", 36 + data_size) + b"WAVE"
+        + b"fmt " + struct.pack("<IHHIIHH", 16, 1, n_channels, sr, sr * n_channels * 2, n_channels * 2, 16)
+        + b"data" + struct.pack("<I", data_size)
+    )
+
+def pcm16_bytes(block: np.ndarray) -> bytes:
+    """Interleaved 16-bit PCM for a (channels, frames) block"""
+    return (np.clip(block, -1.0, 1.0).T * 32767).astype("<i2").tobytes()
+
+def iter_wav_bytes(audio: np.ndarray, sr: int = 44100, block_frames: int = 1 << 16):
+    """Yield a 16-bit PCM WAV file (header, then interleaved blocks) for streaming responses"""
+    if audio.ndim == 1:
+        audio = np.expand_dims(audio, 0)
+    n_channels, n_frames = audio.shape
+    
+    yield wav_header(n_channels, n_frames, sr)
+    
+    for start in range(0, n_frames, block_frames):
+        yield pcm16_bytes(audio[:, start:start + block_frames])
+
 def get_audio_info(path: Path):
     if not AUDIO_LIBS_AVAILABLE:
         return {
@@ -32,11 +166,9 @@ def get_audio_info(path: Path):
             "sample_rate": 44100,
             "channels": 2
         }
-    audio, sr = librosa.load(path, sr=None)
-    duration = librosa.get_duration(y=audio, sr=sr)
+    info = probe_audio(path)
     return {
-        "duration": duration,
-        "sample_rate": sr,
-        "channels": audio.shape[0] if audio.ndim > 1 else 1
+        "duration": info["frames"] / info["sample_rate"],
+        "sample_rate": info["sample_rate"],
+        "channels": info["channels"]
     }
-
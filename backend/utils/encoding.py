@@ -0,0 +1,75 @@
+import subprocess
+import uuid
+from pathlib import Path
+from typing import Optional
+
+OUTPUT_FORMATS = {
+    "wav": {"extension": ".wav", "media_type": "audio/wav", "codec_args": []},
+    "flac": {"extension": ".flac", "media_type": "audio/flac", "codec_args": ["-c:a", "flac"]},
+    "opus": {"extension": ".opus", "media_type": "audio/ogg", "codec_args": ["-c:a", "libopus", "-b:a", "128k", "-ar", "48000"]},
+    "mp3": {"extension": ".mp3", "media_type": "audio/mpeg", "codec_args": ["-c:a", "libmp3lame", "-q:a", "2"]},
+}
+
+MEDIA_TYPE_ALIASES = {
+    "audio/wav": "wav",
+    "audio/x-wav": "wav",
+    "audio/wave": "wav",
+    "audio/flac": "flac",
+    "audio/x-flac": "flac",
+    "audio/ogg": "opus",
+    "audio/opus": "opus",
+    "audio/mpeg": "mp3",
+    "audio/mp3": "mp3",
+}
+
+def negotiate_format(requested: Optional[str], accept: Optional[str], default: str = "wav",
+                     available: Optional[list] = None) -> Optional[str]:
+    """
+    Pick an output format from an explicit request or an Accept header.
+
+    The Accept header only chooses among `available` formats (any if None),
+    so a browser's preferences can't trigger an encode. Returns None if
+    `requested` names an unknown format.
+    """
+    if requested:
+        requested = requested.lower()
+        return requested if requested in OUTPUT_FORMATS else None
+
+    if not accept:
+        return default
+
+    candidates = []
+    for position, item in enumerate(accept.split(",")):
+        parts = [p.strip() for p in item.split(";")]
+        media_type = parts[0].lower()
+        quality = 1.0
+        for param in parts[1:]:
+            if param.startswith("q="):
+                try:
+                    quality = float(param[2:])
+                except ValueError:
+                    quality = 0.0
+        if media_type in MEDIA_TYPE_ALIASES and quality > 0 and (available is None or MEDIA_TYPE_ALIASES[media_type] in available):
+            candidates.append((-quality, position, MEDIA_TYPE_ALIASES[media_type]))
+
+    return min(candidates)[2] if candidates else default
+
+def rendition_path(wav_path: Path, fmt: str) -> Path:
+    return wav_path.with_suffix(OUTPUT_FORMATS[fmt]["extension"])
+
+def encode_rendition(wav_path: Path, fmt: str) -> Path:
+    """
+    Encode `wav_path` to `fmt` with ffmpeg, cached next to the WAV.
+    """
+    target = rendition_path(wav_path, fmt)
+    if fmt == "wav" or (target.exists() and target.stat().st_mtime >= wav_path.stat().st_mtime):
+        return target
+
+    tmp_path = target.with_name(f"{target.stem}.{uuid.uuid4().hex[:8]}.tmp{target.suffix}")
+    subprocess.run(
+        ["ffmpeg", "-y", "-loglevel", "error", "-i", str(wav_path), *OUTPUT_FORMATS[fmt]["codec_args"], str(tmp_path)],
+        check=True,
+        capture_output=True
+    )
+    tmp_path.replace(target)
+    return target
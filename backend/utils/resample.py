@@ -0,0 +1,126 @@
+"""
+Shared sample-rate conversion.
+
+Every rate change in the pipeline goes through resample(): a polyphase FIR
+resampler (scipy's upfirdn via resample_poly) with Kaiser-windowed
+kernels designed once per (rate pair, quality) and cached. Multichannel
+audio is converted along the last axis in one vectorized call.
+
+Resampler adds per-job memoization, so converting the same buffer to the
+same rate twice returns the first result. StreamingResampler converts
+audio block by block with the same output as one resample() call.
+"""
+import weakref
+from functools import lru_cache
+from math import gcd
+import numpy as np
+from backend.config import settings
+
+# Taps per side of each polyphase branch, Kaiser beta, cutoff relative to the lower Nyquist
+QUALITY_PRESETS = {
+    "fast": (8, 5.0, 0.90),
+    "default": (16, 8.6, 0.94),
+    "high": (32, 12.0, 0.97),
+}
+
+@lru_cache(maxsize=32)
+def polyphase_kernel(up: int, down: int, quality: str) -> np.ndarray:
+    from scipy.signal import firwin
+    half_taps, beta, rolloff = QUALITY_PRESETS[quality]
+    max_rate = max(up, down)
+    kernel = firwin(2 * half_taps * max_rate + 1, rolloff / max_rate, window=("kaiser", beta))
+    return kernel.astype(np.float32)
+
+def resample(audio: np.ndarray, orig_sr: int, target_sr: int, quality: str = None) -> np.ndarray:
+    """Resample along the last axis; returns float32"""
+    if orig_sr == target_sr:
+        return audio
+    from scipy.signal import resample_poly
+
+    quality = quality or settings.resample_quality
+    g = gcd(int(orig_sr), int(target_sr))
+    up, down = int(target_sr) // g, int(orig_sr) // g
+    out = resample_poly(
+        np.asarray(audio, dtype=np.float32),
+        up,
+        down,
+        axis=-1,
+        window=polyphase_kernel(up, down, quality)
+    )
+    return out.astype(np.float32, copy=False)
+
+class Resampler:
+    """Per-job resampler that memoizes conversions of the same buffer"""
+
+    def __init__(self, quality: str = None):
+        self.quality = quality or settings.resample_quality
+        self._memo = {}
+
+    def __call__(self, audio: np.ndarray, orig_sr: int, target_sr: int) -> np.ndarray:
+        key = (id(audio), orig_sr, target_sr)
+        entry = self._memo.get(key)
+        if entry is not None and entry[0]() is audio:
+            return entry[1]
+
+        out = resample(audio, orig_sr, target_sr, self.quality)
+        self._memo[key] = (weakref.ref(audio), out)
+        return out
+
+class StreamingResampler:
+    """
+    Block-wise resample() for decoded streams.
+    
+    Each output sample depends on the input within the kernel's reach on
+    either side. process() converts everything it has enough input for,
+    using resample() over the pending input plus that much context, and
+    flush() converts the rest as if the signal ended there. The context
+    starts on a multiple of `down` input samples so output samples line up
+    with a whole-signal conversion.
+    """
+    
+    def __init__(self, orig_sr: int, target_sr: int, quality: str = None):
+        self.orig_sr = int(orig_sr)
+        self.target_sr = int(target_sr)
+        self.quality = quality or settings.resample_quality
+        g = gcd(self.orig_sr, self.target_sr)
+        self.up, self.down = self.target_sr // g, self.orig_sr // g
+        
+        # Input samples on either side an output sample depends on, in whole `down` steps
+        reach = QUALITY_PRESETS[self.quality][0] * max(self.up, self.down) // self.up + 2
+        self.context = -(-reach // self.down) * self.down
+        
+        self._buffer = None
+        self._start = 0  # input index of _buffer[..., 0], a multiple of `down`
+        self._received = 0
+        self._emitted = 0
+    
+    def process(self, block: np.ndarray) -> np.ndarray:
+        """Resampled output for as much of the input so far as is final"""
+        if self.orig_sr == self.target_sr:
+            return block
+        block = np.asarray(block, dtype=np.float32)
+        self._buffer = block if self._buffer is None else np.concatenate([self._buffer, block], axis=-1)
+        self._received += block.shape[-1]
+        return self._emit(max(self._received - self.context, 0) * self.up // self.down)
+    
+    def flush(self) -> np.ndarray:
+        """Output for the rest of the input"""
+        if self.orig_sr == self.target_sr or self._buffer is None:
+            return np.zeros(0, dtype=np.float32)
+        return self._emit(-(-self._received * self.up // self.down), final=True)
+    
+    def _emit(self, end: int, final: bool = False) -> np.ndarray:
+        if end <= self._emitted:
+            return self._buffer[..., :0]
+        
+        segment = self._buffer if final else self._buffer[..., :min(end * self.down // self.up + self.context, self._received) - self._start]
+        out = resample(segment, self.orig_sr, self.target_sr, self.quality)
+        first = self._start * self.up // self.down
+        out = out[..., self._emitted - first:end - first]
+        self._emitted = end
+        
+        # Keep the context the next output sample needs
+        keep_from = max(self._emitted * self.down // self.up - self.context, 0) // self.down * self.down
+        self._buffer = self._buffer[..., keep_from - self._start:]
+        self._start = keep_from
+        return out
@@ -1,29 +1,141 @@
 import redis
 import json
+import time
 from backend.config import settings
 from backend.api.models import JobStatus
+from backend.registry import best_mode
 
-redis_client = redis.Redis(
+JOB_TTL = 3600
+ADMISSION_KEY = "admission:outstanding"
+# Long enough for a worker to analyze a long track; a lost task is requeued once it expires
+STRUCTURE_PENDING_TTL = 900
+STRUCTURE_FAILED_TTL = 300
+
+redis_pool = redis.ConnectionPool(
     host=settings.redis_host,
     port=settings.redis_port,
-    decode_responses=True
+    decode_responses=True,
+    max_connections=settings.redis_max_connections
 )
 
-def update_job_status(job_id: str, status: str, progress: int, result: dict = None, error: str = None):
-    job_data = {
-        "job_id": job_id,
-        "status": status,
-        "progress": progress,
-        "result": result,
-        "error": error
-    }
-    redis_client.setex(f"job:{job_id}", 3600, json.dumps(job_data))
+redis_client = redis.Redis(connection_pool=redis_pool)
 
-def get_job_status(job_id: str) -> JobStatus | None:
-    data = redis_client.get(f"job:{job_id}")
+def job_key(job_id: str) -> str:
+    return f"job:{job_id}"
+
+def cancel_key(job_id: str) -> str:
+    return f"cancel:{job_id}"
+
+def structure_key(input_key: str) -> str:
+    """State ("pending" or "failed: <error>") of an upload's in-flight structure analysis"""
+    return f"structure:{input_key}"
+
+def encode_job_fields(status: str = None, progress: int = None, stage: str = None, result: dict = None, error: str = None,
+                      estimate: dict = None, eta_seconds: float = None) -> dict:
+    """Hash fields for a partial job update; only the given values are written"""
+    fields = {"updated_at": time.time()}
+    if status is not None:
+        fields["status"] = status
+    if progress is not None:
+        fields["progress"] = progress
+    if stage is not None:
+        fields["stage"] = stage
+    if result is not None:
+        fields["result"] = json.dumps(result)
+    if error is not None:
+        fields["error"] = error
+    if estimate is not None:
+        fields["estimated_seconds"] = round(estimate["seconds"], 1)
+        if estimate["peak_mb"] is not None:
+            fields["estimated_peak_mb"] = round(estimate["peak_mb"])
+        if eta_seconds is None:
+            eta_seconds = estimate["seconds"]
+    if eta_seconds is not None:
+        fields["eta_seconds"] = round(eta_seconds)
+    return fields
+
+def _optional_float(value: str = None) -> float | None:
+    return float(value) if value not in (None, "") else None
+
+def decode_job(job_id: str, data: dict) -> JobStatus | None:
     if not data:
         return None
-    
-    job_data = json.loads(data)
-    return JobStatus(**job_data)
+    return JobStatus(
+        job_id=job_id,
+        status=data.get("status", "queued"),
+        progress=int(data.get("progress", 0)),
+        stage=data.get("stage"),
+        result=json.loads(data["result"]) if data.get("result") else None,
+        error=data.get("error"),
+        estimated_seconds=_optional_float(data.get("estimated_seconds")),
+        estimated_peak_mb=_optional_float(data.get("estimated_peak_mb")),
+        eta_seconds=_optional_float(data.get("eta_seconds"))
+    )
+
+def update_job_status(job_id: str, status: str, progress: int, result: dict = None, error: str = None, stage: str = None):
+    pipe = redis_client.pipeline(transaction=False)
+    pipe.hset(job_key(job_id), mapping=encode_job_fields(status, progress, stage, result, error))
+    pipe.expire(job_key(job_id), JOB_TTL)
+    pipe.execute()
+
+def get_job_status(job_id: str) -> JobStatus | None:
+    return decode_job(job_id, redis_client.hgetall(job_key(job_id)))
+
+def get_job_statuses(job_ids: list[str]) -> dict:
+    pipe = redis_client.pipeline(transaction=False)
+    for job_id in job_ids:
+        pipe.hgetall(job_key(job_id))
+    return {job_id: decode_job(job_id, data) for job_id, data in zip(job_ids, pipe.execute())}
+
+def is_cancel_requested(job_id: str) -> bool:
+    return bool(redis_client.exists(cancel_key(job_id)))
+
+def finish_structure_analysis(input_key: str, error: str = None):
+    """Clear an upload's in-flight analysis, or keep its failure for a while so polls don't requeue it"""
+    if error is None:
+        redis_client.delete(structure_key(input_key))
+    else:
+        redis_client.setex(structure_key(input_key), STRUCTURE_FAILED_TTL, f"failed: {error}")
+
+def release_admission(job_id: str):
+    """Return a finished job's reserved capacity to the admission budget"""
+    redis_client.hdel(ADMISSION_KEY, job_id)
+
+class JobProgressReporter:
+    """
+    Buffers progress/stage updates for one job and writes them to Redis in
+    pipelined batches at most every `flush_interval` seconds.
+    """
+
+    def __init__(self, job_id: str, flush_interval: float = 1.0):
+        self.job_id = job_id
+        self.flush_interval = flush_interval
+        self._pending = {}
+        self._last_flush = 0.0
+
+    def update(self, progress: int = None, stage: str = None, status: str = "processing", eta_seconds: float = None):
+        self._pending.update(encode_job_fields(status=status, progress=progress, stage=stage, eta_seconds=eta_seconds))
+        if time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        if not self._pending:
+            return
+        pipe = redis_client.pipeline(transaction=False)
+        pipe.hset(job_key(self.job_id), mapping=self._pending)
+        pipe.expire(job_key(self.job_id), JOB_TTL)
+        pipe.execute()
+        self._pending = {}
+        self._last_flush = time.monotonic()
+
+WORKER_MODE_TTL = 90
+
+def publish_worker_mode(hostname: str, mode: str):
+    redis_client.setex(f"worker:{hostname}:mode", WORKER_MODE_TTL, mode)
+
+def remove_worker_mode(hostname: str):
+    redis_client.delete(f"worker:{hostname}:mode")
 
+def get_worker_mode() -> str:
+    modes = [redis_client.get(key) for key in redis_client.scan_iter("worker:*:mode")]
+    return best_mode(modes)
@@ -10,6 +10,14 @@ import './App.css';
 
 const API_BASE = 'http://localhost:8000/api';
 
+const describeError = (err) => {
+  if (err.response?.status === 429) {
+    const retryAfter = err.response.headers['retry-after'];
+    return `${err.response.data.detail}. Please try again in ${retryAfter || 'a few'} seconds.`;
+  }
+  return err.response?.data?.detail || err.message;
+};
+
 function App() {
   const [fileId, setFileId] = useState(null);
   const [fileName, setFileName] = useState('');
@@ -41,7 +49,7 @@ function App() {
         if (res.data.status === 'completed') {
           setOutputUrl(`${API_BASE}/download/${jobId}`);
           clearInterval(interval);
-        } else if (res.data.status === 'failed') {
+        } else if (res.data.status === 'failed' || res.data.status === 'cancelled') {
           clearInterval(interval);
         }
       } catch (err) {
@@ -52,7 +60,34 @@ function App() {
     return () => clearInterval(interval);
   }, [jobId]);
 
+  const isBusy = status?.status === 'queued' || status?.status === 'processing';
+
+  useEffect(() => {
+    if (!jobId || !isBusy) return;
+
+    // Stop server-side work for a remix nobody will download
+    const cancelOnLeave = () => {
+      fetch(`${API_BASE}/remix/${jobId}`, { method: 'DELETE', keepalive: true });
+    };
+
+    window.addEventListener('beforeunload', cancelOnLeave);
+    return () => window.removeEventListener('beforeunload', cancelOnLeave);
+  }, [jobId, isBusy]);
+
+  const cancelActiveJob = async () => {
+    if (!jobId || !isBusy) return;
+
+    try {
+      const res = await axios.delete(`${API_BASE}/remix/${jobId}`);
+      setStatus(res.data);
+    } catch (err) {
+      console.error('Cancel failed:', err);
+    }
+  };
+
   const handleUpload = async (file) => {
+    await cancelActiveJob();
+
     const formData = new FormData();
     formData.append('file', file);
 
@@ -65,7 +100,7 @@ function App() {
     }
   };
 
-  const handleRemix = async () => {
+  const handleRemix = async (preview = false) => {
     if (!fileId || !selectedStyle) return;
 
     try {
@@ -73,13 +108,27 @@ function App() {
         file_id: fileId,
         style: selectedStyle,
         energy,
-        brightness
+        brightness,
+        preview
       });
       setJobId(res.data.job_id);
       setStatus(res.data);
       setOutputUrl(null);
     } catch (err) {
-      alert('Remix failed: ' + err.message);
+      alert('Remix failed: ' + describeError(err));
+    }
+  };
+
+  const handlePromote = async () => {
+    if (!jobId) return;
+
+    try {
+      const res = await axios.post(`${API_BASE}/remix/${jobId}/promote`);
+      setJobId(res.data.job_id);
+      setStatus(res.data);
+      setOutputUrl(null);
+    } catch (err) {
+      alert('Full render failed: ' + describeError(err));
     }
   };
 
@@ -110,19 +159,39 @@ function App() {
               onBrightnessChange={setBrightness}
             />
 
+            <button
+              className="remix-button preview"
+              onClick={() => handleRemix(true)}
+              disabled={!selectedStyle || isBusy}
+            >
+              Quick Preview
+            </button>
+
             <button
               className="remix-button"
-              onClick={handleRemix}
-              disabled={!selectedStyle || status?.status === 'processing'}
+              onClick={() => handleRemix(false)}
+              disabled={!selectedStyle || isBusy}
             >
-              {status?.status === 'processing' ? 'Processing...' : 'Generate Remix'}
+              {isBusy ? 'Processing...' : 'Generate Remix'}
             </button>
           </>
         )}
 
         {status && <StatusDisplay status={status} />}
 
+        {isBusy && (
+          <button className="remix-button cancel" onClick={cancelActiveJob}>
+            Cancel
+          </button>
+        )}
+
         {outputUrl && <AudioPlayer url={outputUrl} />}
+
+        {status?.status === 'completed' && status.result?.preview && (
+          <button className="remix-button" onClick={handlePromote}>
+            Render Full Quality
+          </button>
+        )}
       </div>
     </div>
   );
@@ -1,14 +1,26 @@
 import React from 'react';
 import './StatusDisplay.css';
 
+function formatSeconds(seconds) {
+  if (seconds < 60) {
+    return `${Math.max(Math.round(seconds), 1)}s`;
+  }
+  return `${Math.round(seconds / 60)} min`;
+}
+
 function StatusDisplay({ status }) {
+  const isActive = status.status === 'queued' || status.status === 'processing';
+
   const getStageMessage = () => {
-    if (status.result && status.result.stage) {
-      return status.result.stage;
+    if (isActive && status.stage) {
+      return status.stage;
     }
     if (status.status === 'processing') {
       return 'Processing your remix...';
     }
+    if (status.status === 'cancelled') {
+      return 'Remix cancelled.';
+    }
     if (status.status === 'completed') {
       const mode = status.result?.mode;
       if (mode === 'real') {
@@ -25,8 +37,11 @@ function StatusDisplay({ status }) {
     <div className={`status-display ${status.status}`}>
       <div className="status-header">
         <span className="status-label">{status.status}</span>
-        {status.status === 'processing' && (
-          <span className="status-progress">{status.progress}%</span>
+        {isActive && (
+          <span className="status-progress">
+            {status.progress}%
+            {status.eta_seconds != null && ` · about ${formatSeconds(status.eta_seconds)} left`}
+          </span>
         )}
       </div>
       
@@ -34,7 +49,7 @@ function StatusDisplay({ status }) {
         <div className="status-message">{getStageMessage()}</div>
       )}
       
-      {status.status === 'processing' && (
+      {isActive && (
         <div className="progress-bar">
           <div className="progress-fill" style={{ width: `${status.progress}%` }} />
         </div>